@@ -0,0 +1,99 @@
+"""
+Benchmark of the GPS glitch filter (Dataset.filter_x_and_y) on synthetic
+tracks with pathological dropout and glitch patterns.
+
+Usage: python benchmarks/bench_filter.py [number of traces]
+"""
+import sys
+import timeit
+
+import numpy as np
+
+from sdi.binary import Dataset, _fill_nans_with_last
+
+
+def track(n, seed=0):
+    """Returns the x and y arrays of a straight survey line of n traces, with
+    the GPS position only updating every few traces
+    """
+    rng = np.random.RandomState(seed)
+    steps = np.repeat(rng.rand(n // 4 + 1), 4)[:n]
+    x = 500000 + np.cumsum(steps)
+    y = 3300000 + np.cumsum(steps) / 2
+    return x, y
+
+
+def long_dropout(n):
+    """The receiver is stuck on a single bad fix for a fifth of the line"""
+    x, y = track(n)
+    x[2 * n // 5:3 * n // 5] = x[2 * n // 5] + 1e6
+    y[2 * n // 5:3 * n // 5] = y[2 * n // 5] - 1e6
+    return x, y
+
+
+def many_glitches(n):
+    """Glitches of decreasing size, each only detectable once the larger
+    ones have been removed
+    """
+    x, y = track(n)
+    for i, position in enumerate(range(n // 10, n, n // 40)):
+        x[position] += 1e7 / 2 ** i
+    return x, y
+
+
+def clustered_glitches(n):
+    """Bursts of glitches in both coordinates at once"""
+    x, y = track(n)
+    rng = np.random.RandomState(1)
+    for position in rng.randint(0, n - 100, 20):
+        x[position:position + 100] += rng.uniform(1e4, 1e6)
+        y[position:position + 100] -= rng.uniform(1e4, 1e6)
+    return x, y
+
+
+def nan_run(n):
+    """A long run of NaNs for _fill_nans_with_last"""
+    x, y = track(n)
+    x[10:n - 10] = np.nan
+    return x
+
+
+PATTERNS = [
+    ('long_dropout', long_dropout),
+    ('many_glitches', many_glitches),
+    ('clustered_glitches', clustered_glitches),
+]
+
+
+def bench(func, repeat=3):
+    """Returns the best time of `repeat` calls to func, in seconds, or None if
+    it raises an exception
+    """
+    try:
+        return min(timeit.repeat(func, number=1, repeat=repeat))
+    except Exception:
+        return None
+
+
+def main(n=100000):
+    dataset = Dataset(None)
+    results = []
+    for name, pattern in PATTERNS:
+        x, y = pattern(n)
+        results.append(
+            ('filter_x_and_y ' + name,
+             bench(lambda: dataset.filter_x_and_y(x, y))))
+
+    arr = nan_run(n)
+    results.append(
+        ('_fill_nans_with_last nan_run', bench(lambda: _fill_nans_with_last(arr))))
+
+    for name, seconds in results:
+        if seconds is None:
+            print '%-40s failed' % name
+        else:
+            print '%-40s %10.4f s' % (name, seconds)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,306 @@
+"""
+Benchmark of each stage of the read pipeline (reading the file, decoding the
+header, decoding the intensities, _normalize_samples, _fill_nans,
+_normalize_scale of padded and of ragged intensities, process_raw_trace,
+filter_x_and_y, _interpolate_repeats and assemble_frequencies), on synthetic
+bin files of several versions and bss files of several sizes written with
+sdi.writer. parse() pads and normalizes the samples in one pass with
+_normalize_samples (for padded and ragged intensities alike), which is what
+the intensity_decode stage runs. _fill_nans and _normalize_scale are no
+longer on the parse path, but remain in sdi.binary for the code that calls
+them directly, so they are timed too.
+
+Each stage is timed (best of --repeat runs) and its peak memory is measured
+in a separate process: the peak resident set size of the process while the
+stage runs, less its resident set size before. The peak left behind by
+parsing the input of the stage is reset beforehand, which needs Linux 4.0 or
+later; elsewhere the increase of the process' peak resident set size is
+reported instead, which misses the stages that use less memory than the
+parse. The results are saved as JSON along with the commit
+and the versions of Python and numpy, and a previous results file can be
+compared against with --compare.
+
+Usage: python benchmarks/bench_pipeline.py [--sizes 1000,10000]
+           [--formats 3.3,4.0,4.2,4.3,bss] [--repeat 3]
+           [--output results.json] [--compare previous.json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+import numpy as np
+
+from sdi import writer
+from sdi.binary import Dataset, _bin_structs, _bss_structs, _fill_nans, \
+    _interpolate_repeats, _normalize_samples, _sample_views
+from sdi.ragged import RaggedArray
+
+FORMATS = ['3.3', '4.0', '4.2', '4.3', 'bss']
+
+STAGES = [
+    'file_read',
+    'header_decode',
+    'intensity_decode',
+    'normalize_samples',
+    'fill_nans',
+    'normalize_scale',
+    'normalize_scale_ragged',
+    'process_raw_trace',
+    'filter_x_and_y',
+    'interpolate_repeats',
+    'assemble_frequencies',
+]
+
+
+def make_input(directory, file_format, n):
+    """Write a synthetic file of n traces of the given format (a bin version
+    or 'bss') and return its path
+    """
+    if file_format == 'bss':
+        filepath = os.path.join(directory, '09112303_%d.bss' % n)
+        writer.write_bss(filepath, writer.synthetic_traces(n, file_format='bss'))
+    else:
+        filepath = os.path.join(
+            directory, '09112303_%s_%d.bin' % (file_format.replace('.', ''), n))
+        writer.write_bin(
+            filepath, writer.synthetic_traces(n, version=file_format),
+            version=file_format)
+    return filepath
+
+
+def prepare(filepath, file_format):
+    """Parse the file once and return a dict with the inputs of each stage"""
+    dataset = Dataset(filepath)
+    dataset.parse(file_format=file_format, lazy=True)
+    data, data_starts, lengths, sample_fmt = dataset._intensity_source
+    image = np.empty((len(lengths), lengths.max()), dtype=dataset.intensity_dtype)
+    # touch the image, so that its pages are resident before the stage runs
+    image.fill(0)
+    intensities = _sample_views(data, data_starts, lengths, sample_fmt)
+    if file_format == 'bin':
+        pre_structs, event_struct, post_structs = _bin_structs(dataset.version)
+        all_structs = pre_structs + event_struct + post_structs
+        raw_x = dataset.raw_trace['easting']
+        raw_y = dataset.raw_trace['northing']
+    else:
+        all_structs = _bss_structs()
+        raw_x = dataset.raw_trace['x']
+        raw_y = dataset.raw_trace['y']
+    return {
+        'dataset': dataset,
+        'all_structs': all_structs,
+        'normalization': dataset._normalization(
+            dataset.trace_metadata['transducer']),
+        'image': image,
+        'intensities': intensities,
+        'padded': _fill_nans(intensities),
+        'ragged': RaggedArray.from_rows(intensities),
+        'raw_x': np.asarray(raw_x, dtype=np.float64),
+        'raw_y': np.asarray(raw_y, dtype=np.float64),
+    }
+
+
+def stage_function(stage, filepath, file_format, inputs):
+    """Returns a function that runs one stage of the pipeline"""
+    dataset = inputs['dataset']
+
+    def file_read():
+        with open(filepath, 'rb') as f:
+            f.read()
+
+    def header_decode():
+        Dataset(filepath)._open(file_format)
+
+    def intensity_decode():
+        dataset._decode_intensity()
+
+    def normalize_samples():
+        shift, divisor, bipolar = inputs['normalization']
+        _normalize_samples(
+            *dataset._intensity_source + (shift, divisor, None, inputs['image']))
+
+    def fill_nans():
+        _fill_nans(inputs['intensities'])
+
+    def normalize_scale():
+        dataset._normalize_scale(inputs['padded'])
+
+    def normalize_scale_ragged():
+        dataset._normalize_scale(inputs['ragged'])
+
+    def process_raw_trace():
+        # compute all of the lazily derived fields
+        dict(dataset.process_raw_trace(
+            dataset.raw_trace, inputs['all_structs'], file_format=file_format))
+
+    def filter_x_and_y():
+        dataset.filter_x_and_y(inputs['raw_x'], inputs['raw_y'])
+
+    def interpolate_repeats():
+        _interpolate_repeats(inputs['raw_x'])
+
+    def assemble_frequencies():
+        for freq_dict in dataset.assemble_frequencies():
+            dict(freq_dict)
+
+    return locals()[stage]
+
+
+def run_stage(filepath, file_format, stage, repeat):
+    """Returns a tuple of (seconds, peak memory in MB) of one stage: its best
+    time of `repeat` runs, and how far the resident set size of the process
+    peaked above its size before the first run. Must run in a fresh process.
+    """
+    inputs = prepare(filepath, file_format)
+    func = stage_function(stage, filepath, file_format, inputs)
+    if _reset_peak_rss():
+        before = _proc_status_kb('VmRSS')
+        func()
+        after = _proc_status_kb('VmHWM')
+    else:
+        # ru_maxrss is in kilobytes on Linux
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        func()
+        after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    seconds = min(timeit.repeat(func, number=1, repeat=repeat))
+    return seconds, max(after - before, 0) / 1024.
+
+
+def _reset_peak_rss():
+    """Reset the peak resident set size of the process to its current
+    resident set size. Returns False if the system doesn't support it.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except (IOError, OSError):
+        return False
+    return True
+
+
+def _proc_status_kb(field):
+    """Returns a memory field (e.g. VmRSS) of /proc/self/status in kB"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    raise KeyError(field)
+
+
+def _run_stage_job(job):
+    return run_stage(*job)
+
+
+def benchmark(sizes, formats, repeat=3):
+    """Returns a list of result dicts, one per input and stage"""
+    directory = tempfile.mkdtemp()
+    results = []
+    try:
+        for file_format in formats:
+            for n in sizes:
+                filepath = make_input(directory, file_format, n)
+                parse_format = 'bss' if file_format == 'bss' else 'bin'
+                for stage in STAGES:
+                    # one process per stage, so peak memory isn't carried
+                    # over from one stage to the next
+                    pool = multiprocessing.Pool(1)
+                    try:
+                        seconds, memory = pool.apply(
+                            _run_stage_job,
+                            ((filepath, parse_format, stage, repeat),))
+                    finally:
+                        pool.terminate()
+                        pool.join()
+                    results.append({
+                        'format': file_format,
+                        'traces': n,
+                        'file_size': os.path.getsize(filepath),
+                        'stage': stage,
+                        'seconds': seconds,
+                        'peak_memory_mb': memory,
+                    })
+                    print_result(results[-1])
+                os.remove(filepath)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def environment():
+    """Returns a dict describing where the benchmark was run"""
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+    }
+
+
+def print_result(result):
+    print '%-5s %8d %-22s %10.4f s %9.1f MB' % (
+        result['format'], result['traces'], result['stage'],
+        result['seconds'], result['peak_memory_mb'])
+
+
+def compare(previous, results):
+    """Print the time and memory of each result relative to the matching
+    result of a previous run
+    """
+    previous = dict(
+        ((r['format'], r['traces'], r['stage']), r) for r in previous)
+    print '%-5s %8s %-22s %10s %10s' % (
+        'fmt', 'traces', 'stage', 'time', 'memory')
+    for result in results:
+        key = (result['format'], result['traces'], result['stage'])
+        if key not in previous:
+            continue
+        old = previous[key]
+        print '%-5s %8d %-22s %9.2fx %+8.1f MB' % (
+            key + (result['seconds'] / max(old['seconds'], 1e-9),
+                   result['peak_memory_mb'] - old['peak_memory_mb']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', default='1000,10000',
+                        help='comma separated numbers of traces')
+    parser.add_argument('--formats', default=','.join(FORMATS),
+                        help='comma separated bin versions and/or bss')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='JSON file to save the results to')
+    parser.add_argument('--compare', help='JSON file of a previous run')
+    args = parser.parse_args(argv)
+
+    results = benchmark(
+        [int(size) for size in args.sizes.split(',')],
+        args.formats.split(','), repeat=args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(
+                {'environment': environment(), 'results': results}, f,
+                indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f)['results'], results)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
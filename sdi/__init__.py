@@ -1,3 +1,10 @@
 from . import binary
+from . import cache
+from . import catalog
 from . import corestick
+from . import index
 from . import pickfile
+from . import ragged
+from . import stats
+from . import udp
+from . import writer
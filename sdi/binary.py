@@ -1,33 +1,185 @@
-from datetime import datetime, date
+import collections
+from datetime import datetime, date, time, timedelta
 import itertools
+import mmap
+import multiprocessing
+import multiprocessing.pool
+import shutil
 import struct
-from StringIO import StringIO
+import sys
+import tempfile
+import time as timer
 import warnings
 
 import numpy as np
 
+try:
+    import resource
+except ImportError:
+    resource = None
 
-def read(filepath, separate=True, file_format='bin'):
+from . import cache as dataset_cache
+from . import index as sidecar
+from . import stats as parse_stats
+from .ragged import RaggedArray
+from .stats import ParseCancelled
+
+
+def read(filepath, separate=True, file_format='bin', decode='struct',
+         lazy=False, cache=None, workers=None, processes=False, ragged=False,
+         intensity_dtype='float64', fields=None, grouped=False, stats=None,
+         progress=None, max_memory=None, spill_dir=None):
     dataset = Dataset(filepath)
-    return dataset.as_dict(separate=separate, file_format=file_format)
+    return dataset.as_dict(
+        separate=separate, file_format=file_format, decode=decode, lazy=lazy,
+        cache=cache, workers=workers, processes=processes, ragged=ragged,
+        intensity_dtype=intensity_dtype, fields=fields, grouped=grouped,
+        stats=stats, progress=progress, max_memory=max_memory,
+        spill_dir=spill_dir)
+
+
+def read_many(paths, workers=None, separate=True, file_format='bin',
+              decode='struct', cache=None, intensity_dtype='float64',
+              fields=None):
+    """Generator that reads many files in parallel in a pool of `workers`
+    processes (by default, one per CPU). Yields a tuple of (filepath, data,
+    error) for each file as soon as it has been read, so files are not
+    necessarily yielded in the order of `paths`. data is the dict returned by
+    read(), or None if reading the file raised an exception, in which case
+    error is that exception (and None otherwise), so one bad file doesn't stop
+    the others from being read.
+
+    Worker processes store the parsed datasets in a dataset cache, and the
+    arrays are memory mapped from there instead of being pickled back to this
+    process. If `cache` (a directory path or an sdi.cache.DatasetCache) is
+    given, that cache is used and kept, otherwise a temporary (and unbounded)
+    cache is used. Files are only ever parsed by the workers: if the entry of
+    a file is evicted from a bounded cache before this process loads it, the
+    error of that file is a LookupError.
+    """
+    if cache is None:
+        cache = dataset_cache.DatasetCache(tempfile.mkdtemp(), max_size=None)
+        temporary = True
+    else:
+        if not isinstance(cache, dataset_cache.DatasetCache):
+            cache = dataset_cache.DatasetCache(cache)
+        temporary = False
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        jobs = [
+            (filepath, file_format, decode, intensity_dtype, fields,
+             cache.directory, cache.max_size)
+            for filepath in paths
+        ]
+        for filepath, entry, error in pool.imap_unordered(_read_into_cache, jobs):
+            if error is not None:
+                yield filepath, None, error
+                continue
+
+            # load exactly what the worker stored, with the cache key options
+            # parse() would use
+            dataset = Dataset(filepath)
+            dataset.intensity_dtype = np.dtype(intensity_dtype)
+            if fields is not None:
+                dataset.fields = sorted(set(fields))
+            if not cache.load(dataset, file_format):
+                yield filepath, None, LookupError(
+                    "The cache entry of %s was evicted before it could be "
+                    "loaded" % filepath)
+                continue
+            dataset.intensities = None
+            if temporary:
+                # the arrays stay valid, they are memory mapped
+                shutil.rmtree(entry, ignore_errors=True)
+            yield filepath, dataset.as_dict(
+                separate=separate, file_format=file_format), None
+    finally:
+        pool.terminate()
+        pool.join()
+        if temporary:
+            shutil.rmtree(cache.directory, ignore_errors=True)
+
+
+def _read_into_cache(job):
+    """Parse a file in a read_many() worker process and store it in the
+    cache. Returns a tuple of (filepath, cache entry path, error).
+    """
+    (filepath, file_format, decode, intensity_dtype, fields, cache_directory,
+     max_size) = job
+    try:
+        dataset = Dataset(filepath)
+        dataset.parse(
+            file_format=file_format, decode=decode,
+            intensity_dtype=intensity_dtype, fields=fields)
+        cache = dataset_cache.DatasetCache(cache_directory, max_size=max_size)
+        return filepath, cache.store(dataset, file_format), None
+    except Exception as e:
+        return filepath, None, e
 
 
 class Dataset(object):
+    # version of the parsed output, bump this whenever it changes so that
+    # stale entries in dataset caches are not reused
+    PARSER_VERSION = 1
+
     def __init__(self, filepath):
         self.filepath = filepath
         self.parsed = False
-
-    def as_dict(self, separate=True, file_format='bin'):
+        self._intensity_image = None
+        self._intensity_source = None
+        self._record_index = None
+        self._ragged = False
+        self.intensity_dtype = np.dtype(np.float64)
+        self.fields = None
+        self.interleaved_index = None
+        self._follow = None
+        self.stats = None
+        self._progress = None
+        self.max_memory = None
+        self.spill_dir = None
+        self.memory_report = None
+        self._resident_bytes = 0
+        self._spilled_bytes = 0
+        self._peak_bytes = 0
+
+    @property
+    def intensity_image(self):
+        """Normalized intensities of all traces. If the file was parsed with
+        lazy=True, the intensities are decoded the first time this is
+        accessed.
+        """
+        if self._intensity_image is None and self._intensity_source is not None:
+            self._intensity_image = self._decode_intensity()
+        return self._intensity_image
+
+    @intensity_image.setter
+    def intensity_image(self, value):
+        self._intensity_image = value
+
+    def as_dict(self, separate=True, file_format='bin', decode='struct',
+                lazy=False, cache=None, workers=None, processes=False,
+                ragged=False, intensity_dtype='float64', fields=None,
+                grouped=False, stats=None, progress=None, max_memory=None,
+                spill_dir=None):
         """Returns the SDI data as a dict. Data is collected and stored in the
         binary file as a sequence of traces, cycling between sampling
         frequencies. Each vertical column of intensity data is a trace and has
         various other readings stored along with it. If the `separate` keyword
         is True (default), then the data for each frequency will be split into
         distinct frequencies which will be a list of frequency dicts in the
-        mapped to the 'frequencies' key. If `separate` is False, then data
-        will be interleaved in the same way that it is collected and stored in
-        the binary file format. The keys are as follows (note that not all
-        fields will be available, depending on binary file version number):
+        mapped to the 'frequencies' key. If `separate` is False, then data will
+        be interleaved in the same way that it is collected and stored in the
+        binary file format. The `decode`, `lazy`, `cache`, `workers`,
+        `processes`, `ragged`, `intensity_dtype`, `fields`, `grouped`, `stats`,
+        `progress`, `max_memory` and `spill_dir` keywords select how the file
+        is parsed if it has not been parsed yet, see parse(). If the file was
+        parsed with `fields`, only those fields (and 'transducer' and 'kHz')
+        are returned. If it was parsed with `grouped`, the traces are grouped
+        by frequency even if `separate` is False, and the 'interleaved_index'
+        key holds the index array that puts them back in the order they were
+        recorded. The keys are as follows (note that not all fields will be
+        available, depending on binary file version number):
 
         File-wide information:
             'date':
@@ -217,7 +369,12 @@ class Dataset(object):
                 Bipolar bit in Options. Only available in versions >= '4.0'
         """
         if not self.parsed:
-            self.parse(file_format=file_format)
+            self.parse(
+                file_format=file_format, decode=decode, lazy=lazy, cache=cache,
+                workers=workers, processes=processes, ragged=ragged,
+                intensity_dtype=intensity_dtype, fields=fields,
+                grouped=grouped, stats=stats, progress=progress,
+                max_memory=max_memory, spill_dir=spill_dir)
 
         d = {
             'date': self.date,
@@ -230,27 +387,48 @@ class Dataset(object):
             d.update({
                 'start_datetime': self.start_datetime,
                 'end_datetime': self.end_datetime,
-                'depth_r1': self.trace_metadata.pop('depth_r1') + self.trace_metadata['draft']
             })
+            if 'depth_r1' in self.trace_metadata:
+                d['depth_r1'] = self.trace_metadata['depth_r1'] + self.trace_metadata['draft']
 
         if separate:
             d['frequencies'] = self.frequencies
         else:
-            d['intensity'] = self.intensity_image
-            for key, array in self.trace_metadata.iteritems():
-                d[key] = array
+            if self._has_intensity():
+                d['intensity'] = self.intensity_image
+            for key in self._output_keys():
+                d.setdefault(key, self.trace_metadata[key])
+            if self.interleaved_index is not None:
+                d['interleaved_index'] = self.interleaved_index
         return d
 
     def assemble_frequencies(self):
         """build clean dicts containing frequency metadata and intensity images
         for all available frequencies
+
+        If the traces have been grouped by frequency (see parse()), the
+        frequency dicts hold views of consecutive rows of the trace fields and
+        intensity image instead of copies.
         """
         frequencies = []
 
-        transducers = np.unique(self.trace_metadata['transducer'])
-        for transducer in transducers:
-            freq_dict = {}
-            freq_mask = np.where(self.trace_metadata['transducer'] == transducer)
+        lazy_metadata = isinstance(self.trace_metadata, _LazyDict)
+        transducers, first_rows = np.unique(
+            self.trace_metadata['transducer'], return_index=True)
+        last_rows = np.append(first_rows[1:], len(self.trace_metadata['transducer']))
+        for transducer, first_row, last_row in zip(
+                transducers, first_rows, last_rows):
+            if self._intensity_image is None or lazy_metadata:
+                freq_dict = _LazyDict()
+            else:
+                freq_dict = {}
+            if self.interleaved_index is not None:
+                freq_mask = slice(first_row, last_row)
+                rows = freq_mask
+            else:
+                freq_mask = np.where(
+                    self.trace_metadata['transducer'] == transducer)
+                rows = freq_mask[0]
 
             unique_kHzs = np.unique(self.trace_metadata['kHz'][freq_mask])
             if len(unique_kHzs) > 1:
@@ -262,15 +440,77 @@ class Dataset(object):
             else:
                 khz = unique_kHzs[0]
 
-            for key, array in self.trace_metadata.iteritems():
-                freq_dict[key] = array[freq_mask]
-
-            freq_dict['intensity'] = self.intensity_image[freq_mask]
+            for key in self._output_keys():
+                if lazy_metadata and self.trace_metadata.is_lazy(key):
+                    freq_dict.set_lazy(
+                        key, _select_rows, self.trace_metadata, key, freq_mask)
+                else:
+                    freq_dict[key] = self.trace_metadata[key][freq_mask]
+
+            if self._intensity_image is not None and self._follow is None:
+                freq_dict['intensity'] = self._image_rows(rows)
+            elif self._has_intensity():
+                freq_dict.set_lazy(
+                    'intensity', self._frequency_intensity, rows)
             freq_dict['kHz'] = khz
             frequencies.append(freq_dict)
 
         return sorted(frequencies, key=lambda d: d['kHz'])
 
+    def _group_traces(self):
+        """Reorder the traces so that the traces of each frequency are
+        consecutive, using a stable sort so that each frequency keeps its
+        recorded order, and set interleaved_index to the inverse permutation.
+        Trace fields that haven't been computed yet are computed in recorded
+        order (the GPS filtering needs the whole track) and reordered when
+        first accessed.
+        """
+        order = np.argsort(self.trace_metadata['transducer'], kind='mergesort')
+        interleaved_index = np.empty_like(order)
+        interleaved_index[order] = np.arange(len(order))
+
+        if isinstance(self.trace_metadata, _LazyDict):
+            grouped_metadata = _LazyDict()
+            for key in self.trace_metadata:
+                if self.trace_metadata.is_lazy(key):
+                    grouped_metadata.set_lazy(
+                        key, _select_rows, self.trace_metadata, key, order)
+                else:
+                    grouped_metadata[key] = self.trace_metadata[key][order]
+        else:
+            grouped_metadata = dict(
+                (key, array[order])
+                for key, array in self.trace_metadata.iteritems())
+
+        if self._intensity_source is not None:
+            data, data_starts, lengths, sample_fmt = self._intensity_source
+            self._intensity_source = (
+                data, data_starts[order], lengths[order], sample_fmt)
+        if self._intensity_image is not None:
+            self._intensity_image = self._image_rows(order)
+
+        self.trace_metadata = grouped_metadata
+        self.interleaved_index = interleaved_index
+
+    def _output_keys(self):
+        """Returns the trace fields that are returned by as_dict() and in
+        the frequency dicts: all of them, or the ones selected with the
+        `fields` keyword of parse()
+        """
+        if self.fields is None:
+            return list(self.trace_metadata)
+        return [
+            key for key in self.trace_metadata
+            if key in self.fields or key in ('transducer', 'kHz')
+        ]
+
+    def _has_intensity(self):
+        """Returns True if intensities are available, either decoded or
+        waiting to be decoded
+        """
+        return (self._intensity_image is not None or
+                self._intensity_source is not None)
+
     def convert_to_meters_array(self, units):
         """Given an array of unit integers, returns an array of conversion
         factors suitable for converting another array to meters. This is used
@@ -301,55 +541,916 @@ class Dataset(object):
 
         return convert_to_meters
 
-    def filter_x_and_y(self, original_x, original_y):
+    def filter_x_and_y(self, original_x, original_y, max_passes=None):
         """Given an array of raw x and y values return a version
         where impossibly noisey values (GPS glitches) have been removed.
+
+        Each pass flags the positions whose (deduplicated) value is more than
+        a few standard deviations from the median, and replaces every
+        occurrence of the flagged values with the last good value. Outliers
+        can be so extreme that they hide smaller ones, so passes are repeated
+        until no outliers remain, or until `max_passes` passes have been made
+        if it is given.
         """
-        _, x_dedup_idx = _deduplicate(original_x)
-        _, y_dedup_idx = _deduplicate(original_y)
+        with self._stage('filter'):
+            good_x = original_x.copy()
+            good_y = original_y.copy()
+
+            passes = 0
+            while max_passes is None or passes < max_passes:
+                passes += 1
+                x, y, out_mask = _gps_outliers(good_x, good_y)
+                if not np.any(out_mask):
+                    break
+
+                nan_mask = (np.in1d(good_x, x[out_mask]) |
+                            np.in1d(good_y, y[out_mask]))
+                good_x[nan_mask] = np.nan
+                good_y[nan_mask] = np.nan
+
+                good_x = _fill_nans_with_last(good_x)
+                good_y = _fill_nans_with_last(good_y)
+
+        if self.stats is not None:
+            self.stats.count('filter', filter_passes=passes)
+            self.stats.observe('filter', good_x, good_y)
+        return good_x, good_y
 
-        dedup_idx = np.unique(np.hstack([x_dedup_idx, y_dedup_idx]))
-        x = original_x.copy()[dedup_idx]
-        y = original_y.copy()[dedup_idx]
+    def parse(self, file_format='bin', decode='struct', lazy=False,
+              cache=None, workers=None, processes=False, ragged=False,
+              intensity_dtype='float64', out=None, fields=None,
+              grouped=False, stats=None, progress=None, max_memory=None,
+              spill_dir=None):
+        """Parse the entire file and initialize attributes. The `decode`
+        keyword selects how records are decoded: 'struct' (default) unpacks
+        one record at a time, 'vectorized' locates all records first and then
+        decodes them all at once with numpy. For bss files where all records
+        have the same size, 'vectorized' computes where the records start
+        instead of locating them. If the record index is available (e.g. from
+        a sidecar file written by save_index()), the records are decoded from
+        the indexed positions as with 'vectorized', whatever `decode` is.
+
+        The file is memory mapped rather than read into memory, and the same
+        mapping is shared by all of the header and record parsers. Intensity
+        samples are read as arrays viewing the mapping, so the file contents
+        are never copied as a whole.
+
+        If `lazy` is True, only the record headers are decoded and the
+        positions of the intensity samples are stored. The intensities are
+        then decoded when intensity_image or the 'intensity' of a frequency
+        dict is first accessed, one frequency at a time if only the frequency
+        dicts are used. The raw `intensities` attribute is None in this case.
+
+        If `cache` is a directory path or an sdi.cache.DatasetCache, parsed
+        datasets are stored in that cache and loaded from it, as long as the
+        file hasn't changed, instead of being parsed again. The raw
+        `intensities` attribute is not available when loading from the cache.
+
+        If `workers` is given, the records are located first and then decoded
+        in `workers` chunks concurrently, in a pool of threads or, if
+        `processes` is True, of processes, and the `decode` keyword is
+        ignored. The result is the same as parsing the file serially. Threads
+        are cheaper to start and share the memory map, but only run in
+        parallel while numpy releases the GIL; processes avoid the GIL but
+        send each decoded chunk back to this process.
+
+        If `ragged` is True, intensity_image and the 'intensity' of each
+        frequency dict are sdi.ragged.RaggedArray instances holding only the
+        samples of each trace, instead of 2-d arrays padded with NaNs to the
+        longest trace. Use their padded() method to get the padded image.
+
+        `intensity_dtype` selects the type of the normalized intensities:
+        'float64' (default) or 'float32' for values in [0, 1] padded with
+        NaNs, or 'uint8' for values quantized to bytes the way the original
+        SDI display code does (see _normalize_scale) and padded with zeros.
+
+        The intensities are decoded and normalized in a single pass, straight
+        into the intensity image. If `out` is given, it is used as the
+        intensity image instead of allocating a new one. It must be an array
+        of intensity_dtype, with one row per trace and as many columns as the
+        longest trace (see index_records()). `out` can't be used with `lazy`
+        or `ragged`.
+
+        If `fields` is a list of field names (see as_dict()), only the record
+        fields needed to compute those are decoded, one column at a time with
+        numpy structured dtypes, and intensities are only decoded if
+        'intensity' is one of them. The `decode`, `workers` and `processes`
+        keywords are ignored in this case.
+
+        If `grouped` is True, the traces are reordered so that the traces of
+        each frequency are consecutive (keeping their order within each
+        frequency), and the frequency dicts hold views of the trace fields and
+        intensity image instead of copies. The `interleaved_index` attribute
+        is then an index array that puts the grouped traces back in the order
+        they were recorded, e.g. trace_metadata['kHz'][interleaved_index].
+        Intensities are decoded after the traces have been grouped, straight
+        into their grouped rows (or `out`).
+
+        If `stats` is an sdi.stats.ParseStats, the wall time, bytes read,
+        records decoded, GPS filter passes and largest array of each stage of
+        the parse are added to it (see sdi.stats). The stats stay attached to
+        the dataset as its `stats` attribute, so that fields and intensities
+        decoded lazily later on are recorded as well.
+
+        If `progress` is given, it is called as progress(stage, done, total)
+        while the records are decoded, with done and total in bytes of the
+        file, and while the intensities are decoded, with done and total in
+        traces. If it returns False, the parse is cancelled by raising
+        sdi.stats.ParseCancelled and the dataset is left unparsed. The
+        progress of the records stage is only reported as it goes with
+        decode='struct', and once it is done otherwise.
+
+        If `max_memory` is given, the parse tries to keep the arrays it holds
+        in memory under that many bytes: records are decoded with
+        decode='vectorized' (unless `fields` or `workers` are given), as the
+        struct decoder holds every field of every record in lists, the raw
+        `intensities` attribute is None, intensities are normalized in blocks
+        small enough for the budget, and intensity images (including those of
+        the frequency dicts) that don't fit in what is left of the budget are
+        written to memory mapped temporary files in `spill_dir` (by default,
+        the system's temporary directory) instead. The files are deleted once
+        the arrays are no longer used. The `memory_report` attribute then
+        holds the budget, the estimated peak of the arrays held by the parse,
+        the bytes spilled to disk and the peak resident memory of the process
+        (which includes the pages of memory mapped files, that the system can
+        reclaim), and a warning is issued if the estimated peak exceeds the
+        budget (e.g. because the trace fields alone don't fit). `max_memory`
+        can't be used with `ragged`.
+        """
+        intensity_dtype = np.dtype(intensity_dtype)
+        if intensity_dtype not in INTENSITY_DTYPES:
+            raise ValueError("Unsupported intensity dtype: %s" % intensity_dtype)
+        if out is not None and (lazy or ragged):
+            raise ValueError("out can't be used with lazy or ragged intensities")
+        if max_memory is not None and ragged:
+            raise ValueError("max_memory can't be used with ragged intensities")
+        if fields is not None:
+            fields = sorted(set(fields))
+        self.intensity_dtype = intensity_dtype
+        self.fields = fields
+        self._ragged = ragged
+        self.stats = stats
+        self._progress = progress
+        self.max_memory = max_memory
+        self.spill_dir = spill_dir
+        self.memory_report = None
+        self._resident_bytes = self._spilled_bytes = self._peak_bytes = 0
+        if max_memory is not None and fields is None and workers is None:
+            decode = 'vectorized'
+        if cache is not None:
+            if not isinstance(cache, dataset_cache.DatasetCache):
+                cache = dataset_cache.DatasetCache(cache)
+            with self._stage('cache'):
+                loaded = cache.load(self, file_format)
+            if loaded:
+                self.intensities = None
+                if ragged and self.intensity_image is not None:
+                    self._unpad_intensities()
+                if grouped:
+                    with self._stage('group'):
+                        self._group_traces()
+                    with self._stage('frequencies'):
+                        self.frequencies = self.assemble_frequencies()
+                if out is not None and self.intensity_image is not None:
+                    _check_out(out, self.intensity_image.shape, intensity_dtype)
+                    out[...] = self.intensity_image
+                    self.intensity_image = out
+                if max_memory is not None:
+                    self._report_memory()
+                return
+
+        with self._stage('header'):
+            fid = self._open(file_format)
+        data_length = len(fid)
+        header_size = 12 if file_format == 'bin' else 372
+        if stats is not None:
+            stats.count('header', bytes_read=header_size)
+
+        # grouped intensities are decoded once the traces have been grouped
+        parse_lazy = lazy or grouped
+        parse_out = None if grouped else out
+        with self._stage('records'):
+            if fields is not None:
+                self._parse_fields(
+                    fid, file_format, fields, lazy=parse_lazy, out=parse_out)
+            elif workers is not None:
+                self._parse_records_parallel(
+                    fid, file_format, workers, processes=processes,
+                    lazy=parse_lazy, out=parse_out)
+            elif file_format == 'bin':
+                self.parse_records(
+                    fid, data_length, decode=decode, lazy=parse_lazy,
+                    out=parse_out)
+            elif file_format == 'bss':
+                self.parse_bss_records(
+                    fid, data_length, decode=decode, lazy=parse_lazy,
+                    out=parse_out)
+        if stats is not None:
+            self._count_records(data_length - header_size)
+        self._report_progress('records', data_length, data_length)
+
+        if grouped:
+            with self._stage('group'):
+                self._group_traces()
+            if not lazy and self._intensity_source is not None:
+                data, data_starts, lengths, sample_fmt = self._intensity_source
+                self.intensities = self._raw_intensities(
+                    data, data_starts, lengths, sample_fmt)
+                self.intensity_image = self._decode_intensity(out=out)
+
+        with self._stage('frequencies'):
+            self.frequencies = self.assemble_frequencies()
+        self.parsed = True
+        if max_memory is not None:
+            self._report_memory()
 
-        if (x.max() - x.min()) <= 200:
-            x_std_factor = 7
-        else:
-            x_std_factor = 5
+        if cache is not None:
+            with self._stage('cache'):
+                cache.store(self, file_format)
+
+    def _stage(self, name):
+        """Returns a context manager that times a stage of the parse in the
+        stats, if there are any
+        """
+        if self.stats is None:
+            return parse_stats.NO_STAGE
+        return self.stats.stage(name)
 
-        if (y.max() - y.min()) <= 200:
-            y_std_factor = 7
+    def _report_progress(self, stage, done, total):
+        """Report progress to the progress callback, if there is one, and
+        raise ParseCancelled if it returns False
+        """
+        if self._progress is not None and self._progress(stage, done, total) is False:
+            raise ParseCancelled(
+                "Parsing %s was cancelled during the %s stage" %
+                (self.filepath, stage))
+
+    def _raw_intensities(self, data, data_starts, lengths, sample_fmt):
+        """Returns the list of the raw samples of each trace, or None when
+        parsing within a memory budget, as the list holds an array object per
+        trace
+        """
+        if self.max_memory is not None:
+            return None
+        return _sample_views(data, data_starts, lengths, sample_fmt)
+
+    def _allocate_image(self, shape):
+        """Returns an uninitialized intensity image of `shape`. When parsing
+        within a memory budget, the image is a memory mapped temporary file if
+        it doesn't fit in what is left of the budget.
+        """
+        nbytes = int(np.prod(shape)) * self.intensity_dtype.itemsize
+        if self.max_memory is None or nbytes == 0:
+            return np.empty(shape, dtype=self.intensity_dtype)
+
+        if self._memory_in_use() + nbytes <= self.max_memory:
+            self._resident_bytes += nbytes
+            self._update_peak()
+            return np.empty(shape, dtype=self.intensity_dtype)
+
+        # the file is deleted once the memory map is closed
+        spill_file = tempfile.TemporaryFile(dir=self.spill_dir)
+        try:
+            image = np.memmap(
+                spill_file, dtype=self.intensity_dtype, mode='w+', shape=shape)
+        finally:
+            spill_file.close()
+        self._spilled_bytes += nbytes
+        return image
+
+    def _image_rows(self, rows):
+        """Returns the rows of the intensity image selected by `rows`, an
+        index array or a slice (which gives a view). When parsing within a
+        memory budget, the rows are copied a block at a time into an image
+        from _allocate_image.
+        """
+        image = self._intensity_image
+        if self.max_memory is None or isinstance(rows, slice):
+            return image[rows]
+
+        out = self._allocate_image((len(rows),) + image.shape[1:])
+        block_rows = max(self._block_size() // max(image.shape[1], 1), 1)
+        for i in range(0, len(rows), block_rows):
+            out[i:i + block_rows] = image[rows[i:i + block_rows]]
+        return out
+
+    def _block_size(self):
+        """Returns the number of samples normalized at a time: at most
+        NORMALIZE_BLOCK_SIZE, and within what is left of the memory budget
+        """
+        if self.max_memory is None:
+            return NORMALIZE_BLOCK_SIZE
+        available = self.max_memory - self._memory_in_use()
+        return int(min(max(
+            available // BLOCK_BYTES_PER_SAMPLE, MIN_BLOCK_SIZE),
+            NORMALIZE_BLOCK_SIZE))
+
+    def _memory_in_use(self):
+        """Returns the bytes of the trace field arrays and in-memory images
+        held by the dataset, including the buffers that refresh() appends
+        records to. Arrays that view the same buffer are counted once, as
+        the size of the whole buffer.
+        """
+        arrays = []
+        for mapping in [getattr(self, 'raw_trace', None) or {},
+                        getattr(self, 'trace_metadata', None) or {}]:
+            for key in mapping:
+                if isinstance(mapping, _LazyDict) and mapping.is_lazy(key):
+                    continue
+                arrays.append(mapping[key])
+        if self._follow is not None:
+            arrays.extend(self._follow['metadata'].values())
+            arrays.append(self._follow['image'])
+
+        buffers = {}
+        for array in arrays:
+            if not isinstance(array, np.ndarray):
+                continue
+            while isinstance(array.base, np.ndarray):
+                array = array.base
+            buffers[id(array)] = array.nbytes
+        return self._resident_bytes + sum(buffers.values())
+
+    def _update_peak(self, transient=0):
+        self._peak_bytes = max(
+            self._peak_bytes, self._memory_in_use() + transient)
+
+    def _report_memory(self):
+        """Set memory_report at the end of a parse within a memory budget"""
+        self._update_peak()
+        self.memory_report = {
+            'max_memory': self.max_memory,
+            'peak_bytes': self._peak_bytes,
+            'spilled_bytes': self._spilled_bytes,
+            'max_rss_bytes': _max_rss(),
+        }
+        if self._peak_bytes > self.max_memory:
+            warnings.warn(
+                "Parsing %s held about %d bytes in memory, more than "
+                "max_memory (%d bytes)" %
+                (self.filepath, self._peak_bytes, self.max_memory))
+
+    def _count_records(self, records_length):
+        """Add the records decoded by the parse to the stats. Unless only
+        some fields were decoded (see _parse_fields), the bytes read are the
+        `records_length` bytes of the records, less their intensity samples.
+        """
+        count = len(self.trace_metadata['transducer'])
+        if self.fields is None:
+            lengths = self._intensity_source[2]
+            self.stats.count(
+                'records', records=count,
+                bytes_read=records_length - 2 * int(lengths.sum()))
+        else:
+            self.stats.count('records', records=count)
+        self.stats.observe('records', *[
+            self.trace_metadata[key] for key in self.trace_metadata
+            if not self.trace_metadata.is_lazy(key)])
+
+    def iter_chunks(self, n, file_format='bin'):
+        """Generator yielding the traces of the file in blocks of (at most) `n`
+        traces. Records are located and decoded one block at a time, so memory
+        use depends on `n` rather than on the size of the file. Each block is a
+        dict mapping the trace-level keys described in as_dict() to arrays of
+        length n, with the same unit conversions as trace_metadata, and
+        'intensity' to the normalized intensities of the block as an array
+        padded with NaNs to the longest trace in the block. GPS glitch
+        filtering and the 'interpolated_*' fields need the whole track, so
+        they are not available here.
+        """
+        fid = self._open(file_format)
+        index = self._cached_record_index(file_format)
+        if index is not None:
+            for i in range(0, len(index['start']), n):
+                yield self._read_records(
+                    fid, index['start'][i:i + n], file_format)
+            return
+
+        npos = None
+        while True:
+            starts, npos = self._locate_records(
+                fid, file_format, npos=npos, max_records=n)
+            if not len(starts):
+                break
+            yield self._read_records(fid, starts, file_format)
+
+    def iter_traces(self, file_format='bin', chunk_size=1000):
+        """Generator yielding one dict per trace, with the same keys as the
+        blocks yielded by iter_chunks() and scalar values, except for
+        'intensity' which holds the normalized intensities of the trace.
+        Traces are decoded `chunk_size` at a time.
+        """
+        for chunk in self.iter_chunks(chunk_size, file_format=file_format):
+            intensity = chunk.pop('intensity')
+            num_pnts = chunk['num_pnts']
+            for i in range(len(num_pnts)):
+                trace = dict(
+                    (key, array[i]) for key, array in chunk.iteritems())
+                trace['intensity'] = intensity[i, :num_pnts[i]]
+                yield trace
+
+    def read_traces(self, start, stop, file_format='bin', out=None):
+        """Returns the traces from position `start` up to (but not including)
+        position `stop` in the file, counting from zero, as a dict in the same
+        form as the blocks yielded by iter_chunks(). The records are looked up
+        in the record index (see index_records()) and only those records are
+        decoded. If `out` is given, the intensities are written into it, see
+        parse().
+        """
+        index = self.index_records(file_format)
+        fid = self._open(file_format)
+        return self._read_records(
+            fid, index['start'][start:stop], file_format, out=out)
+
+    def read_time_range(self, t0, t1, file_format='bin'):
+        """Returns the traces recorded between the datetimes `t0` and `t1`
+        (inclusive) as a dict in the same form as the blocks yielded by
+        iter_chunks(). The records are looked up in the record index (see
+        index_records()) and only those records are decoded.
+        """
+        index = self.index_records(file_format)
+        time_tag = index['time_tag']
+        rows = np.nonzero(
+            (time_tag >= _time_tag(t0)) & (time_tag <= _time_tag(t1)))[0]
+        fid = self._open(file_format)
+        return self._read_records(fid, index['start'][rows], file_format)
+
+    def iter_traces_reversed(self, file_format='bss', chunk_size=1000):
+        """Generator yielding the traces of a bss file one at a time in the
+        same form as iter_traces(), starting with the last trace of the file
+        and going backwards. The last record is found from the end of the
+        file, and the records before it are found by following the
+        PrevRecordSize back-link of each record, `chunk_size` records at a
+        time, so the cost depends on the number of traces read rather than
+        on the size of the file. Only bss files have back-links.
+        """
+        fid = self._open_reversed(file_format)
+        npos = None
+        while npos != 0:
+            starts, npos = self._walk_back_records(fid, chunk_size, npos)
+            if not len(starts):
+                break
+            chunk = self._read_records(fid, starts, file_format)
+            intensity = chunk.pop('intensity')
+            num_pnts = chunk['num_pnts']
+            for i in reversed(range(len(num_pnts))):
+                trace = dict(
+                    (key, array[i]) for key, array in chunk.iteritems())
+                trace['intensity'] = intensity[i, :num_pnts[i]]
+                yield trace
+
+    def read_last(self, n, file_format='bss'):
+        """Returns the last `n` traces of a bss file, in the order they were
+        recorded, as a dict in the same form as the blocks yielded by
+        iter_chunks(). Only those records are decoded, see
+        iter_traces_reversed().
+        """
+        fid = self._open_reversed(file_format)
+        starts, npos = self._walk_back_records(fid, n)
+        return self._read_records(fid, starts, file_format)
+
+    def _open_reversed(self, file_format):
+        if file_format != 'bss':
+            raise ValueError(
+                "Only bss files can be read backwards, not %s files"
+                % file_format)
+        return self._open(file_format)
+
+    def _walk_back_records(self, fid, n, npos=None):
+        """Returns a tuple of (starts, npos) with the positions, in recorded
+        order, of up to `n` bss records preceding the record starting at byte
+        `npos` (by default, the records up to and including the last complete
+        record of the file), and the position of the first of them, or 0 if
+        the first record of the file has been reached. Raises a ValueError if
+        a back-link doesn't lead to the start of a record of the size it
+        gives.
+        """
+        if n <= 0:
+            return np.array([], dtype=np.int64), npos
+        rec_structs = _bss_structs()
+        if npos is None:
+            npos = _find_last_bss_record(fid, len(fid), rec_structs)
+            if npos is None:
+                return np.array([], dtype=np.int64), 0
+            starts = [npos]
+        else:
+            starts = []
+
+        header_size = BSS_HEADER_SIZE
+        unpack_from = struct.Struct('<HLL').unpack_from
+        while len(starts) < n:
+            if npos == header_size:
+                npos = 0
+                break
+            prev_record_size = unpack_from(fid, npos)[1]
+            prev_npos = npos - prev_record_size
+            if prev_npos >= header_size:
+                bss_size, _, num_pnts = unpack_from(fid, prev_npos)
+            if (prev_npos < header_size or
+                    2 + bss_size + 2 * num_pnts != prev_record_size):
+                raise ValueError(
+                    "Corrupt PrevRecordSize %d in the bss record at byte %d"
+                    % (prev_record_size, npos))
+            npos = prev_npos
+            starts.append(npos)
+        return np.array(starts[::-1], dtype=np.int64), npos
+
+    def refresh(self, file_format='bin'):
+        """Decode the records that have been appended to the file since the
+        last refresh, for files that are still being recorded. Returns the
+        number of new traces.
+
+        The first refresh decodes the whole file. After that, only the new
+        complete records are decoded and appended to trace_metadata and
+        intensity_image, so the cost of a refresh depends on the amount of new
+        data rather than on the size of the file. A record that is only
+        partially written yet is left for the next refresh. The GPS filtered
+        and interpolated positions depend on the whole track, so they are
+        computed again when they are first accessed after a refresh, and
+        frequency dicts only select the rows of a frequency when their
+        values are accessed. The raw `intensities` attribute is None.
+
+        The file is memory mapped for the duration of the refresh only, the
+        decoded records are copied out of the map before it is closed.
+        """
+        if self._follow is None:
+            fid = self._open(file_format)
+            self._follow = {
+                'file_format': file_format,
+                'position': None,
+                'count': 0,
+                'metadata': {},
+                'image': None,
+            }
         else:
-            y_std_factor = 5
-        x_out = np.abs(x - np.median(x)) > x_std_factor * x.std()
-        y_out = np.abs(y - np.median(y)) > y_std_factor * y.std()
+            fid = _map_file(self.filepath)
+        try:
+            return self._append_records(fid)
+        finally:
+            fid.close()
+
+    def _append_records(self, fid):
+        """Decodes the complete records of the memory mapped file `fid`
+        that follow the last one decoded by refresh(), and appends them to
+        the dataset. Returns the number of new traces.
+        """
+        follow = self._follow
+        file_format = follow['file_format']
+
+        with warnings.catch_warnings():
+            # the last record may still be being written
+            warnings.simplefilter('ignore')
+            starts, npos = self._locate_records(
+                fid, file_format, npos=follow['position'])
+        if not len(starts):
+            return 0
+
+        raw_trace, data_starts, all_structs, sample_fmt = self._decode_records(
+            fid, starts, file_format)
+        traces = dict(self._convert_raw_trace(
+            raw_trace, all_structs, file_format=file_format))
+        lengths = traces['num_pnts'].astype(np.int64)
+
+        count = follow['count']
+        new_count = count + len(starts)
+        metadata = follow['metadata']
+        for key, array in traces.iteritems():
+            buffer = metadata.get(key)
+            dtype = array.dtype
+            if buffer is not None:
+                dtype = np.promote_types(buffer.dtype, dtype)
+            buffer = _reserve_rows(buffer, count, len(array), (), dtype)
+            buffer[count:new_count] = array
+            metadata[key] = buffer
+
+        image = follow['image']
+        width = max(lengths.max(), 0 if image is None else image.shape[1])
+        image = _reserve_rows(
+            image, count, len(starts), (width,), self.intensity_dtype,
+            _padding_value(self.intensity_dtype))
+        self._decode_normalized(
+            fid, data_starts, lengths, sample_fmt,
+            transducer=traces['transducer'], max_length=width,
+            out=image[count:new_count])
+        follow['image'] = image
+        follow['count'] = new_count
+        follow['position'] = npos
+
+        trace_metadata = _LazyDict()
+        for key in metadata:
+            trace_metadata.set_lazy(
+                key, _select_rows, metadata, key, slice(0, new_count))
+        self._set_position_fields(trace_metadata, file_format)
+        self.trace_metadata = trace_metadata
+        self.raw_trace = None
+        self.intensities = None
+        self._intensity_source = None
+        self.intensity_image = image[:new_count]
+        self.frequencies = self.assemble_frequencies()
+        self.parsed = True
+        return len(starts)
 
-        out_mask = x_out + y_out
+    def follow(self, file_format='bin', interval=1.0, timeout=None):
+        """Generator that refreshes the dataset (see refresh()) every
+        `interval` seconds and yields the number of new traces whenever
+        records have been appended to the file. Stops once no records have
+        been appended for `timeout` seconds, or never if timeout is None.
+        """
+        last_update = timer.time()
+        while True:
+            new_traces = self.refresh(file_format)
+            if new_traces:
+                last_update = timer.time()
+                yield new_traces
+            elif timeout is not None and timer.time() - last_update >= timeout:
+                return
+            timer.sleep(interval)
+
+    def index_records(self, file_format='bin'):
+        """Returns the record index of the file: a dict of arrays with one
+        element per record. The keys are:
+            'start':
+                Byte position in the file where the record starts.
+            'time_tag':
+                Time the trace was recorded, in days since 12/30/1899 (like
+                the TimeTag field of bss files).
+            'trace_num':
+                Trace number of the record.
+            'transducer':
+                Transducer of the record.
+            'longitude', 'latitude', 'easting', 'northing':
+                Raw positions recorded with the trace (easting and northing
+                are only available in bin versions >= '3.3'), without any GPS
+                filtering or interpolation.
+
+        The index is built the first time it is needed by hopping from record
+        to record and decoding only the fields above, and is then kept on the
+        Dataset. If a sidecar index file written by save_index() exists and
+        the data file hasn't changed since, the index is loaded from it
+        instead.
+        """
+        index = self._cached_record_index(file_format)
+        if index is not None:
+            return index
 
-        good_x = original_x.copy()
-        good_y = original_y.copy()
+        fid = self._open(file_format)
+        starts, _ = self._locate_records(fid, file_format)
 
-        if np.any(out_mask):
-            nan_mask = (good_x == x[out_mask]) + (good_y == y[out_mask])
-            good_x[nan_mask] = np.nan
-            good_y[nan_mask] = np.nan
+        if file_format == 'bin':
+            pre_structs, event_struct, post_structs = _bin_structs(self.version)
+            pre_fields = _gather_fields(
+                fid, starts, pre_structs,
+                ['trace_num', 'hour', 'minute', 'second', 'centisecond',
+                 'event_len'])
+            post_starts = (starts + _record_dtype(pre_structs).itemsize +
+                           pre_fields['event_len'])
+            post_names = [name for name, fmt, dtype in post_structs]
+            position_names = [
+                name for name in ['longitude', 'latitude', 'easting', 'northing']
+                if name in post_names
+            ]
+            post_fields = _gather_fields(
+                fid, post_starts, post_structs,
+                ['transducer'] + position_names)
+
+            time_tag = _clock_time_tag(self.date, pre_fields)
+            trace_num = pre_fields['trace_num']
+            transducer = post_fields['transducer']
+            positions = dict(
+                (name, post_fields[name]) for name in position_names)
+        else:
+            fields = _gather_fields(
+                fid, starts, _bss_structs(),
+                ['time_tag', 'trace_num', 'transducer', 'longitude',
+                 'latitude', 'x', 'y'])
+            time_tag = fields['time_tag']
+            trace_num = fields['trace_num']
+            transducer = fields['transducer']
+            positions = {
+                'longitude': fields['longitude'],
+                'latitude': fields['latitude'],
+                'easting': fields['x'],
+                'northing': fields['y'],
+            }
+
+        index = {
+            'start': starts,
+            'time_tag': time_tag.astype(np.float64),
+            'trace_num': trace_num.astype(np.int64),
+            'transducer': transducer.astype(np.uint8),
+        }
+        for name, array in positions.iteritems():
+            index[name] = array.astype(np.float64)
+
+        self._record_index = (file_format, index)
+        return index
+
+    def summary(self, file_format='bin', sample_size=200):
+        """Returns a dict describing the file, from its file header and a
+        sparse sample of its records, without decoding the whole file. Fields
+        are only read from `sample_size` records spread evenly over the file,
+        including the first and the last, and from the first
+        SUMMARY_LEADING_RECORDS records, which span several ping cycles and so
+        hold every frequency in use at the start of the line.
+
+        The records still have to be located. If the file has an up to date
+        sidecar index (see save_index()), the records, their times,
+        transducers and positions are taken from it and only the kHz of the
+        sampled records is read from the file. Otherwise bss files whose
+        records all have the same size are located from the first record,
+        and other files are scanned by hopping from record to record, which
+        reads a few bytes of every record and so costs I/O in proportion to
+        the size of the file. The keys are:
+            'file_format', 'version', 'survey_line_number', 'date':
+                As in as_dict().
+            'trace_count':
+                Number of records in the file.
+            'frequencies':
+                List of (transducer, kHz) tuples of the sampled frequencies.
+            'start_time', 'end_time':
+                Datetimes of the first and last records, or None if the file
+                has no records.
+            'longitude', 'latitude', 'easting', 'northing':
+                Tuples of the (min, max) sampled positions, leaving out
+                positions without a fix (0, 0) and GPS glitches (see
+                filter_x_and_y()), or None if there are none. Easting and
+                northing are only available in bin versions >= '3.3'.
+        """
+        fid = self._open(file_format)
+        index = self._cached_record_index(file_format)
+        if index is not None:
+            starts = index['start']
+        else:
+            starts = None
+            if file_format == 'bss':
+                starts = _fixed_stride_bss_records(fid, len(fid), _bss_structs())
+            if starts is None:
+                starts, _ = self._locate_records(fid, file_format)
+        sample = np.union1d(
+            np.linspace(0, len(starts) - 1,
+                        min(sample_size, len(starts))).astype(np.int64),
+            np.arange(min(SUMMARY_LEADING_RECORDS, len(starts))))
+        sample_starts = starts[sample]
+
+        if index is not None:
+            if file_format == 'bin':
+                kHz_structs = _bin_structs(self.version)[0]
+            else:
+                kHz_structs = _bss_structs()
+            kHz = _gather_fields(
+                fid, sample_starts, kHz_structs, ['kHz'])['kHz']
+            transducer = index['transducer'][sample]
+            time_tag = index['time_tag'][sample]
+            positions = dict(
+                (name, index[name][sample])
+                for name in ['longitude', 'latitude', 'easting', 'northing']
+                if name in index)
+        elif file_format == 'bin':
+            pre_structs, event_struct, post_structs = _bin_structs(self.version)
+            pre_fields = _gather_fields(
+                fid, sample_starts, pre_structs,
+                ['kHz', 'event_len', 'hour', 'minute', 'second', 'centisecond'])
+            post_starts = (sample_starts + _record_dtype(pre_structs).itemsize +
+                           pre_fields['event_len'])
+            kHz = pre_fields['kHz']
+            time_tag = _clock_time_tag(self.date, pre_fields)
+            post_names = [name for name, fmt, dtype in post_structs]
+            position_names = [
+                name for name in ['longitude', 'latitude', 'easting', 'northing']
+                if name in post_names
+            ]
+            sampled = _gather_fields(
+                fid, post_starts, post_structs, ['transducer'] + position_names)
+            transducer = sampled['transducer']
+            positions = dict(
+                (name, sampled[name]) for name in position_names)
+        else:
+            sampled = _gather_fields(
+                fid, sample_starts, _bss_structs(),
+                ['transducer', 'kHz', 'time_tag', 'longitude', 'latitude', 'x',
+                 'y'])
+            kHz = sampled['kHz']
+            transducer = sampled['transducer']
+            time_tag = sampled['time_tag']
+            positions = {
+                'longitude': sampled['longitude'],
+                'latitude': sampled['latitude'],
+                'easting': sampled['x'],
+                'northing': sampled['y'],
+            }
 
-            good_x = _fill_nans_with_last(good_x)
-            good_y = _fill_nans_with_last(good_y)
+        frequencies = []
+        for freq_transducer in np.unique(transducer):
+            for freq_kHz in np.unique(kHz[transducer == freq_transducer]):
+                frequencies.append((int(freq_transducer), float(freq_kHz)))
 
-            # call this recursively, because outliers can be so extreme that
-            # multiple passes are necessary
-            good_x, good_y = self.filter_x_and_y(good_x, good_y)
+        summary = {
+            'file_format': file_format,
+            'version': self.version,
+            'survey_line_number': self.survey_line_number,
+            'date': self.date,
+            'trace_count': len(starts),
+            'frequencies': frequencies,
+            'start_time': None,
+            'end_time': None,
+        }
+        if len(starts):
+            summary['start_time'] = _time_tag_datetime(time_tag[0])
+            summary['end_time'] = _time_tag_datetime(time_tag[-1])
+
+        for x_key, y_key in [('longitude', 'latitude'), ('easting', 'northing')]:
+            if x_key not in positions:
+                continue
+            x = positions[x_key].astype(np.float64)
+            y = positions[y_key].astype(np.float64)
+            has_fix = (x != 0) | (y != 0)
+            summary[x_key] = summary[y_key] = None
+            if np.any(has_fix):
+                x, y = self.filter_x_and_y(x[has_fix], y[has_fix])
+                summary[x_key] = (float(x.min()), float(x.max()))
+                summary[y_key] = (float(y.min()), float(y.max()))
+
+        return summary
+
+    def save_index(self, file_format='bin'):
+        """Save the record index (see index_records()) to a sidecar file
+        next to the data file, so later opens of the file can skip scanning
+        it. Returns the path of the sidecar file.
+        """
+        index = self.index_records(file_format)
+        return sidecar.save(self.filepath, index, file_format)
 
-        return good_x, good_y
+    def _cached_record_index(self, file_format):
+        """Returns the record index if it has already been built or can be
+        loaded from an up to date sidecar file, otherwise None
+        """
+        if self._record_index is not None:
+            indexed_format, index = self._record_index
+            if indexed_format == file_format:
+                return index
+
+        index = sidecar.load(self.filepath, file_format)
+        if index is not None:
+            self._record_index = (file_format, index)
+        return index
+
+    def _locate_records(self, fid, file_format, npos=None, max_records=None):
+        """Returns a tuple of (starts, npos) with the positions of the records
+        following byte `npos` (by default, the first record) and the position
+        after the last record found. See _scan_bin_records.
+        """
+        data_length = len(fid)
+        if file_format == 'bin':
+            pre_structs, event_struct, post_structs = _bin_structs(self.version)
+            return _scan_bin_records(
+                fid, data_length, _record_dtype(pre_structs).itemsize,
+                12 if npos is None else npos, max_records)
+        else:
+            return _scan_bss_records(
+                fid, data_length, _record_dtype(_bss_structs()).itemsize,
+                372 if npos is None else npos, max_records)
+
+    def _decode_records(self, fid, starts, file_format):
+        """Decodes the headers of the records starting at each of the byte
+        positions in `starts`. Returns a tuple of (raw_trace, data_starts,
+        all_structs, sample_fmt), see _decode_bin_records.
+        """
+        if file_format == 'bin':
+            pre_structs, event_struct, post_structs = _bin_structs(self.version)
+            all_structs = pre_structs + event_struct + post_structs
+            raw_trace, data_starts = _decode_bin_records(
+                fid, starts, pre_structs, post_structs)
+            sample_fmt = '<u2'
+        else:
+            all_structs = _bss_structs()
+            raw_trace, data_starts = _decode_bss_records(
+                fid, starts, all_structs)
+            sample_fmt = '<i2'
+        return raw_trace, data_starts, all_structs, sample_fmt
+
+    def _read_records(self, fid, starts, file_format, out=None):
+        """Decodes the records starting at each of the byte positions in
+        `starts` into a dict of the form yielded by iter_chunks()
+        """
+        raw_trace, data_starts, all_structs, sample_fmt = self._decode_records(
+            fid, starts, file_format)
 
-    def parse(self, file_format='bin'):
-        """Parse the entire file and initialize attributes"""
-        with open(self.filepath, 'rb') as f:
-            data = f.read()
+        traces = dict(self._convert_raw_trace(
+            raw_trace, all_structs, file_format=file_format))
+        if file_format == 'bss':
+            traces['easting'] = traces['x']
+            traces['northing'] = traces['y']
 
-        fid = StringIO(data)
-        data_length = len(data)
+        traces['intensity'] = self._decode_normalized(
+            fid, data_starts, traces['num_pnts'].astype(np.int64), sample_fmt,
+            transducer=traces['transducer'], out=out)
+        return traces
+
+    def _open(self, file_format='bin'):
+        """Memory map the file, parse the file header and initialize the
+        file-wide attributes. Returns the memory map.
+        """
+        fid = _map_file(self.filepath)
 
         if file_format == 'bin':
             header = self.parse_file_header(fid)
@@ -359,18 +1460,17 @@ class Dataset(object):
             self.resolution_cm = header['resolution_cm']
             self.date = datetime.strptime(
                 self.survey_line_number[:6], '%y%m%d').date()
-            self.parse_records(fid, data_length)
         elif file_format == 'bss':
             header = self.parse_bss_file_header(fid)
             self.file_header = header
-            self.version = header['version']
+            # records are decoded with the layout of version 1.0, see
+            # parse_bss_records
+            self.version = 1000
             self.survey_line_number = header['filename']
             self.date = datetime.strptime(
-                self.survey_line_number[:6], '%y%m%d').date()            
-            self.parse_bss_records()
+                self.survey_line_number[:6], '%y%m%d').date()
 
-        self.frequencies = self.assemble_frequencies()
-        self.parsed = True
+        return fid
 
     def parse_file_header(self, f):
         """
@@ -437,69 +1537,29 @@ class Dataset(object):
             'date': date.today(),
         }
 
-    def parse_records(self, fid, data_length):
-        pre_structs = [
-            ('offset', 'H', np.uint16),
-            ('trace_num', 'l', np.int32),
-            ('units', 'B', np.uint8),
-            ('spdos_units', 'B', np.uint8),
-            ('spdos', 'h', np.int16),
-            ('min_window10', 'h', np.int16),
-            ('max_window10', 'h', np.int16),
-            ('draft100', 'h', np.int16),
-            ('tide100', 'h', np.int16),
-            ('heave_cm', 'h', np.int16),
-            ('display_range', 'h', np.int16),
-            ('depth_r1', 'f', np.float32),
-            ('min_pnt_r1', 'f', np.float32),
-            ('num_pnt_r1', 'f', np.float32),
-            ('blanking_pnt', 'h', np.int16),
-            ('depth_pnt','h', np.int16),
-            ('range_pnt','h', np.int16),
-            ('num_pnts','h', np.int16),
-            ('clock', 'l', np.int32),
-            ('hour', 'B', np.uint8),
-            ('minute', 'B', np.uint8),
-            ('second', 'B', np.uint8),
-            ('centisecond', 'B', np.uint8),
-            ('rate', 'l', np.int32),
-            ('kHz', 'f', np.float32),
-            ('event_len', 'B', np.uint8),
-        ]
-        event_struct = [('event', None, None)]
-        post_structs = [
-            ('longitude', 'd', np.float64),
-            ('latitude', 'd', np.float64),
-            ('transducer', 'B', np.uint8),
-            ('options', 'B', np.uint8),
-            ('data_offset', 'B', np.uint8),
-        ]
-        if self.version >= '3.3':
-            post_structs.append(('easting', 'd', np.float64))
-            post_structs.append(('northing', 'd', np.float64))
-        if self.version >= '4.0':
-            post_structs.append(('cycles', 'B', np.uint8))
-            post_structs.append(('volts', 'B', np.uint8))
-            post_structs.append(('power', 'B', np.uint8))
-            post_structs.append(('gain', 'B', np.uint8))
-            post_structs.append(('previous_offset', 'H', np.int16))
-        if self.version >= '4.2':
-            post_structs.append(('antenna_e1', 'f', np.float32))
-            post_structs.append(('antenna_ht', 'f', np.float32))
-            post_structs.append(('draft', 'f', np.float32))
-            post_structs.append(('tide', 'f', np.float32))
-        if self.version >= '4.3':
-            post_structs.append(('gps_mode', 'b', np.int16))
-            post_structs.append(('hdop', 'f', np.float32))
-
+    def parse_records(self, fid, data_length, decode='struct', lazy=False,
+                      out=None):
+        pre_structs, event_struct, post_structs = _bin_structs(self.version)
         all_structs = pre_structs + event_struct + post_structs
 
+        if decode == 'struct' and self._cached_record_index('bin') is not None:
+            # the records are already located, which is all the record by
+            # record loop would save over decoding them at once
+            decode = 'vectorized'
+        if decode == 'vectorized':
+            return self._parse_records_vectorized(
+                fid, data_length, pre_structs, post_structs, lazy=lazy,
+                out=out)
+        elif decode != 'struct':
+            raise ValueError("Unknown decode mode: %s" % decode)
+
         # intitialize dict of trace elements
         raw_trace = dict([
             [name, []] for name, fmt, dtype in all_structs
         ])
 
         trace_intensities = []
+        data_starts = []
 
         # pre-compute format, names and size for unpacking
         pre_fmt, pre_names, pre_size = self._split_struct_list(pre_structs)
@@ -507,6 +1567,7 @@ class Dataset(object):
 
         npos = 12
         fid.seek(npos)
+        progress = self._progress
 
         # loop through data extract traces. the length of the event string
         # changes between traces and is defined just before it (event_len), so
@@ -532,66 +1593,277 @@ class Dataset(object):
             fid.seek(npos + pre_dict['offset'] + 2)
 
             size = pre_dict['num_pnts']
-            intensity = struct.unpack('<' + str(size) + 'H', fid.read(size * 2))
-            trace_intensities.append(intensity)
-            npos = int(fid.tell())
+            data_pos = fid.tell()
+            data_starts.append(data_pos)
+            if not lazy:
+                intensity = np.frombuffer(
+                    fid, dtype='<u2', count=size, offset=data_pos)
+                trace_intensities.append(intensity)
+            npos = data_pos + size * 2
+            fid.seek(npos)
+            if progress is not None and len(data_starts) % PROGRESS_INTERVAL == 0:
+                self._report_progress('records', npos, data_length)
 
-        self.intensities = trace_intensities
+        self.raw_trace = raw_trace
         self.trace_metadata = self.process_raw_trace(raw_trace, all_structs)
-        self.intensity_image = self._normalize_scale(_fill_nans(trace_intensities))
+        self._set_intensity_source(fid, data_starts, '<u2')
+        if lazy:
+            self.intensities = None
+            self.intensity_image = None
+        else:
+            self.intensities = trace_intensities
+            self.intensity_image = self._decode_intensity(out=out)
+
+    def _parse_records_vectorized(self, data, data_length, pre_structs,
+                                  post_structs, lazy=False, out=None):
+        """Two-pass alternative to the record loop in parse_records. The
+        first pass only hops from record to record using the offset and
+        num_pnts fields to find where each record starts. The second pass then
+        decodes the fixed-layout fields before and after the variable-length
+        event string for all records at once using numpy structured dtypes,
+        and gathers the intensity samples of each record straight out of the
+        file data.
+        """
+        all_structs = pre_structs + [('event', None, None)] + post_structs
+
+        index = self._cached_record_index('bin')
+        if index is not None:
+            starts = index['start']
+        else:
+            starts, _ = _scan_bin_records(
+                data, data_length, _record_dtype(pre_structs).itemsize)
+        raw_trace, data_starts = _decode_bin_records(
+            data, starts, pre_structs, post_structs)
 
-    def parse_bss_records(self):
-        with open(self.filepath, 'rb') as f:
-            data = f.read()
+        self.raw_trace = raw_trace
+        self.trace_metadata = self.process_raw_trace(raw_trace, all_structs)
+        self._set_intensity_source(data, data_starts, '<u2')
+        if lazy:
+            self.intensities = None
+            self.intensity_image = None
+        else:
+            self.intensities = self._raw_intensities(
+                data, data_starts, raw_trace['num_pnts'], '<u2')
+            self.intensity_image = self._decode_intensity(out=out)
+
+    def _parse_records_parallel(self, fid, file_format, workers,
+                                processes=False, lazy=False, out=None):
+        """Alternative to the record parsers that decodes the file in chunks
+        concurrently. The records are located first (from the record index if
+        it is available), then split into `workers` chunks of consecutive
+        records, and the headers and intensities of each chunk are decoded
+        and normalized in a pool of `workers` threads, or processes if
+        `processes` is True. The chunks are then stitched back together in
+        trace order. The GPS filtering and interpolation need the whole track,
+        so they are done once all chunks are decoded.
+
+        Threads write the intensities of their chunk straight into their rows
+        of the intensity image (or `out`), processes send them back to be
+        copied in.
+        """
+        index = self._cached_record_index(file_format)
+        if index is not None:
+            starts = index['start']
+        else:
+            starts, _ = self._locate_records(fid, file_format)
 
-        fid = StringIO(data)
-        data_length = len(data)
-        self.version = 1000
+        if file_format == 'bin':
+            pre_structs, event_struct, post_structs = _bin_structs(self.version)
+            all_structs = pre_structs + event_struct + post_structs
+            sample_fmt = '<u2'
+        else:
+            pre_structs = all_structs = _bss_structs()
+            sample_fmt = '<i2'
+
+        chunks = np.array_split(starts, max(min(workers, len(starts)), 1))
+        chunk_outs = [None] * len(chunks)
+        image = None
+        if not lazy and not self._ragged:
+            lengths = _gather_fields(
+                fid, starts, pre_structs, ['num_pnts'])['num_pnts']
+            shape = (len(starts), lengths.max() if len(lengths) else 0)
+            if out is None:
+                image = self._allocate_image(shape)
+            else:
+                _check_out(out, shape, self.intensity_dtype)
+                image = out
+            if not processes:
+                bounds = np.cumsum([0] + [len(chunk) for chunk in chunks])
+                chunk_outs = [
+                    image[i:j] for i, j in zip(bounds[:-1], bounds[1:])]
+
+        # worker processes map the file themselves, threads share the mapping
+        source = None if processes else fid
+        jobs = [
+            (source, self.filepath, file_format, self.version, chunk, lazy,
+             self._ragged, self.intensity_dtype, chunk_out)
+            for chunk, chunk_out in zip(chunks, chunk_outs)
+        ]
+        if processes:
+            pool = multiprocessing.Pool(workers)
+        else:
+            pool = multiprocessing.pool.ThreadPool(workers)
+        try:
+            results = pool.map(_decode_chunk, jobs)
+        finally:
+            pool.terminate()
+            pool.join()
+
+        raw_trace = {}
+        for name in results[0][0]:
+            if name == 'event':
+                raw_trace[name] = list(itertools.chain.from_iterable(
+                    chunk_trace[name] for chunk_trace, _, _ in results))
+            else:
+                raw_trace[name] = np.concatenate(
+                    [chunk_trace[name] for chunk_trace, _, _ in results])
+        data_starts = np.concatenate(
+            [chunk_starts for _, chunk_starts, _ in results])
 
-        rec_structs = [
-            ('bss_size', 'H', np.uint32),
-            ('prev_record_size', 'L', np.uint32),
-            ('num_pnts', 'L', np.uint32),
-            ('time_tag', 'd', np.float32),
-            ('trace_num', 'L', np.uint32),
-            ('rate', 'L', np.uint32),
-            ('transducer', 'B', np.uint8),
-            ('bipolar', '?', np.bool_),
-            ('sats', 'b', np.int8),
-            ('hpr_status', 'B', np.uint8),
-            ('heave', 'f', np.float32),
-            ('pitch', 'f', np.float32),
-            ('roll', 'f', np.float32),
-            ('heading', 'f', np.float32),
-            ('course', 'f', np.float32),
-            ('kHz', 'f', np.float32),
-            ('draft', 'f', np.float32),
-            ('tide', 'f', np.float32),
-            ('antenna_el', 'f', np.float32),
-            ('blanking', 'f', np.float32),
-            ('window_min', 'f', np.float32),
-            ('window_max', 'f', np.float32),
-            ('xd_range', 'f', np.float32),
-            ('depth_r1', 'f', np.float32),
-            ('depth_r2', 'f', np.float32),
-            ('depth_r3', 'f', np.float32),
-            ('depth_r4', 'f', np.float32),
-            ('depth_r5', 'f', np.float32),
-            ('volts', 'f', np.float32),
-            ('longitude', 'd', np.float32),
-            ('latitude', 'd', np.float32),
-            ('x', 'd', np.float32),
-            ('y', 'd', np.float32),
-            ('hdop', 'f', np.float32),
-            ('cycles', 'b', np.int8),
-            ('power', 'b', np.int8),
-            ('gain', 'b', np.int8),
-            ('gps_mode', 'b', np.int8),
-            ('comment', '64s', np.string_),
-            ('select', 'B', np.uint8),
-            ('channel', 'B', np.uint8),
+        self.raw_trace = raw_trace
+        self.trace_metadata = self.process_raw_trace(
+            raw_trace, all_structs, file_format=file_format)
+        self._set_intensity_source(fid, data_starts, sample_fmt)
+        if lazy:
+            self.intensities = None
+            self.intensity_image = None
+            return
+
+        if self._ragged:
+            image = RaggedArray.concatenate(
+                [chunk_image for _, _, chunk_image in results])
+        elif processes:
+            # chunks are padded to their own longest trace
+            row = 0
+            for _, _, chunk_image in results:
+                rows = slice(row, row + len(chunk_image))
+                image[rows, :chunk_image.shape[1]] = chunk_image
+                image[rows, chunk_image.shape[1]:] = _padding_value(
+                    self.intensity_dtype)
+                row += len(chunk_image)
+
+        self.intensities = self._raw_intensities(
+            fid, data_starts, self.trace_metadata['num_pnts'], sample_fmt)
+        self.intensity_image = image
+        if self.stats is not None:
+            # the intensities are decoded along with the records, so their
+            # time is part of the records stage
+            self.stats.count(
+                'intensity',
+                bytes_read=2 * int(self.trace_metadata['num_pnts'].sum()))
+            self.stats.observe('intensity', image)
+
+    def _parse_fields(self, fid, file_format, fields, lazy=False, out=None):
+        """Alternative to the record parsers that only decodes the record
+        fields needed for `fields` (see parse()). The records are located
+        first (from the record index if it is available), then each of the
+        needed fields is gathered for all records at once using numpy
+        structured dtypes. Intensities are only decoded if 'intensity' is one
+        of the fields.
+        """
+        if file_format == 'bin':
+            pre_structs, event_struct, post_structs = _bin_structs(self.version)
+            all_structs = pre_structs + event_struct + post_structs
+            dependencies = dict(_BIN_FIELD_DEPENDENCIES)
+            for key in ['draft', 'tide']:
+                if key in [name for name, fmt, dtype in post_structs]:
+                    dependencies[key] = [key]
+            sample_fmt = '<u2'
+        else:
+            pre_structs = all_structs = _bss_structs()
+            post_structs = []
+            dependencies = _BSS_FIELD_DEPENDENCIES
+            sample_fmt = '<i2'
+
+        names = set(['transducer', 'kHz'])
+        for field in fields:
+            names.update(_field_dependencies(field, all_structs, dependencies))
+        with_intensity = 'intensity' in fields
+        if with_intensity:
+            names.update(['num_pnts', 'offset' if file_format == 'bin' else 'bss_size'])
+
+        index = self._cached_record_index(file_format)
+        if index is not None:
+            starts = index['start']
+        else:
+            starts, _ = self._locate_records(fid, file_format)
+
+        raw_trace = {}
+        pre_names = [name for name, fmt, dtype in pre_structs if name in names]
+        post_names = [name for name, fmt, dtype in post_structs if name in names]
+        if (file_format == 'bin' and 'event_len' not in pre_names and
+                (post_names or 'event' in names)):
+            pre_names.append('event_len')
+        if pre_names:
+            records = _gather_fields(fid, starts, pre_structs, pre_names)
+            for name in pre_names:
+                raw_trace[name] = records[name]
 
+        if file_format == 'bin':
+            pre_size = _record_dtype(pre_structs).itemsize
+            if 'event' in names:
+                event_len = raw_trace['event_len'].astype(np.int64)
+                events = [''] * len(starts)
+                for i in np.nonzero(event_len)[0]:
+                    event_start = starts[i] + pre_size
+                    events[i] = fid[event_start:event_start + event_len[i]]
+                raw_trace['event'] = events
+            if post_names:
+                post_starts = starts + pre_size + raw_trace['event_len']
+                records = _gather_fields(
+                    fid, post_starts, post_structs, post_names)
+                for name in post_names:
+                    raw_trace[name] = records[name]
+            if 'event_len' not in names:
+                raw_trace.pop('event_len', None)
+
+        structs = [
+            (name, fmt, dtype) for name, fmt, dtype in all_structs
+            if name in raw_trace
         ]
+        if self.stats is not None:
+            field_size = sum(
+                struct.calcsize('<' + fmt) for name, fmt, dtype in all_structs
+                if name in pre_names + post_names)
+            event_size = sum(len(event) for event in raw_trace.get('event', []))
+            self.stats.count(
+                'records', bytes_read=len(starts) * field_size + event_size)
+        self.raw_trace = raw_trace
+        self.trace_metadata = self.process_raw_trace(
+            raw_trace, structs, file_format=file_format)
+
+        if not with_intensity:
+            self._intensity_source = None
+            self.intensities = None
+            self.intensity_image = None
+            return
+
+        if file_format == 'bin':
+            data_starts = starts + raw_trace['offset'] + 2
+        else:
+            data_starts = starts + 2 + raw_trace['bss_size']
+        self._set_intensity_source(fid, data_starts, sample_fmt)
+        if lazy:
+            self.intensities = None
+            self.intensity_image = None
+        else:
+            self.intensities = self._raw_intensities(
+                fid, data_starts, raw_trace['num_pnts'], sample_fmt)
+            self.intensity_image = self._decode_intensity(out=out)
+
+    def parse_bss_records(self, fid, data_length, decode='struct', lazy=False,
+                          out=None):
+        self.version = 1000
+
+        rec_structs = _bss_structs()
+
+        if decode == 'struct' and self._cached_record_index('bss') is not None:
+            decode = 'vectorized'
+        if decode == 'vectorized':
+            return self._parse_bss_records_vectorized(
+                fid, data_length, rec_structs, lazy=lazy, out=out)
+        elif decode != 'struct':
+            raise ValueError("Unknown decode mode: %s" % decode)
 
         # intitialize dict of trace elements
         raw_trace = dict([
@@ -599,10 +1871,12 @@ class Dataset(object):
         ])
 
         trace_intensities = []
+        data_starts = []
 
         fmt, names, size = self._split_struct_list(rec_structs)
         npos = 372
         fid.seek(npos)
+        progress = self._progress
         while npos < data_length:
             record = struct.unpack(fmt, fid.read(size))
             record_dict = dict(zip(names, record))
@@ -612,25 +1886,214 @@ class Dataset(object):
             fid.seek(int(fid.tell()) + 6)
 
             data_size = record_dict['num_pnts']
-            intensity = struct.unpack(
-                '<' + str(data_size) + 'h', fid.read(data_size * 2))
-            trace_intensities.append(intensity)
-            npos = int(fid.tell())
-            self.raw_trace = raw_trace
-            self.intensity = intensity
+            data_pos = fid.tell()
+            data_starts.append(data_pos)
+            if not lazy:
+                intensity = np.frombuffer(
+                    fid, dtype='<i2', count=data_size, offset=data_pos)
+                trace_intensities.append(intensity)
+            npos = data_pos + data_size * 2
+            fid.seek(npos)
+            if progress is not None and len(data_starts) % PROGRESS_INTERVAL == 0:
+                self._report_progress('records', npos, data_length)
 
+        self.raw_trace = raw_trace
         self.trace_metadata = self.process_raw_trace(
             raw_trace, rec_structs, file_format='bss')
-        self.intensities = trace_intensities
+        self._set_intensity_source(fid, data_starts, '<i2')
+        if lazy:
+            self.intensities = None
+            self.intensity_image = None
+        else:
+            self.intensities = trace_intensities
+            self.intensity_image = self._decode_intensity(out=out)
+
+    def _parse_bss_records_vectorized(self, data, data_length, rec_structs,
+                                      lazy=False, out=None):
+        """Same as _parse_records_vectorized, for the records of a bss file.
+        Files where every record has the same number of samples, which is the
+        common case, are recognized from their first record and the record
+        starts are computed rather than scanned for.
+        """
+        index = self._cached_record_index('bss')
+        if index is not None:
+            starts = index['start']
+        else:
+            starts = _fixed_stride_bss_records(data, data_length, rec_structs)
+        if starts is None:
+            starts, _ = _scan_bss_records(
+                data, data_length, _record_dtype(rec_structs).itemsize)
+        raw_trace, data_starts = _decode_bss_records(data, starts, rec_structs)
+
         self.raw_trace = raw_trace
-        self.intensity_image = self._normalize_scale(
-            _fill_nans(trace_intensities))
+        self.trace_metadata = self.process_raw_trace(
+            raw_trace, rec_structs, file_format='bss')
+        self._set_intensity_source(data, data_starts, '<i2')
+        if lazy:
+            self.intensities = None
+            self.intensity_image = None
+        else:
+            self.intensities = self._raw_intensities(
+                data, data_starts, raw_trace['num_pnts'], '<i2')
+            self.intensity_image = self._decode_intensity(out=out)
+
+    def _decode_normalized(self, data, data_starts, lengths, sample_fmt,
+                           transducer=None, max_length=None, out=None):
+        """Returns the normalized intensities of the traces whose samples are
+        found at each of the byte positions in `data_starts`, as a RaggedArray
+        if the file is parsed with ragged=True or else as an image padded to
+        max_length (by default, the longest trace). The samples are gathered
+        and normalized a block of traces at a time, straight into the image
+        or the values of the RaggedArray (or into `out`), so no full size
+        temporaries are created.
+        """
+        if transducer is None:
+            transducer = self.trace_metadata['transducer']
+        if max_length is None:
+            max_length = lengths.max() if len(lengths) else 0
+        if self._ragged:
+            offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=offsets[1:])
+            out = RaggedArray(
+                np.empty(offsets[-1], dtype=self.intensity_dtype), offsets,
+                width=max_length)
+        else:
+            shape = (len(data_starts), int(max_length))
+            if out is None:
+                out = self._allocate_image(shape)
+            else:
+                _check_out(out, shape, self.intensity_dtype)
+
+        shift, divisor, bipolar = self._normalization(transducer)
+        byte_scale = self._byte_scale(bipolar)
+        if self._progress is not None:
+            def progress(done):
+                self._report_progress('intensity', done, len(data_starts))
+        else:
+            progress = None
+        block_size = self._block_size()
+        if self.max_memory is not None:
+            self._update_peak(transient=block_size * BLOCK_BYTES_PER_SAMPLE)
+        _normalize_samples(
+            data, data_starts, lengths, sample_fmt, shift, divisor,
+            byte_scale, out, progress=progress, block_size=block_size)
+        return out
+
+    def _unpad_intensities(self):
+        """Convert padded intensity images (as loaded from a dataset cache)
+        to RaggedArrays
+        """
+        self.intensity_image = RaggedArray.from_padded(
+            self.intensity_image, self.trace_metadata['num_pnts'])
+        for freq_dict in self.frequencies:
+            freq_dict['intensity'] = RaggedArray.from_padded(
+                freq_dict['intensity'], freq_dict['num_pnts'])
+
+    def _set_intensity_source(self, data, data_starts, sample_fmt):
+        """Remember where the intensity samples of each trace are stored, so
+        that they can be decoded later on
+        """
+        self._intensity_source = (
+            data,
+            np.asarray(data_starts, dtype=np.int64),
+            self.trace_metadata['num_pnts'].astype(np.int64),
+            sample_fmt,
+        )
+
+    def _decode_intensity(self, rows=None, out=None):
+        """Decode and normalize the intensities of the traces selected by the
+        index array `rows` (or all traces if rows is None) from the file. The
+        image is padded with NaNs to the length of the longest trace in the
+        file, so it matches the corresponding rows of the full image.
+        """
+        data, data_starts, lengths, sample_fmt = self._intensity_source
+        transducer = self.trace_metadata['transducer']
+        max_length = lengths.max() if len(lengths) else 0
+        if rows is not None:
+            data_starts = data_starts[rows]
+            lengths = lengths[rows]
+            transducer = transducer[rows]
+
+        with self._stage('intensity'):
+            image = self._decode_normalized(
+                data, data_starts, lengths, sample_fmt, transducer=transducer,
+                max_length=max_length, out=out)
+        if self.stats is not None:
+            self.stats.count('intensity', bytes_read=2 * int(lengths.sum()))
+            self.stats.observe('intensity', image)
+        return image
+
+    def _frequency_intensity(self, rows):
+        """Returns the intensities for the traces of a single frequency,
+        decoding only those traces unless the full image is already loaded
+        """
+        if self._intensity_image is None:
+            return self._decode_intensity(rows)
+        return self._image_rows(rows)
 
     def process_raw_trace(self, raw_trace, all_structs, file_format='bin'):
         """Clean up raw trace data - convert lists to appropriately typed
         np.arrays of uniform units (meters for distance values)
+
+        The fields that are derived from the raw fields (unit conversions,
+        GPS filtering and interpolation, pixel resolution, ...) are only
+        computed when they are first accessed, so the returned mapping holds
+        the raw fields and loaders for the derived ones.
         """
-        processed = {}
+        processed = self._convert_raw_trace(
+            raw_trace, all_structs, file_format=file_format)
+        self._set_position_fields(processed, file_format)
+        return processed
+
+    def _set_position_fields(self, processed, file_format='bin'):
+        """Replace the raw positions in `processed` with loaders for the GPS
+        filtered positions, and add loaders for the interpolated positions
+        """
+        if file_format == 'bin':
+            x_col = 'easting'
+            y_col = 'northing'
+        else:
+            x_col = 'x'
+            y_col = 'y'
+
+        for x_key, y_key in [('longitude', 'latitude'), (x_col, y_col)]:
+            if x_key in processed and y_key in processed:
+                raw_x = processed[x_key]
+                raw_y = processed[y_key]
+                if x_key == 'x':
+                    x_key = 'easting'
+                if y_key == 'y':
+                    y_key = 'northing'
+
+                # filter out bad values, once for both coordinates
+                filtered = {}
+                processed.set_lazy(
+                    x_key, self._filtered_position, filtered, raw_x, raw_y, 0)
+                processed.set_lazy(
+                    y_key, self._filtered_position, filtered, raw_x, raw_y, 1)
+
+                # interpolate values
+                processed.set_lazy(
+                    'interpolated_' + x_key, _interpolated, processed, x_key)
+                processed.set_lazy(
+                    'interpolated_' + y_key, _interpolated, processed, y_key)
+
+    def _filtered_position(self, filtered, raw_x, raw_y, i):
+        """Loader for the filtered x (i = 0) or y (i = 1) coordinates of a
+        track. The filtered coordinates are stored in the `filtered` dict the
+        first time, as both come out of the same call to filter_x_and_y.
+        """
+        if not filtered:
+            filtered['xy'] = self.filter_x_and_y(raw_x, raw_y)
+        return filtered['xy'][i]
+
+    def _convert_raw_trace(self, raw_trace, all_structs, file_format='bin'):
+        """The trace-by-trace part of process_raw_trace: converts raw trace
+        lists to typed np.arrays in uniform units, without the GPS processing
+        that depends on the whole track. Returns a _LazyDict, where the
+        converted fields are computed on first access.
+        """
+        processed = _LazyDict()
         # convert raw trace lists to arrays
         for key, value, dtype in all_structs:
             array = np.array(raw_trace[key], dtype=dtype)
@@ -648,69 +2111,63 @@ class Dataset(object):
             )
 
         if file_format == 'bin':
-            convert_to_meters = self.convert_to_meters_array(units)
-            keys_to_convert = [
-                'min_window',
-                'max_window',
-                'display_range',
-            ]
+            # when only some fields are decoded (see parse()), the raw fields
+            # that are not needed are missing
+            if 'units' in processed:
+                convert_to_meters = self.convert_to_meters_array(units)
 
             for raw_key in ['min_window10', 'max_window10']:
+                if raw_key not in processed:
+                    continue
                 array = processed.pop(raw_key)
                 new_key = raw_key[:-2]
-                processed[new_key] = array / 10.
+                processed.set_lazy(
+                    new_key, _convert_units, array, 10., convert_to_meters)
 
             for raw_key in ['draft100', 'tide100']:
+                if raw_key not in processed:
+                    continue
                 array = processed.pop(raw_key)
                 new_key = raw_key[:-3]
                 if new_key not in raw_trace.keys():
-                    keys_to_convert.append(new_key)
-                    processed[new_key] = array / 100.
+                    processed.set_lazy(
+                        new_key, _convert_units, array, 100., convert_to_meters)
 
-            for key in keys_to_convert:
-                processed[key] = processed[key] * convert_to_meters
+            if 'display_range' in processed:
+                processed.set_lazy(
+                    'display_range', _convert_units,
+                    processed['display_range'], None, convert_to_meters)
 
             # convert heave to meters
-            heave_cm = processed.pop('heave_cm')
-            processed['heave'] = heave_cm * 100.0
+            if 'heave_cm' in processed:
+                heave_cm = processed.pop('heave_cm')
+                processed.set_lazy(
+                    'heave', _convert_units, heave_cm, None, 100.0)
 
             # convert speed of sound to meters
-            convert_spdos = self.convert_to_meters_array(processed['spdos_units'])
-            processed['spdos'] = processed['spdos'] * convert_spdos
+            if 'spdos' in processed:
+                convert_spdos = self.convert_to_meters_array(
+                    processed['spdos_units'])
+                processed.set_lazy(
+                    'spdos', _convert_units, processed['spdos'], None,
+                    convert_spdos)
 
             # replace centiseconds with microseconds
-            processed['microsecond'] = processed['centisecond'].astype(np.uint32) * 10000
-            processed.pop('centisecond')
-
-            x_col = 'easting'
-            y_col = 'northing'
-        else:
-            processed['spdos'] = np.ones_like(processed['longitude']) * self.spdos
-            x_col = 'x'
-            y_col = 'y'
+            if 'centisecond' in processed:
+                processed.set_lazy(
+                    'microsecond', _microseconds, processed.pop('centisecond'))
+        elif 'longitude' in processed:
+            processed.set_lazy(
+                'spdos', _convert_units, processed['longitude'], None,
+                self.spdos, True)
         # calculate pixel resolution
-        processed['pixel_resolution'] = (processed['spdos'] * 1.0) / (2 * processed['rate'])
-
-        for x_key, y_key in [('longitude', 'latitude'), (x_col, y_col)]:
-            if x_key in processed and y_key in processed:
-                # filter out bad values
-                x, y = self.filter_x_and_y(
-                    processed[x_key], processed[y_key])
-                if x_key == 'x':
-                    x_key = 'easting'
-                if y_key == 'y':
-                    y_key = 'northing'
-
-                processed[x_key] = x
-                processed[y_key] = y
-
-                # interpolate values
-                processed['interpolated_' + x_key] = _interpolate_repeats(x)
-                processed['interpolated_' + y_key] = _interpolate_repeats(y)
+        if 'spdos' in processed and 'rate' in processed:
+            processed.set_lazy(
+                'pixel_resolution', _pixel_resolution, processed)
 
         return processed
 
-    def _normalize_scale(self, intensity_image):
+    def _normalize_scale(self, intensity_image, transducer=None):
         """
         Normalize and rescale trace intensities to [0, 1]
 
@@ -740,15 +2197,73 @@ class Dataset(object):
                   if(DataValue < MinValue) then MinValue := DataValue;
                 end;
             end;
+
+        `intensity_image` may also be a RaggedArray, which is normalized a
+        block of rows at a time (see _normalize_samples) and returned as a
+        RaggedArray with the same rows.
+
+        The result is converted to intensity_dtype. For 'uint8', the
+        normalized values are mapped back onto the byte values of the Pascal
+        code: unipolar values are multiplied by 255 (RawPnts/257) and bipolar
+        values by 256 (|RawPnts - 32768|/128), then rounded and clipped to
+        255. The NaN padding of short traces becomes 0.
+        """
+        if transducer is None:
+            transducer = self.trace_metadata['transducer']
+        if isinstance(intensity_image, RaggedArray):
+            values = np.ascontiguousarray(intensity_image.values)
+            out = intensity_image.with_values(
+                np.empty(len(values), dtype=self.intensity_dtype))
+            shift, divisor, bipolar = self._normalization(transducer)
+            _normalize_samples(
+                values.view(np.uint8),
+                intensity_image.offsets[:-1] * values.itemsize,
+                intensity_image.lengths, values.dtype, shift, divisor,
+                self._byte_scale(bipolar), out)
+            return out
+
+        shift, divisor, bipolar = self._normalization(transducer)
+        scaled_image = np.abs(
+            intensity_image + shift[:, np.newaxis]) / divisor[:, np.newaxis]
+        return self._convert_intensity_dtype(scaled_image, bipolar)
+
+    def _normalization(self, transducer):
+        """Returns a tuple of (shift, divisor, bipolar) arrays, with one
+        element per trace, such that the normalized intensities of a trace
+        are |samples + shift| / divisor. bipolar tells which traces hold
+        bipolar data. See _normalize_scale.
         """
         if (self.version >= '5.0' or self.version == 1000):
-            return np.abs(intensity_image + np.float(32768))/np.float64(65535)
+            bipolar = np.zeros(len(transducer), dtype=bool)
+            shift = np.empty(len(transducer))
+            shift.fill(32768)
+            divisor = np.empty(len(transducer))
+            divisor.fill(65535)
         else:
-            index_200khz = self.raw_trace['transducer']==1
-            scaled_image = np.zeros_like(intensity_image)
-            scaled_image[index_200khz,:] = intensity_image[index_200khz,:]/np.float64(65535)
-            scaled_image[~index_200khz,:] = np.abs(intensity_image[~index_200khz,:] - np.float64(32768))/np.float64(32768)
-            return scaled_image
+            bipolar = transducer != 1
+            shift = np.where(bipolar, -32768., 0.)
+            divisor = np.where(bipolar, 32768., 65535.)
+        return shift, divisor, bipolar
+
+    def _byte_scale(self, bipolar):
+        """Returns the per-trace factors that map normalized intensities onto
+        byte values if intensity_dtype is uint8, otherwise None. See
+        _normalize_scale.
+        """
+        if self.intensity_dtype == np.uint8:
+            return np.where(bipolar, 256., 255.)
+        return None
+
+    def _convert_intensity_dtype(self, scaled_image, bipolar):
+        """Convert a normalized float64 image to intensity_dtype. `bipolar`
+        is a boolean array telling which rows were normalized as bipolar data.
+        """
+        if self.intensity_dtype == np.uint8:
+            scale = np.where(bipolar, 256., 255.)[:, np.newaxis]
+            quantized = np.round(scaled_image * scale)
+            quantized[np.isnan(quantized)] = 0
+            return np.clip(quantized, 0, 255).astype(np.uint8)
+        return scaled_image.astype(self.intensity_dtype, copy=False)
 
     def _split_struct_list(self, struct_list):
         """Helper method for splitting struct lists into components for
@@ -765,6 +2280,707 @@ class Dataset(object):
         return fmt, names, size
 
 
+class _LazyDict(collections.MutableMapping):
+    """A dict-like mapping where some values are only computed, by calling a
+    loader function, the first time they are accessed. Computed values are
+    memoized.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._data = dict(*args, **kwargs)
+        self._loaders = {}
+
+    def set_lazy(self, key, loader, *args):
+        """Set the value of `key` to be computed as loader(*args)"""
+        self._data.pop(key, None)
+        self._loaders[key] = (loader, args)
+
+    def __getitem__(self, key):
+        if key in self._loaders:
+            loader, args = self._loaders.pop(key)
+            self._data[key] = loader(*args)
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        self._loaders.pop(key, None)
+        self._data[key] = value
+
+    def __delitem__(self, key):
+        if key in self._loaders:
+            del self._loaders[key]
+        else:
+            del self._data[key]
+
+    def is_lazy(self, key):
+        """Returns True if the value of `key` hasn't been computed yet"""
+        return key in self._loaders
+
+    def __contains__(self, key):
+        return key in self._data or key in self._loaders
+
+    def __iter__(self):
+        # iterate over a copy of the keys, as looking up a lazy value while
+        # iterating moves it from the loaders to the data
+        return iter(list(self._data) + list(self._loaders))
+
+    def __len__(self):
+        return len(self._data) + len(self._loaders)
+
+    def __repr__(self):
+        return '%s(%r, lazy=%r)' % (
+            self.__class__.__name__, self._data, sorted(self._loaders))
+
+
+# largest number of samples in a bss record
+MAX_BSS_SAMPLES = 65536
+
+# number of records decoded between calls to the progress callback of parse()
+PROGRESS_INTERVAL = 1000
+
+# number of records at the start of a file that Dataset.summary() reads in
+# full, so that every frequency of a ping cycle is sampled
+SUMMARY_LEADING_RECORDS = 20
+
+# dtypes of the normalized intensities that parse() can produce
+INTENSITY_DTYPES = [np.dtype(np.float64), np.dtype(np.float32), np.dtype(np.uint8)]
+
+
+def _padding_value(dtype):
+    """Returns the value that pads short traces in an image of dtype"""
+    if np.issubdtype(dtype, np.floating):
+        return np.nan
+    return 0
+
+
+def _max_rss():
+    """Returns the peak resident memory of this process in bytes, or None
+    if it isn't available
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on OS X
+    if sys.platform == 'darwin':
+        return max_rss
+    return max_rss * 1024
+
+
+def _decode_chunk(job):
+    """Decode one chunk of records for Dataset._parse_records_parallel.
+    Returns a tuple of (raw_trace, data_starts, intensity_image) where the
+    intensity image is normalized and padded with NaNs to the longest trace of
+    the chunk, or None if the chunk is decoded lazily.
+    """
+    (data, filepath, file_format, version, starts, lazy, ragged,
+     intensity_dtype, out) = job
+    if data is None:
+        data = _map_file(filepath)
+    dataset = Dataset(filepath)
+    dataset.version = version
+    dataset._ragged = ragged
+    dataset.intensity_dtype = intensity_dtype
+
+    raw_trace, data_starts, all_structs, sample_fmt = dataset._decode_records(
+        data, starts, file_format)
+    if lazy:
+        return raw_trace, data_starts, None
+
+    image = dataset._decode_normalized(
+        data, data_starts, raw_trace['num_pnts'].astype(np.int64), sample_fmt,
+        transducer=raw_trace['transducer'],
+        max_length=None if out is None else out.shape[1], out=out)
+    return raw_trace, data_starts, None if out is not None else image
+
+
+def _reserve_rows(buffer, count, extra, row_shape, dtype, fill_value=0):
+    """Returns an array of `dtype` with rows of `row_shape` and room for at
+    least count + extra rows, whose first `count` rows are those of buffer.
+    buffer itself is returned if it is large enough, otherwise a new array is
+    allocated with (at least) twice its capacity, so appending rows one block
+    at a time only copies a number of rows proportional to the final size.
+    Rows of a narrower buffer are padded with fill_value.
+    """
+    row_shape = tuple(row_shape)
+    if (buffer is not None and count + extra <= len(buffer) and
+            buffer.shape[1:] == row_shape and buffer.dtype == dtype):
+        return buffer
+
+    capacity = count + extra
+    if buffer is not None:
+        capacity = max(capacity, 2 * len(buffer))
+    new_buffer = np.empty((capacity,) + row_shape, dtype=dtype)
+    if buffer is not None and count:
+        if row_shape:
+            width = buffer.shape[1]
+            new_buffer[:count, :width] = buffer[:count]
+            new_buffer[:count, width:] = fill_value
+        else:
+            new_buffer[:count] = buffer[:count]
+    return new_buffer
+
+
+def _convert_units(array, divisor, factor, constant=False):
+    """Loader for unit-converted trace fields: returns array / divisor (or
+    array, if divisor is None) times factor. If constant is True, array is
+    only used for its shape and dtype, and the result is filled with factor.
+    """
+    if constant:
+        array = np.ones_like(array)
+    if divisor is not None:
+        array = array / divisor
+    return array * factor
+
+
+def _microseconds(centisecond):
+    """Loader for the microsecond trace field"""
+    return centisecond.astype(np.uint32) * 10000
+
+
+def _pixel_resolution(processed):
+    """Loader for the pixel_resolution trace field"""
+    return (processed['spdos'] * 1.0) / (2 * processed['rate'])
+
+
+def _interpolated(processed, key):
+    """Loader for the interpolated_* trace fields"""
+    return _interpolate_repeats(processed[key])
+
+
+def _select_rows(mapping, key, rows):
+    """Loader for fields of the frequency dicts, selecting the rows of a
+    frequency from a (lazily computed) trace field
+    """
+    return mapping[key][rows]
+
+
+def _map_file(filepath):
+    """Returns a read-only memory map of the contents of a file. The map
+    supports the file methods (seek, read, tell) used by the header parsers
+    as well as the buffer interface used by np.frombuffer.
+    """
+    with open(filepath, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+# numpy equivalents of the (little-endian) struct format characters used to
+# describe record layouts
+_FORMAT_DTYPES = {
+    '?': '?',
+    'b': '<i1',
+    'B': '<u1',
+    'h': '<i2',
+    'H': '<u2',
+    'l': '<i4',
+    'L': '<u4',
+    'f': '<f4',
+    'd': '<f8',
+}
+
+
+def _bin_structs(version):
+    """Returns the (pre_structs, event_struct, post_structs) lists describing
+    the record header layout of a bin file of a given version. Each element of
+    the lists is a tuple of (name, struct format, numpy dtype).
+    """
+    pre_structs = [
+        ('offset', 'H', np.uint16),
+        ('trace_num', 'l', np.int32),
+        ('units', 'B', np.uint8),
+        ('spdos_units', 'B', np.uint8),
+        ('spdos', 'h', np.int16),
+        ('min_window10', 'h', np.int16),
+        ('max_window10', 'h', np.int16),
+        ('draft100', 'h', np.int16),
+        ('tide100', 'h', np.int16),
+        ('heave_cm', 'h', np.int16),
+        ('display_range', 'h', np.int16),
+        ('depth_r1', 'f', np.float32),
+        ('min_pnt_r1', 'f', np.float32),
+        ('num_pnt_r1', 'f', np.float32),
+        ('blanking_pnt', 'h', np.int16),
+        ('depth_pnt','h', np.int16),
+        ('range_pnt','h', np.int16),
+        ('num_pnts','h', np.int16),
+        ('clock', 'l', np.int32),
+        ('hour', 'B', np.uint8),
+        ('minute', 'B', np.uint8),
+        ('second', 'B', np.uint8),
+        ('centisecond', 'B', np.uint8),
+        ('rate', 'l', np.int32),
+        ('kHz', 'f', np.float32),
+        ('event_len', 'B', np.uint8),
+    ]
+    event_struct = [('event', None, None)]
+    post_structs = [
+        ('longitude', 'd', np.float64),
+        ('latitude', 'd', np.float64),
+        ('transducer', 'B', np.uint8),
+        ('options', 'B', np.uint8),
+        ('data_offset', 'B', np.uint8),
+    ]
+    if version >= '3.3':
+        post_structs.append(('easting', 'd', np.float64))
+        post_structs.append(('northing', 'd', np.float64))
+    if version >= '4.0':
+        post_structs.append(('cycles', 'B', np.uint8))
+        post_structs.append(('volts', 'B', np.uint8))
+        post_structs.append(('power', 'B', np.uint8))
+        post_structs.append(('gain', 'B', np.uint8))
+        post_structs.append(('previous_offset', 'H', np.int16))
+    if version >= '4.2':
+        post_structs.append(('antenna_e1', 'f', np.float32))
+        post_structs.append(('antenna_ht', 'f', np.float32))
+        post_structs.append(('draft', 'f', np.float32))
+        post_structs.append(('tide', 'f', np.float32))
+    if version >= '4.3':
+        post_structs.append(('gps_mode', 'b', np.int16))
+        post_structs.append(('hdop', 'f', np.float32))
+
+    return pre_structs, event_struct, post_structs
+
+
+# raw record fields needed to compute each of the trace fields that are not
+# returned as they are decoded (see Dataset.parse with fields); the others
+# only need themselves
+_BIN_FIELD_DEPENDENCIES = {
+    'min_window': ['min_window10', 'units'],
+    'max_window': ['max_window10', 'units'],
+    'draft': ['draft100', 'units'],
+    'tide': ['tide100', 'units'],
+    'display_range': ['display_range', 'units'],
+    'heave': ['heave_cm'],
+    'spdos': ['spdos', 'spdos_units'],
+    'microsecond': ['centisecond'],
+    'pixel_resolution': ['spdos', 'spdos_units', 'rate'],
+    'longitude': ['longitude', 'latitude'],
+    'latitude': ['longitude', 'latitude'],
+    'easting': ['easting', 'northing'],
+    'northing': ['easting', 'northing'],
+    'interpolated_longitude': ['longitude', 'latitude'],
+    'interpolated_latitude': ['longitude', 'latitude'],
+    'interpolated_easting': ['easting', 'northing'],
+    'interpolated_northing': ['easting', 'northing'],
+    'intensity': [],
+    # replaced by the converted fields above
+    'min_window10': None,
+    'max_window10': None,
+    'draft100': None,
+    'tide100': None,
+    'heave_cm': None,
+    'centisecond': None,
+}
+
+_BSS_FIELD_DEPENDENCIES = {
+    'spdos': ['longitude'],
+    'pixel_resolution': ['longitude', 'rate'],
+    'depth_r1': ['depth_r1', 'draft'],
+    'longitude': ['longitude', 'latitude'],
+    'latitude': ['longitude', 'latitude'],
+    'easting': ['x', 'y'],
+    'northing': ['x', 'y'],
+    'interpolated_longitude': ['longitude', 'latitude'],
+    'interpolated_latitude': ['longitude', 'latitude'],
+    'interpolated_easting': ['x', 'y'],
+    'interpolated_northing': ['x', 'y'],
+    'intensity': [],
+}
+
+
+def _field_dependencies(field, struct_list, dependencies):
+    """Returns the names of the raw record fields of `struct_list` that are
+    needed to compute the trace field `field`. Raises a ValueError if the
+    field isn't available in the file.
+    """
+    raw_names = [name for name, fmt, dtype in struct_list]
+    if field in dependencies:
+        names = dependencies[field]
+    elif field in raw_names:
+        names = [field]
+    else:
+        names = None
+    if names is None or not set(names).issubset(raw_names):
+        raise ValueError("Unknown field: %s" % field)
+    return names
+
+
+# size of the bss file header, including its HeaderSize preamble
+BSS_HEADER_SIZE = 372
+
+# bytes reserved at the end of each TBssRec, which are not in _bss_structs
+BSS_RESERVED_SIZE = 6
+
+
+def _bss_structs():
+    """Returns the struct list describing the TBssRec record header of a bss
+    file (preceded by its BssSize preamble and without the trailing reserved
+    bytes). Each element of the list is a tuple of (name, struct format,
+    numpy dtype).
+    """
+    return [
+        ('bss_size', 'H', np.uint32),
+        ('prev_record_size', 'L', np.uint32),
+        ('num_pnts', 'L', np.uint32),
+        ('time_tag', 'd', np.float32),
+        ('trace_num', 'L', np.uint32),
+        ('rate', 'L', np.uint32),
+        ('transducer', 'B', np.uint8),
+        ('bipolar', '?', np.bool_),
+        ('sats', 'b', np.int8),
+        ('hpr_status', 'B', np.uint8),
+        ('heave', 'f', np.float32),
+        ('pitch', 'f', np.float32),
+        ('roll', 'f', np.float32),
+        ('heading', 'f', np.float32),
+        ('course', 'f', np.float32),
+        ('kHz', 'f', np.float32),
+        ('draft', 'f', np.float32),
+        ('tide', 'f', np.float32),
+        ('antenna_el', 'f', np.float32),
+        ('blanking', 'f', np.float32),
+        ('window_min', 'f', np.float32),
+        ('window_max', 'f', np.float32),
+        ('xd_range', 'f', np.float32),
+        ('depth_r1', 'f', np.float32),
+        ('depth_r2', 'f', np.float32),
+        ('depth_r3', 'f', np.float32),
+        ('depth_r4', 'f', np.float32),
+        ('depth_r5', 'f', np.float32),
+        ('volts', 'f', np.float32),
+        ('longitude', 'd', np.float32),
+        ('latitude', 'd', np.float32),
+        ('x', 'd', np.float32),
+        ('y', 'd', np.float32),
+        ('hdop', 'f', np.float32),
+        ('cycles', 'b', np.int8),
+        ('power', 'b', np.int8),
+        ('gain', 'b', np.int8),
+        ('gps_mode', 'b', np.int8),
+        ('comment', '64s', np.string_),
+        ('select', 'B', np.uint8),
+        ('channel', 'B', np.uint8),
+    ]
+
+
+def _record_dtype(struct_list):
+    """Returns a packed numpy structured dtype with the same memory layout as
+    the struct format of a struct list, so that a block of records can be
+    decoded with a single array view instead of one struct.unpack per record.
+    """
+    fields = []
+    for name, fmt, dtype in struct_list:
+        if fmt.endswith('s'):
+            fields.append((name, 'S' + fmt[:-1]))
+        else:
+            fields.append((name, _FORMAT_DTYPES[fmt]))
+    return np.dtype(fields)
+
+
+def _scan_bin_records(data, data_length, min_record_size, npos=12,
+                      max_records=None):
+    """Returns a tuple of (starts, npos) where starts is an array of the byte
+    positions at which each record of a bin file starts, beginning at byte
+    `npos` and stopping after `max_records` records if given, and npos is the
+    position following the last record found. Only the offset and num_pnts
+    fields of each record are read, which is enough to hop from one record to
+    the next. A trailing record that was cut short is dropped with a warning.
+    """
+    unpack_from = struct.Struct('<H38xh').unpack_from
+
+    def record_end(npos):
+        offset, num_pnts = unpack_from(data, npos)
+        return npos + offset + 2 + 2 * num_pnts
+
+    return _scan_records(
+        record_end, data_length, min_record_size, npos, max_records)
+
+
+def _scan_bss_records(data, data_length, min_record_size, npos=372,
+                      max_records=None):
+    """Same as _scan_bin_records, but for the records of a bss file, which
+    consist of the BssSize preamble, the TBssRec header and the samples.
+    """
+    unpack_from = struct.Struct('<H4xL').unpack_from
+
+    def record_end(npos):
+        bss_size, num_pnts = unpack_from(data, npos)
+        return npos + 2 + bss_size + 2 * num_pnts
+
+    return _scan_records(
+        record_end, data_length, min_record_size, npos, max_records)
+
+
+def _fixed_stride_bss_records(data, data_length, rec_structs, npos=372):
+    """Returns the byte positions at which each record of a bss file starts,
+    beginning at byte `npos`, if all of the records have the same size as the
+    first one, otherwise None. The starts are computed from the size of the
+    first record and then checked against the BssSize, NumPoints and
+    PrevRecordSize fields of every record.
+    """
+    min_record_size = _record_dtype(rec_structs).itemsize
+    if npos + min_record_size > data_length:
+        return None
+    bss_size, num_pnts = struct.unpack_from('<H4xL', data, npos)
+    stride = 2 + bss_size + 2 * num_pnts
+    if stride < min_record_size or (data_length - npos) % stride:
+        return None
+
+    starts = np.arange(npos, data_length, stride, dtype=np.int64)
+    records = _gather_fields(
+        data, starts, rec_structs, ['bss_size', 'prev_record_size', 'num_pnts'])
+    if (np.any(records['bss_size'] != bss_size) or
+            np.any(records['num_pnts'] != num_pnts) or
+            np.any(records['prev_record_size'][1:] != stride)):
+        return None
+    return starts
+
+
+def _find_last_bss_record(data, data_length, rec_structs, npos=372):
+    """Returns the byte position at which the last complete record of a bss
+    file starts, or None if the file has no complete records, without
+    scanning the file from the start. Every position within reach of the end
+    of the file for a record of the largest possible size is a candidate,
+    and the last candidate that holds a record header of the same size as
+    the first record of the file, ends within the file and is linked back by
+    its PrevRecordSize to a record that ends where it starts (or is the
+    first record) is picked. A trailing record that was cut short is ignored
+    with a warning.
+    """
+    min_record_size = _record_dtype(rec_structs).itemsize
+    if npos + min_record_size > data_length:
+        return None
+    bss_size = struct.unpack_from('<H', data, npos)[0]
+
+    max_record_size = 2 * (2 + bss_size + 2 * MAX_BSS_SAMPLES)
+    positions = np.arange(
+        max(npos, data_length - max_record_size),
+        data_length - min_record_size + 1, dtype=np.int64)
+    names = ['bss_size', 'prev_record_size', 'num_pnts']
+    records = _gather_fields(data, positions, rec_structs, names)
+    ends = positions + 2 + records['bss_size'] + 2 * records['num_pnts'].astype(np.int64)
+    candidates = np.nonzero(
+        (records['bss_size'] == bss_size) & (ends <= data_length))[0]
+
+    for i in candidates[::-1]:
+        start = positions[i]
+        prev_record_size = int(records['prev_record_size'][i])
+        if prev_record_size == 0:
+            if start != npos:
+                continue
+        else:
+            prev_start = start - prev_record_size
+            if prev_start < npos:
+                continue
+            prev_bss_size, prev_num_pnts = struct.unpack_from(
+                '<H4xL', data, prev_start)
+            if (prev_bss_size != bss_size or
+                    prev_start + 2 + bss_size + 2 * prev_num_pnts != start):
+                continue
+        if ends[i] < data_length:
+            warnings.warn("Ignoring incomplete record at end of file")
+        return start
+    return None
+
+
+def _scan_records(record_end, data_length, min_record_size, npos,
+                  max_records):
+    """Hops from record to record, using a function that returns where the
+    record starting at a given position ends. See _scan_bin_records.
+    """
+    starts = []
+    while npos + min_record_size <= data_length:
+        if max_records is not None and len(starts) == max_records:
+            return np.array(starts, dtype=np.int64), npos
+        end = record_end(npos)
+        if end > data_length:
+            break
+        starts.append(npos)
+        npos = end
+
+    if npos < data_length:
+        warnings.warn("Ignoring incomplete record at end of file")
+
+    return np.array(starts, dtype=np.int64), npos
+
+
+def _gather_fields(data, starts, struct_list, names):
+    """Like _gather_records for records laid out as in `struct_list`, but
+    returns only the fields listed in `names`, and only copies the bytes of
+    each record spanned by those fields.
+    """
+    dtype = _record_dtype(struct_list)
+    offsets = [dtype.fields[name][1] for name in names]
+    first = min(offsets)
+    end = max(
+        dtype.fields[name][1] + dtype.fields[name][0].itemsize
+        for name in names)
+    sub_dtype = np.dtype({
+        'names': names,
+        'formats': [dtype.fields[name][0] for name in names],
+        'offsets': [offset - first for offset in offsets],
+        'itemsize': end - first,
+    })
+    return _gather_records(data, starts + first, sub_dtype)
+
+
+def _decode_bin_records(data, starts, pre_structs, post_structs):
+    """Decodes the headers of the bin file records starting at each of the
+    byte positions in `starts`. The fields before and after the
+    variable-length event string are decoded for all records at once using
+    numpy structured dtypes. Returns a tuple of (raw_trace, data_starts) where
+    raw_trace maps field names to arrays (and 'event' to a list of strings)
+    and data_starts are the positions of the intensity samples.
+    """
+    pre_dtype = _record_dtype(pre_structs)
+    post_dtype = _record_dtype(post_structs)
+    pre_records = _gather_records(data, starts, pre_dtype)
+
+    event_len = pre_records['event_len'].astype(np.int64)
+    events = [''] * len(starts)
+    for i in np.nonzero(event_len)[0]:
+        event_start = starts[i] + pre_dtype.itemsize
+        events[i] = data[event_start:event_start + event_len[i]]
+
+    post_starts = starts + pre_dtype.itemsize + event_len
+    post_records = _gather_records(data, post_starts, post_dtype)
+
+    raw_trace = {'event': events}
+    for name, fmt, dtype in pre_structs:
+        raw_trace[name] = pre_records[name]
+    for name, fmt, dtype in post_structs:
+        raw_trace[name] = post_records[name]
+
+    data_starts = starts + pre_records['offset'] + 2
+    return raw_trace, data_starts
+
+
+def _decode_bss_records(data, starts, rec_structs):
+    """Same as _decode_bin_records, for the records of a bss file"""
+    records = _gather_records(data, starts, _record_dtype(rec_structs))
+    raw_trace = dict(
+        (name, records[name]) for name, fmt, dtype in rec_structs)
+    data_starts = starts + 2 + records['bss_size']
+    return raw_trace, data_starts
+
+
+def _gather_records(data, starts, dtype):
+    """Returns a structured array of `dtype` containing the records that begin
+    at each of the byte positions in `starts`. The data is viewed as a
+    sequence of (overlapping) records beginning at every byte, so picking out
+    the records only copies the bytes that are actually needed.
+    """
+    windows = np.ndarray(
+        shape=(max(len(data) - dtype.itemsize + 1, 0),),
+        dtype=dtype,
+        buffer=data,
+        strides=(1,),
+    )
+    return windows[starts]
+
+
+# number of samples normalized at a time by _normalize_samples
+NORMALIZE_BLOCK_SIZE = 2 ** 20
+
+# smallest block of samples normalized at a time within a memory budget
+MIN_BLOCK_SIZE = 2 ** 12
+
+# bytes of the temporaries of each sample of a block: the 16 bit sample and
+# its float64 copy
+BLOCK_BYTES_PER_SAMPLE = 10
+
+
+def _normalize_samples(data, starts, lengths, sample_fmt, shift, divisor,
+                       byte_scale, out, progress=None,
+                       block_size=NORMALIZE_BLOCK_SIZE):
+    """Gathers the samples (of `sample_fmt`) found at each of the byte
+    positions in `starts` and writes them to the rows of `out`, normalized as
+    |samples + shift| / divisor with the per-trace shift and divisor arrays. If
+    byte_scale is given, the normalized values are then multiplied by it,
+    rounded and clipped to [0, 255]. `out` is a 2-d image, whose rows shorter
+    than its width are padded with NaNs (or zeros for integer dtypes), or a
+    RaggedArray with rows of the same lengths as the traces. Traces of the same
+    length are processed in blocks of about `block_size` samples, so the only
+    temporaries are the samples of one block and their float64 copy. If
+    `progress` is given, it is called with the number of rows done after each
+    block.
+    """
+    ragged = isinstance(out, RaggedArray)
+    padding = _padding_value(out.dtype)
+    done = 0
+    for length in np.unique(lengths):
+        length = int(length)
+        rows = np.nonzero(lengths == length)[0]
+        if not ragged:
+            out[rows, length:] = padding
+        if length == 0:
+            done += len(rows)
+            continue
+
+        sample_dtype = np.dtype((sample_fmt, (length,)))
+        block_rows = max(block_size // length, 1)
+        for i in range(0, len(rows), block_rows):
+            block = rows[i:i + block_rows]
+            values = _gather_records(data, starts[block], sample_dtype).astype(
+                np.float64)
+            values += shift[block, np.newaxis]
+            np.abs(values, out=values)
+            values /= divisor[block, np.newaxis]
+            if byte_scale is not None:
+                values *= byte_scale[block, np.newaxis]
+                np.round(values, out=values)
+                np.clip(values, 0, 255, out=values)
+            if ragged:
+                positions = (out.offsets[block, np.newaxis] +
+                             np.arange(length))
+                out.values[positions] = values
+            else:
+                out[block, :length] = values
+            done += len(block)
+            if progress is not None:
+                progress(done)
+
+
+def _sample_views(data, data_starts, lengths, sample_fmt):
+    """Returns a list of arrays viewing the samples of each trace in data"""
+    return [
+        np.frombuffer(data, dtype=sample_fmt, count=length, offset=start)
+        for start, length in zip(data_starts, lengths)
+    ]
+
+
+def _check_out(out, shape, dtype):
+    """Raise a ValueError unless `out` is an array of shape and dtype"""
+    if out.shape != tuple(shape) or out.dtype != dtype:
+        raise ValueError(
+            "out must be an array of shape %s and dtype %s, not %s and %s" %
+            (tuple(shape), dtype, out.shape, out.dtype))
+
+
+def _time_tag(dt):
+    """Converts a datetime to days since 12/30/1899, the time format of the
+    TimeTag fields of bss files
+    """
+    delta = dt - datetime(1899, 12, 30)
+    return delta.days + (delta.seconds + delta.microseconds / 1e6) / 86400.
+
+
+def _time_tag_datetime(time_tag):
+    """Converts days since 12/30/1899 (see _time_tag) to a datetime"""
+    return datetime(1899, 12, 30) + timedelta(days=float(time_tag))
+
+
+def _clock_time_tag(day, fields):
+    """Returns the time tags (see _time_tag) of bin records recorded on
+    `day`, from their hour, minute, second and centisecond fields
+    """
+    seconds = (fields['hour'] * 3600. +
+               fields['minute'] * 60. +
+               fields['second'] +
+               fields['centisecond'] / 100.)
+    # the clock restarts at midnight if recording carries on past it
+    days = np.cumsum(np.hstack([0, np.diff(seconds) < -43200]))
+    return _time_tag(datetime.combine(day, time())) + days + seconds / 86400.
+
+
 def _deduplicate(arr):
     """given an array, returns a tuple containing values that are not repeated
     and the indexes to those values from the original array
@@ -847,22 +3063,44 @@ def _fill_nans_with_last(arr):
     non-NaN value was. If the array starts with NaN values, then those will be
     set to the first non-NaN value.
     """
-    tmp = arr.copy()
-
-    # if the array starts with a NaN, then replace it with the first non-NaN
-    mask = np.isnan(tmp)
-    if len(tmp) == 0 or np.all(mask):
+    mask = np.isnan(arr)
+    if len(arr) == 0 or np.all(mask):
         raise ValueError("Array must contain some non-NaN values.")
-    if mask[0]:
-        tmp[0] = tmp[~mask][0]
-
-    # there's probably a more efficient way to do this; this loops as many
-    # times as the longest string of NaNs
-    while True:
-        mask = np.isnan(tmp)
-        if not np.any(mask):
-            break
-        nan_index = np.where(mask)[0]
-        tmp[nan_index] = tmp[nan_index - 1]
 
-    return tmp
+    # index of the last non-NaN value at or before each position
+    last_index = np.where(mask, 0, np.arange(len(arr)))
+    np.maximum.accumulate(last_index, out=last_index)
+
+    # leading NaNs have no previous value, use the first non-NaN instead
+    first = np.argmin(mask)
+    last_index[:first] = first
+
+    return arr[last_index]
+
+
+def _gps_outliers(original_x, original_y):
+    """Returns a tuple of (x, y, out_mask) where x and y are the positions in
+    original_x and original_y at which either value changes, and out_mask
+    flags the positions that are outliers, being further from the median
+    than 7 standard deviations (or 5, if the values span more than 200 units).
+    """
+    _, x_dedup_idx = _deduplicate(original_x)
+    _, y_dedup_idx = _deduplicate(original_y)
+
+    dedup_idx = np.union1d(x_dedup_idx, y_dedup_idx)
+    x = original_x[dedup_idx]
+    y = original_y[dedup_idx]
+
+    if (x.max() - x.min()) <= 200:
+        x_std_factor = 7
+    else:
+        x_std_factor = 5
+
+    if (y.max() - y.min()) <= 200:
+        y_std_factor = 7
+    else:
+        y_std_factor = 5
+    x_out = np.abs(x - np.median(x)) > x_std_factor * x.std()
+    y_out = np.abs(y - np.median(y)) > y_std_factor * y.std()
+
+    return x, y, x_out | y_out
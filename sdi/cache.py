@@ -0,0 +1,236 @@
+"""
+On-disk cache of parsed datasets. Re-reading a file that is already in the
+cache only costs loading its arrays, instead of decoding the records, GPS
+filtering and interpolating the track and normalizing the intensities again.
+
+Each cache entry is a directory holding one .npy file per array, so arrays
+can be memory mapped on load, plus a small pickle of the file-wide
+attributes. Entries are keyed by a fingerprint of the data file (its size,
+modification time and a hash of its first and last bytes), the file format,
+the parser version of the Dataset class, the dtype of the intensities and the
+selected fields, so entries are never reused after the file or the parser
+changes. When the cache
+grows beyond its maximum size, the least recently used entries are removed.
+"""
+import cPickle as pickle
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+# number of bytes at the start and at the end of a data file that are hashed
+# into its fingerprint
+FINGERPRINT_SIZE = 65536
+
+# file-wide attributes of a Dataset that are stored in the cache
+ATTRIBUTES = [
+    'version',
+    'survey_line_number',
+    'resolution_cm',
+    'date',
+    'spdos',
+    'units',
+    'start_datetime',
+    'end_datetime',
+]
+
+META_FILENAME = 'meta.pickle'
+
+
+class DatasetCache(object):
+    def __init__(self, directory, max_size=10 * 1024 ** 3):
+        """Cache of parsed datasets stored in `directory`, which is created if
+        it does not exist. If the entries add up to more than `max_size` bytes,
+        the least recently used ones are removed. If max_size is None, the
+        cache is unbounded.
+        """
+        self.directory = directory
+        self.max_size = max_size
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, filepath, file_format, parser_version,
+            intensity_dtype='float64', fields=None):
+        """Returns the cache key for the data file at filepath"""
+        stat = os.stat(filepath)
+        sha1 = hashlib.sha1()
+        sha1.update(repr((parser_version, file_format, stat.st_size, stat.st_mtime)))
+        if intensity_dtype != 'float64':
+            sha1.update(str(intensity_dtype))
+        if fields is not None:
+            sha1.update(repr(sorted(fields)))
+        with open(filepath, 'rb') as f:
+            sha1.update(f.read(FINGERPRINT_SIZE))
+            if stat.st_size > FINGERPRINT_SIZE:
+                f.seek(max(FINGERPRINT_SIZE, stat.st_size - FINGERPRINT_SIZE))
+                sha1.update(f.read())
+        return sha1.hexdigest()
+
+    def load(self, dataset, file_format):
+        """Restore the parsed state of `dataset` from the cache. Returns True
+        if the dataset was found in the cache, False otherwise, including
+        when the entry is evicted by another process while it is loaded, in
+        which case the dataset is left as it was.
+        """
+        entry = self._entry_path(dataset, file_format)
+        meta_path = os.path.join(entry, META_FILENAME)
+
+        def load_array(name):
+            return np.load(os.path.join(entry, name + '.npy'), mmap_mode='c')
+
+        # the arrays are memory mapped, so once they are all loaded they
+        # outlive the removal of the entry
+        try:
+            with open(meta_path, 'rb') as f:
+                meta = pickle.load(f)
+            trace_metadata = dict(
+                (key, load_array('metadata__' + key))
+                for key in meta['metadata_keys'])
+            intensity_image = None
+            if meta.get('intensity', True):
+                intensity_image = load_array('intensity_image')
+            frequencies = []
+            for i, keys in enumerate(meta['frequency_keys']):
+                freq_dict = dict(
+                    (key, load_array('frequency%d__%s' % (i, key)))
+                    for key in keys)
+                freq_dict['kHz'] = meta['frequency_kHz'][i]
+                frequencies.append(freq_dict)
+        except (IOError, OSError):
+            return False
+
+        for name, value in meta['attributes'].iteritems():
+            setattr(dataset, name, value)
+        dataset.trace_metadata = trace_metadata
+        dataset.intensity_image = intensity_image
+        dataset.frequencies = frequencies
+        dataset.parsed = True
+
+        # mark the entry as recently used, unless it was evicted meanwhile
+        try:
+            os.utime(meta_path, None)
+        except OSError:
+            pass
+        return True
+
+    def store(self, dataset, file_format):
+        """Store the parsed state of `dataset` in the cache, then evict least
+        recently used entries if the cache has grown too large. Returns the
+        path of the cache entry.
+        """
+        entry = self._entry_path(dataset, file_format)
+        if os.path.exists(entry):
+            return entry
+
+        # write the entry to a temporary directory first, so that it only
+        # appears in the cache once complete
+        tmp_entry = tempfile.mkdtemp(dir=self.directory, prefix='.tmp')
+
+        def save_array(name, array):
+            np.save(os.path.join(tmp_entry, name + '.npy'), np.asarray(array))
+
+        # traces grouped by frequency are stored in the order they were
+        # recorded, so entries don't depend on how the dataset was parsed
+        interleaved_index = dataset.interleaved_index
+
+        def save_trace_array(name, array):
+            array = np.asarray(array)
+            if interleaved_index is not None:
+                array = array[interleaved_index]
+            save_array(name, array)
+
+        for key, array in dataset.trace_metadata.iteritems():
+            save_trace_array('metadata__' + key, array)
+        intensity_image = dataset.intensity_image
+        if intensity_image is not None:
+            save_trace_array('intensity_image', intensity_image)
+
+        frequency_keys = []
+        frequency_kHz = []
+        for i, freq_dict in enumerate(dataset.frequencies):
+            keys = [key for key in freq_dict.keys() if key != 'kHz']
+            for key in keys:
+                save_array('frequency%d__%s' % (i, key), freq_dict[key])
+            frequency_keys.append(keys)
+            frequency_kHz.append(freq_dict['kHz'])
+
+        meta = {
+            'filepath': os.path.abspath(dataset.filepath),
+            'attributes': dict(
+                (name, getattr(dataset, name)) for name in ATTRIBUTES
+                if hasattr(dataset, name)),
+            'metadata_keys': list(dataset.trace_metadata.keys()),
+            'intensity': intensity_image is not None,
+            'frequency_keys': frequency_keys,
+            'frequency_kHz': frequency_kHz,
+        }
+        with open(os.path.join(tmp_entry, META_FILENAME), 'wb') as f:
+            pickle.dump(meta, f, pickle.HIGHEST_PROTOCOL)
+
+        try:
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # another process stored the same entry in the meantime
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+
+        self.evict()
+        return entry
+
+    def invalidate(self, filepath=None):
+        """Remove the entries for the data file at `filepath` (for every file
+        format and parser version) or, if filepath is None, clear the whole
+        cache.
+        """
+        for entry in self._entries():
+            if filepath is not None:
+                with open(os.path.join(entry, META_FILENAME), 'rb') as f:
+                    meta = pickle.load(f)
+                if meta.get('filepath') != os.path.abspath(filepath):
+                    continue
+            shutil.rmtree(entry, ignore_errors=True)
+
+    def evict(self):
+        """Remove least recently used entries until the total size of the
+        cache is at most max_size bytes
+        """
+        if self.max_size is None:
+            return
+
+        entries = []
+        total_size = 0
+        for entry in self._entries():
+            size = sum(
+                os.path.getsize(os.path.join(entry, name))
+                for name in os.listdir(entry))
+            last_used = os.path.getmtime(os.path.join(entry, META_FILENAME))
+            entries.append((last_used, size, entry))
+            total_size += size
+
+        for last_used, size, entry in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total_size -= size
+
+    def size(self):
+        """Returns the total size of the cache entries, in bytes"""
+        return sum(
+            os.path.getsize(os.path.join(entry, name))
+            for entry in self._entries()
+            for name in os.listdir(entry))
+
+    def _entries(self):
+        return [
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if not name.startswith('.') and os.path.exists(
+                os.path.join(self.directory, name, META_FILENAME))
+        ]
+
+    def _entry_path(self, dataset, file_format):
+        return os.path.join(
+            self.directory,
+            self.key(dataset.filepath, file_format, dataset.PARSER_VERSION,
+                     str(dataset.intensity_dtype), dataset.fields))
@@ -0,0 +1,301 @@
+"""
+Catalog of the survey lines in a directory tree of SDI files (.bin and
+.bss), stored in a SQLite database, so that lines can be looked up by area,
+date, time and frequency without parsing every file.
+
+Each file is described from its file header and a sparse sample of its
+records (see Dataset.summary()), using its sidecar index where there is one:
+its version, survey line number, date, number of traces, frequencies, time
+span and bounding box. Updating the catalog only stats the files that are
+already in it and rescans those whose size or modification time changed, so
+rescanning a large archive where few files changed costs about one stat per
+file. Files that can't be read are recorded with their error, and are not
+retried until they change.
+"""
+import multiprocessing
+import os
+import sqlite3
+
+from .binary import Dataset
+
+EXTENSIONS = {
+    '.bin': 'bin',
+    '.bss': 'bss',
+}
+
+# bump this if the schema or the contents of the catalog change, catalogs of
+# other versions are rebuilt from scratch
+CATALOG_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE lines (
+    filepath TEXT PRIMARY KEY,
+    file_format TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    version TEXT,
+    survey_line_number TEXT,
+    date TEXT,
+    trace_count INTEGER,
+    start_time TEXT,
+    end_time TEXT,
+    min_longitude REAL,
+    max_longitude REAL,
+    min_latitude REAL,
+    max_latitude REAL,
+    min_easting REAL,
+    max_easting REAL,
+    min_northing REAL,
+    max_northing REAL,
+    error TEXT
+);
+CREATE TABLE frequencies (
+    filepath TEXT NOT NULL,
+    transducer INTEGER NOT NULL,
+    kHz REAL NOT NULL
+);
+CREATE INDEX frequencies_filepath ON frequencies (filepath);
+CREATE INDEX frequencies_kHz ON frequencies (kHz);
+CREATE INDEX lines_date ON lines (date);
+"""
+
+# columns of the lines table filled from a Dataset.summary()
+LINE_COLUMNS = [
+    'filepath', 'file_format', 'size', 'mtime', 'version',
+    'survey_line_number', 'date', 'trace_count', 'start_time', 'end_time',
+    'min_longitude', 'max_longitude', 'min_latitude', 'max_latitude',
+    'min_easting', 'max_easting', 'min_northing', 'max_northing', 'error',
+]
+
+# kHz within this of the requested frequency match in search()
+KHZ_TOLERANCE = 0.5
+
+
+class Catalog(object):
+    def __init__(self, path):
+        """Catalog stored in the SQLite database at `path`, which is created
+        if it does not exist
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+        if version != CATALOG_VERSION:
+            with self.connection:
+                self.connection.execute('DROP TABLE IF EXISTS lines')
+                self.connection.execute('DROP TABLE IF EXISTS frequencies')
+                self.connection.executescript(SCHEMA)
+                self.connection.execute(
+                    'PRAGMA user_version = %d' % CATALOG_VERSION)
+
+    def update(self, directory, workers=None, sample_size=200):
+        """Scan the directory tree for .bin and .bss files, adding the new
+        ones to the catalog, rescanning the ones that changed and removing
+        the ones under `directory` that no longer exist. If `workers` is
+        given, files are scanned in a pool of that many processes. Returns
+        a dict with the number of files 'added', 'updated', 'removed',
+        'unchanged' and 'failed' (files that couldn't be read).
+
+        Scanning a file reads its header and `sample_size` of its records
+        (see Dataset.summary()), but its records have to be located first.
+        That is free for files with an up to date sidecar index (see
+        Dataset.save_index()) and for bss files whose records all have the
+        same size. Other files are scanned record by record, which reads a
+        few bytes of every record, so the cost of adding or rescanning them
+        grows with their size rather than with their number.
+        """
+        directory = os.path.abspath(directory)
+        known = dict(
+            (row['filepath'], (row['size'], row['mtime']))
+            for row in self.connection.execute(
+                "SELECT filepath, size, mtime FROM lines "
+                "WHERE filepath LIKE ? ESCAPE '\\'",
+                (_escape_like(directory + os.sep) + '%',)))
+
+        counts = dict.fromkeys(
+            ['added', 'updated', 'removed', 'unchanged', 'failed'], 0)
+        jobs = []
+        for filepath, file_format in _find_files(directory):
+            try:
+                stat = os.stat(filepath)
+            except OSError:
+                continue
+            state = known.pop(filepath, None)
+            if state == (stat.st_size, stat.st_mtime):
+                counts['unchanged'] += 1
+                continue
+            counts['added' if state is None else 'updated'] += 1
+            jobs.append((filepath, file_format, stat.st_size, stat.st_mtime,
+                         sample_size))
+
+        if workers is not None and len(jobs) > 1:
+            pool = multiprocessing.Pool(workers)
+            try:
+                scanned = list(pool.imap_unordered(_scan_file, jobs, 16))
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            scanned = [_scan_file(job) for job in jobs]
+
+        with self.connection:
+            removed = list(known)
+            self._delete(removed)
+            counts['removed'] = len(removed)
+
+            self._delete([line['filepath'] for line, frequencies in scanned])
+            self.connection.executemany(
+                'INSERT INTO lines (%s) VALUES (%s)' % (
+                    ', '.join(LINE_COLUMNS), ', '.join('?' * len(LINE_COLUMNS))),
+                [[line[column] for column in LINE_COLUMNS]
+                 for line, frequencies in scanned])
+            self.connection.executemany(
+                'INSERT INTO frequencies (filepath, transducer, kHz) '
+                'VALUES (?, ?, ?)',
+                [(line['filepath'], transducer, kHz)
+                 for line, frequencies in scanned
+                 for transducer, kHz in frequencies])
+        counts['failed'] = sum(
+            1 for line, frequencies in scanned if line['error'] is not None)
+
+        return counts
+
+    def search(self, bbox=None, date=None, start=None, end=None, kHz=None,
+               file_format=None):
+        """Returns the lines of the catalog that match all of the given
+        criteria, as a list of dicts with the columns of the catalog and
+        'frequencies', a list of (transducer, kHz) tuples:
+            bbox:
+                (min_longitude, min_latitude, max_longitude, max_latitude) of
+                an area that the bounding box of the line must intersect.
+            date:
+                datetime.date the line was recorded on.
+            start, end:
+                datetimes of a time span that the line must overlap.
+            kHz:
+                a frequency the line was recorded at, within KHZ_TOLERANCE.
+            file_format:
+                'bin' or 'bss'.
+        Files that couldn't be read are never returned.
+        """
+        conditions = ['error IS NULL']
+        params = []
+        if bbox is not None:
+            min_x, min_y, max_x, max_y = bbox
+            conditions.append(
+                'max_longitude >= ? AND min_longitude <= ? AND '
+                'max_latitude >= ? AND min_latitude <= ?')
+            params.extend([min_x, max_x, min_y, max_y])
+        if date is not None:
+            conditions.append('date = ?')
+            params.append(date.isoformat())
+        if start is not None:
+            conditions.append('end_time >= ?')
+            params.append(_timestamp(start))
+        if end is not None:
+            conditions.append('start_time <= ?')
+            params.append(_timestamp(end))
+        if kHz is not None:
+            conditions.append(
+                'filepath IN (SELECT filepath FROM frequencies '
+                'WHERE kHz BETWEEN ? AND ?)')
+            params.extend([kHz - KHZ_TOLERANCE, kHz + KHZ_TOLERANCE])
+        if file_format is not None:
+            conditions.append('file_format = ?')
+            params.append(file_format)
+
+        rows = self.connection.execute(
+            'SELECT * FROM lines WHERE %s ORDER BY start_time, filepath' %
+            ' AND '.join(conditions), params).fetchall()
+        lines = [dict(zip(row.keys(), row)) for row in rows]
+        for line in lines:
+            line['frequencies'] = [
+                (row['transducer'], row['kHz'])
+                for row in self.connection.execute(
+                    'SELECT transducer, kHz FROM frequencies '
+                    'WHERE filepath = ? ORDER BY transducer',
+                    (line['filepath'],))]
+        return lines
+
+    def remove(self, filepath):
+        """Remove a file from the catalog"""
+        with self.connection:
+            self._delete([os.path.abspath(filepath)])
+
+    def close(self):
+        self.connection.close()
+
+    def __len__(self):
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM lines').fetchone()[0]
+
+    def _delete(self, filepaths):
+        for table in ['lines', 'frequencies']:
+            self.connection.executemany(
+                'DELETE FROM %s WHERE filepath = ?' % table,
+                [(filepath,) for filepath in filepaths])
+
+
+def _find_files(directory):
+    """Generator that yields a tuple of (filepath, file_format) for each SDI
+    file in the directory tree
+    """
+    for dirpath, dirnames, filenames in os.walk(directory):
+        for filename in filenames:
+            file_format = EXTENSIONS.get(os.path.splitext(filename)[1].lower())
+            if file_format is not None:
+                yield os.path.join(dirpath, filename), file_format
+
+
+def _scan_file(job):
+    """Summarize a file for Catalog.update. Returns a tuple of (line,
+    frequencies) where line is a dict of the columns of the lines table and
+    frequencies a list of (transducer, kHz) tuples.
+    """
+    filepath, file_format, size, mtime, sample_size = job
+    line = dict.fromkeys(LINE_COLUMNS)
+    line.update({
+        'filepath': filepath,
+        'file_format': file_format,
+        'size': size,
+        'mtime': mtime,
+    })
+    try:
+        summary = Dataset(filepath).summary(
+            file_format=file_format, sample_size=sample_size)
+    except Exception as e:
+        line['error'] = '%s: %s' % (type(e).__name__, e)
+        return line, []
+
+    line.update({
+        'version': str(summary['version']),
+        'survey_line_number': _line_name(summary['survey_line_number']),
+        'date': summary['date'].isoformat(),
+        'trace_count': summary['trace_count'],
+    })
+    for key in ['start_time', 'end_time']:
+        if summary[key] is not None:
+            line[key] = _timestamp(summary[key])
+    for key in ['longitude', 'latitude', 'easting', 'northing']:
+        if summary.get(key) is not None:
+            line['min_' + key], line['max_' + key] = summary[key]
+
+    return line, summary['frequencies']
+
+
+def _line_name(survey_line_number):
+    """Returns the survey line number of a file header without the NUL
+    padding, and without the extension that bss headers store it with (e.g.
+    '09112303.bss'), so that lines are named alike in both formats
+    """
+    return os.path.splitext(survey_line_number.rstrip(u'\x00'))[0]
+
+
+def _timestamp(dt):
+    """Format a datetime so that timestamps sort in time order"""
+    return dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def _escape_like(text):
+    """Escape the wildcards of a SQL LIKE pattern"""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
@@ -0,0 +1,92 @@
+"""
+Sidecar files (.sdiidx) that store the record index of an SDI binary file
+next to it, so that the file doesn't have to be scanned record by record
+every time it is opened. See Dataset.index_records() for the contents of the
+index.
+
+A sidecar records the size, modification time and leading bytes of the file
+it was built from, and is ignored if any of those no longer match.
+"""
+import hashlib
+import os
+
+import numpy as np
+
+SIDECAR_EXTENSION = '.sdiidx'
+
+# bump this if the contents of the index change
+INDEX_VERSION = 1
+
+# number of leading bytes of the data file that are fingerprinted; this
+# covers the file header of both bin and bss files
+HEADER_SIZE = 512
+
+
+def sidecar_path(filepath):
+    """Returns the path of the sidecar index file for a data file"""
+    return filepath + SIDECAR_EXTENSION
+
+
+def fingerprint(filepath):
+    """Returns a dict that identifies the current state of a data file: its
+    size, modification time and a hash of its leading bytes
+    """
+    stat = os.stat(filepath)
+    with open(filepath, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+
+    return {
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'header_sha1': hashlib.sha1(header).hexdigest(),
+    }
+
+
+def save(filepath, index, file_format):
+    """Save a record index for the data file at filepath to its sidecar
+    file. The sidecar is written to a temporary file first and then renamed,
+    so concurrent readers never see a partial sidecar.
+    """
+    path = sidecar_path(filepath)
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+
+    arrays = dict(('index_' + key, array) for key, array in index.iteritems())
+    for key, value in fingerprint(filepath).iteritems():
+        arrays['fingerprint_' + key] = np.array(value)
+    arrays['index_version'] = np.array(INDEX_VERSION)
+    arrays['file_format'] = np.array(file_format)
+
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.rename(tmp_path, path)
+
+    return path
+
+
+def load(filepath, file_format):
+    """Returns the record index stored in the sidecar file of the data file
+    at filepath, or None if there is no sidecar or if it is out of date
+    """
+    path = sidecar_path(filepath)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with np.load(path) as npz:
+            arrays = dict((key, npz[key]) for key in npz.files)
+    except (IOError, ValueError, KeyError):
+        return None
+
+    if (arrays.get('index_version') != INDEX_VERSION or
+            arrays.get('file_format') != file_format):
+        return None
+
+    for key, value in fingerprint(filepath).iteritems():
+        if arrays.get('fingerprint_' + key) != value:
+            return None
+
+    return dict(
+        (key[len('index_'):], array)
+        for key, array in arrays.iteritems()
+        if key.startswith('index_') and key != 'index_version'
+    )
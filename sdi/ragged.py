@@ -0,0 +1,154 @@
+"""
+Ragged (CSR-style) storage for intensity images. The number of samples per
+trace changes whenever the power or range changes during a survey line, and a
+padded image spends most of its memory on padding in that case. A RaggedArray
+stores the samples of all traces back to back in one flat array, with the
+offsets at which each trace starts, and only pads when asked to.
+"""
+import numpy as np
+
+
+class RaggedArray(object):
+    def __init__(self, values, offsets, width=None):
+        """Ragged array whose rows are values[offsets[i]:offsets[i + 1]].
+        `offsets` has one more element than the number of rows, starts with
+        zero and ends with len(values). `width` is the width of the padded
+        image, by default the length of the longest row. Rows selected from a
+        RaggedArray keep its width, so they pad to the same width as the
+        corresponding rows of the full image.
+        """
+        self.values = np.asarray(values)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        if width is None:
+            lengths = self.lengths
+            width = lengths.max() if len(lengths) else 0
+        self.width = int(width)
+
+    @classmethod
+    def from_rows(cls, rows, dtype=None):
+        """Returns a RaggedArray of a sequence of 1-d arrays"""
+        lengths = np.array([len(row) for row in rows], dtype=np.int64)
+        if len(rows):
+            values = np.concatenate(rows)
+        else:
+            values = np.array([], dtype=np.float64)
+        if dtype is not None:
+            values = values.astype(dtype)
+        return cls(values, _offsets(lengths))
+
+    @classmethod
+    def from_padded(cls, image, lengths):
+        """Returns a RaggedArray of the first lengths[i] elements of each row
+        of a padded 2-d image
+        """
+        lengths = np.asarray(lengths, dtype=np.int64)
+        mask = np.arange(image.shape[1]) < lengths[:, np.newaxis]
+        return cls(image[mask], _offsets(lengths), width=image.shape[1])
+
+    @classmethod
+    def concatenate(cls, arrays):
+        """Returns the rows of a sequence of RaggedArrays as one RaggedArray"""
+        return cls(
+            np.concatenate([array.values for array in arrays]),
+            _offsets(np.concatenate([array.lengths for array in arrays])),
+            width=max([array.width for array in arrays] or [0]))
+
+    @property
+    def lengths(self):
+        """Number of elements in each row"""
+        return np.diff(self.offsets)
+
+    @property
+    def dtype(self):
+        return self.values.dtype
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.offsets.nbytes
+
+    def row_index(self):
+        """Returns the row number of each element of values"""
+        return np.repeat(np.arange(len(self)), self.lengths)
+
+    def with_values(self, values):
+        """Returns a RaggedArray with the same rows as this one, holding
+        `values` instead
+        """
+        return self.__class__(values, self.offsets, width=self.width)
+
+    def padded(self, fill_value=None, width=None, dtype=None):
+        """Returns the rows as a 2-d array of shape (len(self), width), with
+        rows shorter than width (by default self.width) padded with
+        fill_value. The array has the dtype of values unless another dtype is
+        given, and is padded with NaNs if that is a floating point dtype or
+        with zeros otherwise.
+        """
+        lengths = self.lengths
+        if width is None:
+            width = self.width
+        if dtype is None:
+            dtype = self.dtype
+        if fill_value is None:
+            fill_value = np.nan if np.issubdtype(dtype, np.floating) else 0
+        image = np.empty((len(self), int(width)), dtype=dtype)
+        image.fill(fill_value)
+        mask = np.arange(int(width)) < lengths[:, np.newaxis]
+        image[mask] = self.values
+        return image
+
+    def __array__(self, dtype=None):
+        image = self.padded()
+        if dtype is not None:
+            image = image.astype(dtype)
+        return image
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.values[self.offsets[i]:self.offsets[i + 1]]
+
+    def __getitem__(self, key):
+        """An integer returns one row as a view of values. A slice, an index
+        array or a boolean mask returns a RaggedArray of the selected rows.
+        """
+        if isinstance(key, tuple) and len(key) == 1:
+            key = key[0]
+        if isinstance(key, (int, long, np.integer)):
+            if key < 0:
+                key += len(self)
+            if not 0 <= key < len(self):
+                raise IndexError('row index out of range')
+            return self.values[self.offsets[key]:self.offsets[key + 1]]
+
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1:
+                stop = max(start, stop)
+                offsets = self.offsets[start:stop + 1]
+                return self.__class__(
+                    self.values[offsets[0]:offsets[-1]], offsets - offsets[0],
+                    width=self.width)
+            rows = np.arange(start, stop, step)
+        else:
+            rows = np.arange(len(self))[key]
+
+        lengths = self.lengths[rows]
+        offsets = _offsets(lengths)
+        # position of each selected element in values
+        positions = (np.repeat(self.offsets[:-1][rows] - offsets[:-1], lengths) +
+                     np.arange(offsets[-1]))
+        return self.__class__(
+            self.values[positions], offsets, width=self.width)
+
+    def __repr__(self):
+        return '%s(%d rows, %d values, dtype=%s)' % (
+            self.__class__.__name__, len(self), len(self.values), self.dtype)
+
+
+def _offsets(lengths):
+    """Returns the offsets of rows of the given lengths"""
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
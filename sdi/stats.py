@@ -0,0 +1,131 @@
+"""
+Opt-in instrumentation of Dataset.parse. A ParseStats passed as the `stats`
+keyword of parse() (or read()) records, for each stage of the parse, the wall
+time spent in it, the bytes of the file it read, the records it decoded, the
+passes made by the GPS filter and the size of the largest array it produced.
+
+The stages are:
+    cache         loading the dataset from (or storing it in) a dataset cache
+    header        decoding the file header
+    records       locating and decoding the records
+    intensity     decoding and normalizing the intensity samples
+    filter        filtering GPS glitches out of the positions (filter_x_and_y)
+    group         grouping the traces by frequency
+    frequencies   assembling the frequency dicts
+
+Stages can run inside one another (e.g. lazily derived fields are computed
+when the frequency dicts are assembled), and the time of a stage doesn't
+include the time of the stages run inside it, so the stage times add up to
+the time of the parse. Files are memory mapped, so the time spent reading the
+file is part of the stage that first touches its bytes. Fields and
+intensities that are decoded lazily are recorded when they are first
+accessed, as long as the stats are attached to the dataset.
+
+Without stats, the instrumentation costs a few attribute lookups per parse.
+"""
+import collections
+import time
+
+COUNTERS = ['calls', 'seconds', 'bytes_read', 'records', 'filter_passes',
+            'peak_array_bytes']
+
+
+class ParseCancelled(Exception):
+    """Raised by Dataset.parse when a progress callback cancels it"""
+
+
+class ParseStats(object):
+    def __init__(self):
+        """Counters of each stage of a parse. `stages` maps stage names to
+        dicts of their counters: calls, seconds, bytes_read, records,
+        filter_passes and peak_array_bytes.
+        """
+        self.stages = collections.OrderedDict()
+        self._running = []
+
+    def stage(self, name):
+        """Returns a context manager that times a stage"""
+        return _StageTimer(self, name)
+
+    def count(self, stage, **counts):
+        """Add counts (e.g. records=10) to the counters of a stage"""
+        counters = self._counters(stage)
+        for key, value in counts.iteritems():
+            counters[key] += value
+
+    def observe(self, stage, *arrays):
+        """Record the size of the arrays produced by a stage, keeping the
+        largest one
+        """
+        counters = self._counters(stage)
+        for array in arrays:
+            counters['peak_array_bytes'] = max(
+                counters['peak_array_bytes'], getattr(array, 'nbytes', 0))
+
+    def reset(self):
+        self.stages.clear()
+
+    @property
+    def seconds(self):
+        """Total time of all stages"""
+        return sum(counters['seconds'] for counters in self.stages.values())
+
+    def as_dict(self):
+        return dict(
+            (stage, dict(counters))
+            for stage, counters in self.stages.iteritems())
+
+    def __str__(self):
+        lines = ['%-12s %6s %10s %12s %10s %7s %12s' % (
+            'stage', 'calls', 'seconds', 'bytes_read', 'records', 'passes',
+            'peak_bytes')]
+        for stage, counters in self.stages.iteritems():
+            lines.append('%-12s %6d %10.4f %12d %10d %7d %12d' % (
+                stage, counters['calls'], counters['seconds'],
+                counters['bytes_read'], counters['records'],
+                counters['filter_passes'], counters['peak_array_bytes']))
+        return '\n'.join(lines)
+
+    def _counters(self, stage):
+        if stage not in self.stages:
+            self.stages[stage] = dict.fromkeys(COUNTERS, 0)
+            self.stages[stage]['seconds'] = 0.
+        return self.stages[stage]
+
+
+class _StageTimer(object):
+    """Context manager timing a stage, excluding the time of the stages run
+    inside it
+    """
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.nested = 0.
+        self.stats._running.append(self)
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.time() - self.start
+        self.stats._running.pop()
+        if self.stats._running:
+            self.stats._running[-1].nested += elapsed
+        self.stats.count(
+            self.name, calls=1, seconds=elapsed - self.nested)
+        return False
+
+
+class _NoStage(object):
+    """Context manager standing in for _StageTimer when there are no stats"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NO_STAGE = _NoStage()
@@ -0,0 +1,290 @@
+"""
+Live ingest of the bss records that SdiDepth/SmartSurvey sends over UDP. Each
+primary and secondary ping is sent to 127.0.0.1 (by default on port 2112) as
+the same BssSize preamble, TBssRec header and A/D samples as a record of a bss
+file (see spec/bss_format_specification.txt). The sender uses a buffer of
+1514 bytes while a record holds up to 32768 samples, so a record is split
+across as many datagrams as it takes, the first of which starts with the
+preamble. BssReceiver reassembles the records from the datagrams.
+
+Decoded pings are pushed into a PingBuffer, a bounded ring buffer of the most
+recent pings that a real-time display can consume without going through the
+file on disk. listen() receives datagrams on a blocking socket, so it is meant
+to be run in a thread of its own while the consumer waits on the buffer.
+"""
+import collections
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+from .binary import BSS_RESERVED_SIZE, Dataset, MAX_BSS_SAMPLES, \
+    _bss_structs, _map_file, _record_dtype, _scan_bss_records
+
+# default UDP port the records are sent to
+DEFAULT_PORT = 2112
+
+# size of the buffer the sounder sends the records with, i.e. the largest
+# datagram it sends
+UDP_BUFFER_SIZE = 1514
+
+# how a full PingBuffer handles a new ping
+OVERFLOW_POLICIES = ['drop_oldest', 'drop_newest']
+
+# BssSize preamble and PrevRecordSize of a record
+_PREAMBLE = struct.Struct('<HL')
+
+
+def decode_record(record, decoder=None):
+    """Returns a dict with the fields of the bss record in the string
+    `record`, with the same names and types as the raw fields decoded by
+    Dataset.parse_bss_records, the raw A/D samples as 'samples' and the
+    normalized samples as 'intensity'. Raises a ValueError if the string is
+    too short to hold the record. `decoder` is a Dataset used to normalize the
+    samples, so one can be reused across records.
+    """
+    rec_structs = _bss_structs()
+    rec_dtype = _record_dtype(rec_structs)
+    if len(record) < rec_dtype.itemsize:
+        raise ValueError("Incomplete bss record header")
+    header = np.frombuffer(record, dtype=rec_dtype, count=1)
+
+    ping = dict(
+        (name, np.array(header[name], dtype=dtype)[0])
+        for name, fmt, dtype in rec_structs)
+    data_start = 2 + int(ping['bss_size'])
+    num_pnts = int(ping['num_pnts'])
+    if len(record) < data_start + 2 * num_pnts:
+        raise ValueError("Incomplete bss record samples")
+
+    if decoder is None:
+        decoder = _decoder()
+    ping['samples'] = np.frombuffer(
+        record, dtype='<i2', count=num_pnts, offset=data_start).copy()
+    ping['intensity'] = decoder._decode_normalized(
+        record, np.array([data_start]), np.array([num_pnts]), '<i2',
+        transducer=np.array([ping['transducer']]))[0]
+    return ping
+
+
+class PingBuffer(object):
+    def __init__(self, capacity=1000, overflow='drop_oldest', high_water=0.8,
+                 on_high_water=None):
+        """Bounded ring buffer holding up to `capacity` decoded pings. When
+        the buffer is full, a new ping either replaces the oldest one
+        ('drop_oldest', default) or is discarded ('drop_newest'), and is
+        counted in `dropped`. `received` counts all of the pings pushed and
+        `malformed` the records that couldn't be decoded.
+
+        UDP can't slow the sounder down, so it's up to the consumer to keep
+        up. Once the buffer fills up to the `high_water` fraction of its
+        capacity, `on_high_water` is called with the buffer (from the thread
+        pushing the ping), so that the consumer can e.g. skip rendering to
+        catch up before pings get dropped. It is called again the next time
+        the buffer fills up after being popped below the high water mark.
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy: %s" % overflow)
+        self.capacity = capacity
+        self.overflow = overflow
+        self.high_water = max(1, int(round(high_water * capacity)))
+        self.on_high_water = on_high_water
+        self.received = 0
+        self.dropped = 0
+        self.malformed = 0
+        self.above_high_water = False
+        self._pings = collections.deque(maxlen=capacity)
+        self._ready = threading.Condition()
+
+    def push(self, ping):
+        """Add a decoded ping to the buffer. Returns False if the buffer was
+        full, in which case the oldest or the new ping is dropped depending
+        on the overflow policy.
+        """
+        with self._ready:
+            self.received += 1
+            full = len(self._pings) == self.capacity
+            if full:
+                self.dropped += 1
+                if self.overflow == 'drop_newest':
+                    return False
+            self._pings.append(ping)
+            self._ready.notify_all()
+            crossed = (not self.above_high_water and
+                       len(self._pings) >= self.high_water)
+            if crossed:
+                self.above_high_water = True
+        if crossed and self.on_high_water is not None:
+            self.on_high_water(self)
+        return not full
+
+    def pop(self, n=None):
+        """Remove and return the oldest `n` pings (or all of them if n is
+        None) as a list
+        """
+        with self._ready:
+            if n is None:
+                n = len(self._pings)
+            pings = [self._pings.popleft()
+                     for i in range(min(n, len(self._pings)))]
+            if len(self._pings) < self.high_water:
+                self.above_high_water = False
+        return pings
+
+    def latest(self, n=1):
+        """Returns the most recent `n` pings, oldest first, without removing
+        them
+        """
+        with self._ready:
+            return list(self._pings)[-n:] if n else []
+
+    def wait(self, timeout=None):
+        """Block until the buffer holds a ping, or for at most `timeout`
+        seconds. Returns True if the buffer holds a ping.
+        """
+        with self._ready:
+            if not self._pings:
+                self._ready.wait(timeout)
+            return bool(self._pings)
+
+    def __len__(self):
+        return len(self._pings)
+
+    @property
+    def fill_level(self):
+        """Fraction of the capacity in use"""
+        return len(self._pings) / float(self.capacity)
+
+
+class BssReceiver(object):
+    def __init__(self, buffer):
+        """Reassembles the bss records split across the received datagrams
+        and decodes them into `buffer`, a PingBuffer
+        """
+        self.buffer = buffer
+        self.errors = 0
+        self._decoder = _decoder()
+        self._header_size = _record_dtype(_bss_structs()).itemsize
+        self._bss_size = self._header_size + BSS_RESERVED_SIZE - 2
+        self._pending = bytearray()
+        self._record_size = None
+
+    def datagram_received(self, data, addr=None):
+        """Add a datagram to the record being reassembled, and decode the
+        records it completes into the buffer.
+
+        Datagrams can be lost. The first datagram of a record starts with
+        the BssSize preamble, followed by PrevRecordSize, the size of the
+        previous record. If such a datagram arrives while a record of that
+        size is incomplete, that record lost a datagram and is counted as
+        malformed. Preambles that don't hold a valid record header are
+        discarded along with what is pending.
+        """
+        if (self._record_size is not None and len(data) >= _PREAMBLE.size and
+                _PREAMBLE.unpack_from(data) == (
+                    self._bss_size, self._record_size)):
+            self._discard()
+        self._pending.extend(data)
+
+        while len(self._pending) >= self._header_size:
+            if self._record_size is None:
+                bss_size, prev_record_size, num_pnts = struct.unpack_from(
+                    '<HLL', self._pending)
+                if bss_size < self._bss_size or num_pnts > MAX_BSS_SAMPLES:
+                    self._discard()
+                    return
+                self._record_size = 2 + bss_size + 2 * num_pnts
+            if len(self._pending) < self._record_size:
+                return
+
+            record = bytes(self._pending[:self._record_size])
+            del self._pending[:self._record_size]
+            self._record_size = None
+            try:
+                ping = decode_record(record, self._decoder)
+            except ValueError:
+                self.buffer.malformed += 1
+                continue
+            self.buffer.push(ping)
+
+    def error_received(self, exc):
+        self.errors += 1
+
+    def serve(self, sock, stop=None, poll_interval=0.1):
+        """Receive datagrams from the bound socket `sock` until the
+        threading.Event `stop` is set (or forever if it is None), checking it
+        every `poll_interval` seconds
+        """
+        sock.settimeout(poll_interval)
+        while stop is None or not stop.is_set():
+            try:
+                data, addr = sock.recvfrom(65536)
+            except socket.timeout:
+                continue
+            except socket.error as e:
+                self.error_received(e)
+                continue
+            self.datagram_received(data, addr)
+
+    def _discard(self):
+        """Drop the incomplete record being reassembled"""
+        self.buffer.malformed += 1
+        self._pending = bytearray()
+        self._record_size = None
+
+
+def listen(buffer, host='127.0.0.1', port=DEFAULT_PORT, stop=None):
+    """Receive the bss records sent to (host, port) into `buffer` until the
+    threading.Event `stop` is set. This blocks, so it is usually the target of
+    a thread, e.g.:
+
+        buf = PingBuffer()
+        stop = threading.Event()
+        threading.Thread(target=listen, args=(buf,),
+                         kwargs={'stop': stop}).start()
+        while buf.wait():
+            ...
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.bind((host, port))
+        BssReceiver(buffer).serve(sock, stop)
+    finally:
+        sock.close()
+
+
+def replay(filepath, host='127.0.0.1', port=DEFAULT_PORT, interval=0.,
+           chunk_size=UDP_BUFFER_SIZE):
+    """Send each record of the bss file at filepath over UDP to (host, port),
+    in datagrams of at most `chunk_size` bytes, waiting `interval` seconds
+    between records, the way the sounder does while recording. Returns the
+    number of records sent.
+    """
+    data = _map_file(filepath)
+    starts, end = _scan_bss_records(
+        data, len(data), _record_dtype(_bss_structs()).itemsize)
+    ends = np.append(starts[1:], end)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        for start, end in zip(starts, ends):
+            for chunk_start in xrange(start, end, chunk_size):
+                sock.sendto(data[chunk_start:min(chunk_start + chunk_size, end)],
+                            (host, port))
+            if interval:
+                time.sleep(interval)
+    finally:
+        sock.close()
+        data.close()
+    return len(starts)
+
+
+def _decoder():
+    """Returns a Dataset that normalizes samples the way they are for bss
+    files
+    """
+    decoder = Dataset(None)
+    decoder.version = 1000
+    return decoder
@@ -0,0 +1,375 @@
+"""
+Writer for SDI binary (.bin) and bss (.bss) files, to produce test and
+benchmark inputs of any size. Records are laid out as described by the same
+struct lists that the readers in sdi.binary decode (_bin_structs for bin
+versions 3.3 to 4.3 and _bss_structs for bss files), so written files read
+back with the fields and samples they were written with.
+
+The writers take the traces as a dict of arrays, or an iterable of such dicts
+that are written one after the other, so files larger than memory can be
+streamed to disk. Each block of records is encoded into one byte buffer with
+numpy and written with a single call. synthetic_traces() generates seeded,
+reproducible blocks of traces with interleaved transducers, range changes,
+GPS dropouts and event strings.
+"""
+import os
+import struct
+
+import numpy as np
+
+from .binary import BSS_HEADER_SIZE, BSS_RESERVED_SIZE, _bin_structs, \
+    _bss_structs, _record_dtype
+from .ragged import RaggedArray
+
+# versions of the bin format that can be written
+BIN_VERSIONS = ['3.3', '4.0', '4.1', '4.2', '4.3']
+
+# transmit frequency of each transducer in synthetic files
+SYNTHETIC_KHZ = {1: 200., 2: 50., 3: 24., 4: 12., 5: 3.5}
+
+
+def write_bin(filepath, traces, version='4.3', filename=None):
+    """Write a bin file of the given format version. `traces` is a dict
+    mapping the record fields of that version (see _bin_structs) to arrays
+    with one element per trace, or an iterable of such dicts. Fields that are
+    missing are written as zeros, except 'offset', 'event_len' and 'num_pnts'
+    which are computed. The raw samples of each trace go in 'samples', as a
+    RaggedArray, a list of arrays, or a 2-d array holding num_pnts samples
+    per row, and the event strings in 'event' (by default, no events).
+    `filename` is the 8 character base filename stored in the header, by
+    default taken from filepath; the readers derive the survey date from it.
+    Returns the number of traces written.
+    """
+    if version not in BIN_VERSIONS:
+        raise ValueError("Unsupported bin file version: %s" % version)
+    if filename is None:
+        filename = _base_filename(filepath)
+    pre_structs, event_struct, post_structs = _bin_structs(version)
+    major, minor = [int(part) for part in version.split('.')]
+
+    count = 0
+    with open(filepath, 'wb') as f:
+        f.write(struct.pack(
+            '<8s2cBB', filename, '\r', '\n', major << 4 | minor, 0))
+        for chunk in _chunks(traces):
+            records, n = _encode_bin_records(chunk, pre_structs, post_structs)
+            records.tofile(f)
+            count += n
+    return count
+
+
+def write_bss(filepath, traces, filename=None, spdos=1500., units=1):
+    """Write a bss file. `traces` is a dict mapping the TBssRec fields (see
+    _bss_structs) to arrays with one element per trace, or an iterable of
+    such dicts, laid out as for write_bin(); 'bss_size', 'prev_record_size'
+    and 'num_pnts' are computed. `filename` is stored in the header (by
+    default, the base name of filepath), along with the speed of sound
+    `spdos` and display `units`. The header fields that describe the last
+    record are filled in once all records are written. Returns the number of
+    traces written.
+    """
+    if filename is None:
+        filename = os.path.splitext(os.path.basename(filepath))[0] + '.bss'
+    rec_structs = _bss_structs()
+
+    header = bytearray(BSS_HEADER_SIZE)
+    struct.pack_into('<H', header, 0, BSS_HEADER_SIZE - 2)
+    struct.pack_into(
+        '<64s', header, 2, u'BSS Specialty Devices, Inc.'.encode('utf-16-le'))
+    struct.pack_into('<64s', header, 66, unicode(filename).encode('utf-16-le'))
+    struct.pack_into('<HH', header, 130, 1, 1000)
+    struct.pack_into('<d', header, 146, spdos)
+    struct.pack_into('<B', header, 170, units)
+
+    count = 0
+    prev_record_size = 0
+    first_time_tag = last_time_tag = last_trace_num = 0
+    with open(filepath, 'wb') as f:
+        f.write(header)
+        for chunk in _chunks(traces):
+            records, n, prev_record_size = _encode_bss_records(
+                chunk, rec_structs, prev_record_size)
+            records.tofile(f)
+            if n:
+                if not count:
+                    first_time_tag = _last(chunk, 'time_tag', n, first=True)
+                last_time_tag = _last(chunk, 'time_tag', n)
+                last_trace_num = _last(chunk, 'trace_num', n)
+            count += n
+
+        f.seek(158)
+        f.write(struct.pack('<d', first_time_tag))
+        f.seek(344)
+        f.write(struct.pack('<L', last_trace_num))
+        f.seek(360)
+        f.write(struct.pack('<d', last_time_tag))
+    return count
+
+
+def synthetic_traces(n, file_format='bin', version='4.3', chunk_size=10000,
+                     seed=0, transducers=(1, 3), num_pnts=500,
+                     range_changes=2, dropout_fraction=0.02, dropout_length=50,
+                     event_interval=1000):
+    """Generator yielding `n` synthetic traces for write_bin() or
+    write_bss(), in dicts of `chunk_size` traces. The traces cycle through
+    the given `transducers`, the way pings of different frequencies are
+    interleaved in real files. Traces have `num_pnts` samples until the first
+    of `range_changes` evenly spaced range changes, after which the number of
+    samples alternates between 1.5 and 1 times num_pnts. The boat moves along
+    a straight line with a GPS fix every 5 traces; a `dropout_fraction` of
+    runs of `dropout_length` traces hold the last position as if the fix was
+    lost. Every `event_interval` traces has an event string (bin only). The
+    samples hold noise and a bottom return at depth_r1. The same arguments
+    always give the same traces.
+    """
+    rng = np.random.RandomState(seed)
+    dropouts = rng.rand(n // dropout_length + 1) < dropout_fraction
+    transducers = np.asarray(transducers)
+    kHz = np.zeros(max(SYNTHETIC_KHZ) + 1)
+    kHz[list(SYNTHETIC_KHZ)] = list(SYNTHETIC_KHZ.values())
+    rate = 25000
+    spdos = 1500.
+
+    for start in range(0, n, chunk_size):
+        i = np.arange(start, min(start + chunk_size, n))
+        transducer = transducers[i % len(transducers)]
+        segment = i * (range_changes + 1) // n
+        lengths = (num_pnts * np.where(segment % 2, 1.5, 1.)).astype(np.int64)
+
+        # position of the last fix, held through dropouts
+        held = dropouts[i // dropout_length]
+        last_trace = np.where(held, i - i % dropout_length - 1, i).clip(0)
+        fix = last_trace - last_trace % 5
+        distance = fix * 0.5
+        easting = 500000. + distance * 0.6
+        northing = 3300000. + distance * 0.8
+        longitude = -97.5 + distance * 6e-6
+        latitude = 30.5 + distance * 8e-6
+
+        depth = 5. + 2. * np.sin(i / 2000.)
+        depth_pnt = (depth * 2 * rate / spdos).astype(np.int64)
+        seconds = 36000. + i * 0.1
+
+        total = lengths.sum()
+        offsets = np.cumsum(lengths) - lengths
+        bottom = offsets + np.minimum(depth_pnt, lengths - 10)
+        echo = (np.repeat(bottom, 10) + np.tile(np.arange(10), len(i)))
+        # 12 bit noise, drawn as random bytes as that is much faster than
+        # drawing random integers
+        noise = np.frombuffer(rng.bytes(2 * total), dtype=np.uint16) & 4095
+        if file_format == 'bin':
+            samples = noise
+            samples[echo] = 60000
+        else:
+            samples = noise.astype(np.int16) - 2048
+            samples[echo] = 30000
+        chunk = {
+            'trace_num': i + 1,
+            'transducer': transducer,
+            'kHz': kHz[transducer],
+            'rate': np.repeat(rate, len(i)),
+            'depth_r1': depth,
+            'samples': RaggedArray(samples, np.append(offsets, total)),
+        }
+
+        if file_format == 'bin':
+            chunk.update({
+                'units': np.repeat(1, len(i)),
+                'spdos_units': np.repeat(1, len(i)),
+                'spdos': np.repeat(int(spdos), len(i)),
+                'max_window10': np.repeat(150, len(i)),
+                'draft100': np.repeat(50, len(i)),
+                'display_range': np.repeat(15, len(i)),
+                'blanking_pnt': np.repeat(5, len(i)),
+                'depth_pnt': depth_pnt,
+                'range_pnt': lengths,
+                'clock': (seconds * 18.2).astype(np.int64),
+                'hour': (seconds // 3600).astype(np.int64) % 24,
+                'minute': (seconds // 60).astype(np.int64) % 60,
+                'second': seconds.astype(np.int64) % 60,
+                'centisecond': (seconds * 100).astype(np.int64) % 100,
+                'longitude': longitude,
+                'latitude': latitude,
+                'easting': easting,
+                'northing': northing,
+                'power': np.repeat(3, len(i)),
+                'gain': np.repeat(2, len(i)),
+                'draft': np.repeat(0.5, len(i)),
+                'gps_mode': np.repeat(4, len(i)),
+                'hdop': np.repeat(0.9, len(i)),
+                'event': [
+                    'EVENT %d' % (j + 1) if j % event_interval == 0 else ''
+                    for j in i
+                ],
+            })
+        else:
+            chunk.update({
+                'time_tag': 40000. + seconds / 86400.,
+                'sats': np.repeat(9, len(i)),
+                'draft': np.repeat(0.5, len(i)),
+                'window_max': np.repeat(15., len(i)),
+                'xd_range': lengths * spdos / (2. * rate),
+                'volts': np.repeat(5., len(i)),
+                'longitude': longitude,
+                'latitude': latitude,
+                'x': easting,
+                'y': northing,
+                'hdop': np.repeat(0.9, len(i)),
+                'power': np.repeat(3, len(i)),
+                'gain': np.repeat(2, len(i)),
+                'gps_mode': np.where(held, 0, 4),
+                'select': np.where(transducer == transducers[0], 1, 2),
+            })
+        yield chunk
+
+
+def _encode_bin_records(chunk, pre_structs, post_structs):
+    """Returns a tuple of (records, n) where records is a uint8 array holding
+    the encoded bin records of the traces in chunk, and n the number of
+    traces
+    """
+    values, lengths = _sample_rows(chunk['samples'], chunk.get('num_pnts'))
+    n = len(lengths)
+    events = chunk.get('event')
+    if events is None:
+        events = [''] * n
+    event_len = np.array([len(event) for event in events], dtype=np.int64)
+
+    pre_records = _struct_records(chunk, pre_structs, n)
+    post_records = _struct_records(chunk, post_structs, n)
+    pre_size = pre_records.dtype.itemsize
+    header_size = pre_size + event_len + post_records.dtype.itemsize
+    pre_records['offset'] = header_size - 2
+    pre_records['num_pnts'] = lengths
+    pre_records['event_len'] = event_len
+
+    starts, buf = _record_buffer(header_size + 2 * lengths)
+    _scatter(buf, starts, pre_records)
+    for i in np.nonzero(event_len)[0]:
+        event_start = starts[i] + pre_size
+        buf[event_start:event_start + event_len[i]] = np.frombuffer(
+            events[i], dtype=np.uint8)
+    _scatter(buf, starts + pre_size + event_len, post_records)
+    _scatter_samples(buf, starts + header_size, values, lengths, '<u2')
+    return buf, n
+
+
+def _encode_bss_records(chunk, rec_structs, prev_record_size=0):
+    """Returns a tuple of (records, n, record_size) where records is a uint8
+    array holding the encoded bss records of the traces in chunk, n the
+    number of traces and record_size the size of the last record, which
+    is the PrevRecordSize of the record that follows. `prev_record_size` is
+    the size of the record preceding the chunk, or 0 at the start of a file.
+    """
+    values, lengths = _sample_rows(chunk['samples'], chunk.get('num_pnts'))
+    n = len(lengths)
+    records = _struct_records(chunk, rec_structs, n)
+    header_size = records.dtype.itemsize + BSS_RESERVED_SIZE
+    record_size = header_size + 2 * lengths
+    records['bss_size'] = header_size - 2
+    records['num_pnts'] = lengths
+    records['prev_record_size'] = np.append(prev_record_size, record_size[:-1])
+
+    starts, buf = _record_buffer(record_size)
+    _scatter(buf, starts, records)
+    reserved = starts[:, np.newaxis] + records.dtype.itemsize + np.arange(
+        BSS_RESERVED_SIZE)
+    buf[reserved] = 0
+    _scatter_samples(buf, starts + header_size, values, lengths, '<i2')
+    return buf, n, record_size[-1] if n else prev_record_size
+
+
+def _struct_records(chunk, struct_list, n):
+    """Returns a structured array of n records laid out as in struct_list,
+    holding the fields found in chunk and zeros elsewhere
+    """
+    records = np.zeros(n, dtype=_record_dtype(struct_list))
+    for name, fmt, dtype in struct_list:
+        if name in chunk:
+            records[name] = chunk[name]
+    return records
+
+
+def _sample_rows(samples, num_pnts=None):
+    """Returns a tuple of (values, lengths) with the samples of all traces
+    back to back and the number of samples of each trace
+    """
+    if isinstance(samples, RaggedArray):
+        return samples.values, samples.lengths
+    if isinstance(samples, np.ndarray) and samples.ndim == 2:
+        if num_pnts is None:
+            lengths = np.repeat(samples.shape[1], len(samples))
+        else:
+            lengths = np.asarray(num_pnts, dtype=np.int64)
+        return RaggedArray.from_padded(samples, lengths).values, lengths
+    ragged = RaggedArray.from_rows([np.asarray(row) for row in samples])
+    return ragged.values, ragged.lengths
+
+
+def _record_buffer(record_sizes):
+    """Returns a tuple of (starts, buf), with the positions of records of
+    the given sizes laid out back to back and a buffer to hold them
+    """
+    record_sizes = np.asarray(record_sizes, dtype=np.int64)
+    starts = np.cumsum(record_sizes) - record_sizes
+    return starts, np.empty(record_sizes.sum(), dtype=np.uint8)
+
+
+def _scatter(buf, starts, records):
+    """Copies each of the structured records to buf, starting at the
+    corresponding position of starts. This is the reverse of
+    sdi.binary._gather_records: buf is viewed as a sequence of (overlapping)
+    records beginning at every byte, and the records are assigned to the
+    ones at starts.
+    """
+    if len(records):
+        _windows(buf, records.dtype)[starts] = records
+
+
+def _scatter_samples(buf, starts, values, lengths, sample_fmt):
+    """Copies the samples of each trace, as 16 bit integers of sample_fmt, to
+    buf starting at the corresponding position of starts. Traces of the same
+    length are copied together, one row per trace.
+    """
+    sample_bytes = np.asarray(values).astype(sample_fmt).view(np.uint8)
+    offsets = 2 * (np.cumsum(lengths) - lengths)
+    for length in np.unique(lengths):
+        if length == 0:
+            continue
+        rows = np.nonzero(lengths == length)[0]
+        row_dtype = np.dtype((np.uint8, (2 * int(length),)))
+        _windows(buf, row_dtype)[starts[rows]] = _windows(
+            sample_bytes, row_dtype)[offsets[rows]]
+
+
+def _windows(buf, dtype):
+    """Returns a view of the uint8 array buf as items of dtype beginning at
+    every byte
+    """
+    return np.ndarray(
+        shape=(max(len(buf) - dtype.itemsize + 1, 0),),
+        dtype=dtype,
+        buffer=buf,
+        strides=(1,),
+    )
+
+
+def _chunks(traces):
+    """Returns traces as a sequence of dicts of arrays"""
+    if isinstance(traces, dict):
+        return [traces]
+    return traces
+
+
+def _last(chunk, key, n, first=False):
+    """Returns the last (or first) value of a field of chunk, or 0 if the
+    field is missing
+    """
+    if key not in chunk:
+        return 0
+    return chunk[key][0 if first else n - 1]
+
+
+def _base_filename(filepath):
+    """Returns the 8 character base filename of a bin file path"""
+    return os.path.splitext(os.path.basename(filepath))[0][:8].ljust(8, '0')
@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from sdi.binary import Dataset, read
+from sdi.cache import DatasetCache
+
+
+class TestCache(unittest.TestCase):
+    """ Test the on-disk cache of parsed datasets
+    """
+
+    def setUp(self):
+        self.test_dir = os.path.dirname(__file__)
+        self.cache_dir = tempfile.mkdtemp()
+        self.filenames = [
+            os.path.join(self.test_dir, 'files', name)
+            for name in ['09112303.bin', '12041101.bin']
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_cached_read(self):
+        """ Test that a dataset loaded from the cache matches the parsed one """
+        cache = DatasetCache(self.cache_dir)
+        for filename in self.filenames:
+            expected = read(filename, cache=cache)
+            self.assertTrue(cache.load(Dataset(filename), 'bin'))
+
+            data = read(filename, cache=self.cache_dir)
+            self.assertEqual(data['date'], expected['date'])
+            self.assertEqual(data['file_version'], expected['file_version'])
+            for freq_dict, expected_dict in zip(
+                    data['frequencies'], expected['frequencies']):
+                self.assertEqual(
+                    sorted(freq_dict.keys()), sorted(expected_dict.keys()))
+                for key, value in expected_dict.iteritems():
+                    np.testing.assert_array_equal(freq_dict[key], value)
+
+    def test_eviction(self):
+        """ Test that least recently used entries are evicted """
+        cache = DatasetCache(self.cache_dir)
+        for filename in self.filenames:
+            read(filename, cache=cache)
+        entry_size = cache.size() / 2
+
+        cache.max_size = entry_size * 1.5
+        cache.evict()
+        self.assertFalse(cache.load(Dataset(self.filenames[0]), 'bin'))
+        self.assertTrue(cache.load(Dataset(self.filenames[1]), 'bin'))
+
+    def test_partially_evicted(self):
+        """ Test that an entry removed while it is loaded is a cache miss
+        that leaves the dataset untouched
+        """
+        cache = DatasetCache(self.cache_dir)
+        read(self.filenames[0], cache=cache)
+        d = Dataset(self.filenames[0])
+        entry = cache._entry_path(d, 'bin')
+        os.remove(os.path.join(entry, 'intensity_image.npy'))
+
+        self.assertFalse(cache.load(d, 'bin'))
+        self.assertFalse(d.parsed)
+        shutil.rmtree(entry)
+        self.assertFalse(cache.load(d, 'bin'))
+
+    def test_invalidate(self):
+        """ Test removing entries from the cache """
+        cache = DatasetCache(self.cache_dir)
+        for filename in self.filenames:
+            read(filename, cache=cache)
+
+        cache.invalidate(self.filenames[0])
+        self.assertFalse(cache.load(Dataset(self.filenames[0]), 'bin'))
+        self.assertTrue(cache.load(Dataset(self.filenames[1]), 'bin'))
+
+        cache.invalidate()
+        self.assertEqual(cache.size(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from sdi import writer
+from sdi.binary import Dataset
+from sdi.catalog import Catalog
+
+
+class TestCatalog(unittest.TestCase):
+    """ Test cataloging a directory tree of SDI files
+    """
+
+    def setUp(self):
+        self.test_dir = os.path.dirname(__file__)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_dir = os.path.join(self.tmp_dir, 'data')
+        os.makedirs(os.path.join(self.data_dir, '2012'))
+        for filename, subdir in [('09112303.bin', ''), ('12041101.bin', '2012')]:
+            shutil.copy(
+                os.path.join(self.test_dir, 'files', filename),
+                os.path.join(self.data_dir, subdir))
+        self.catalog = Catalog(os.path.join(self.tmp_dir, 'catalog.db'))
+
+    def tearDown(self):
+        self.catalog.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_summary(self):
+        """ Test that the summary of a file matches the parsed file """
+        filename = os.path.join(self.test_dir, 'files', '09112303.bin')
+        summary = Dataset(filename).summary()
+        d = Dataset(filename)
+        d.parse()
+
+        self.assertEqual(summary['trace_count'], len(d.trace_metadata['kHz']))
+        self.assertEqual(
+            [transducer for transducer, kHz in summary['frequencies']],
+            list(np.unique(d.trace_metadata['transducer'])))
+        self.assertEqual(summary['start_time'].date(), d.date)
+        self.assertEqual(
+            summary['longitude'],
+            (d.trace_metadata['longitude'].min(),
+             d.trace_metadata['longitude'].max()))
+
+    def test_summary_from_index(self):
+        """ Test that the summary of a file with a sidecar index is made
+        without scanning its records
+        """
+        filename = os.path.join(self.data_dir, '09112303.bin')
+        expected = Dataset(filename).summary()
+        Dataset(filename).save_index()
+
+        d = Dataset(filename)
+
+        def locate_records(*args, **kwargs):
+            raise AssertionError("records scanned")
+
+        d._locate_records = locate_records
+        self.assertEqual(d.summary(), expected)
+
+    def test_update(self):
+        """ Test that only new and changed files are scanned """
+        with open(os.path.join(self.data_dir, 'broken.bin'), 'wb') as f:
+            f.write('\0')
+        counts = self.catalog.update(self.data_dir)
+        self.assertEqual((counts['added'], counts['failed']), (3, 1))
+        self.assertEqual(len(self.catalog), 3)
+
+        counts = self.catalog.update(self.data_dir)
+        self.assertEqual((counts['added'], counts['unchanged']), (0, 3))
+
+        os.remove(os.path.join(self.data_dir, '2012', '12041101.bin'))
+        os.utime(os.path.join(self.data_dir, '09112303.bin'), (0, 0))
+        counts = self.catalog.update(self.data_dir)
+        self.assertEqual(
+            (counts['updated'], counts['removed'], counts['unchanged']),
+            (1, 1, 1))
+        self.assertEqual(len(self.catalog), 2)
+
+    def test_search(self):
+        """ Test looking up lines by area, date, time and frequency """
+        self.catalog.update(self.data_dir, workers=2)
+
+        lines = self.catalog.search(kHz=24)
+        self.assertEqual(
+            [line['survey_line_number'] for line in lines],
+            ['09112303', '12041101'])
+        lines = self.catalog.search(
+            bbox=(-94.6, 32.7, -94.5, 32.8), date=datetime.date(2009, 11, 23))
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(lines[0]['trace_count'], 686)
+        self.assertEqual(
+            self.catalog.search(start=datetime.datetime(2012, 4, 11, 8, 20)),
+            self.catalog.search(date=datetime.date(2012, 4, 11)))
+        self.assertEqual(self.catalog.search(kHz=12), [])
+
+    def test_line_names(self):
+        """ Test that lines are named alike in bin and bss files """
+        writer.write_bss(
+            os.path.join(self.data_dir, '2012', '12041101.bss'),
+            writer.synthetic_traces(100, file_format='bss'))
+        self.catalog.update(self.data_dir)
+
+        names = dict(
+            (line['file_format'], line['survey_line_number'])
+            for line in self.catalog.search(date=datetime.date(2012, 4, 11)))
+        self.assertEqual(names, {'bin': '12041101', 'bss': '12041101'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import os
+import unittest
+
+import numpy as np
+
+from sdi.binary import Dataset
+
+
+class TestFields(unittest.TestCase):
+    """ Test decoding only a selection of the record fields
+    """
+
+    def setUp(self):
+        self.test_dir = os.path.dirname(__file__)
+        self.filename = os.path.join(self.test_dir, 'files', '09112303.bin')
+
+    def test_selected_fields(self):
+        """ Test that selected fields match a full read and that other fields
+        are left out
+        """
+        expected = Dataset(self.filename).as_dict(separate=False)
+        fields = ['depth_r1', 'interpolated_easting', 'min_window', 'intensity']
+        data = Dataset(self.filename).as_dict(separate=False, fields=fields)
+
+        for key in fields:
+            np.testing.assert_array_equal(data[key], expected[key])
+        self.assertNotIn('max_window', data)
+        self.assertNotIn('latitude', data)
+
+    def test_without_intensity(self):
+        """ Test that intensities are not decoded unless selected """
+        d = Dataset(self.filename)
+        d.parse(fields=['latitude'])
+        self.assertIsNone(d.intensity_image)
+        for freq_dict in d.as_dict()['frequencies']:
+            self.assertEqual(
+                sorted(freq_dict), ['kHz', 'latitude', 'transducer'])
+
+    def test_unknown_field(self):
+        """ Test that an unknown field raises a ValueError """
+        d = Dataset(self.filename)
+        self.assertRaises(ValueError, d.parse, fields=['min_window10'])
+
+
+if __name__ == '__main__':
+    unittest.main()
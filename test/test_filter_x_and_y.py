@@ -0,0 +1,85 @@
+import unittest
+
+import numpy as np
+from numpy import nan
+
+from sdi.binary import Dataset, _fill_nans_with_last
+
+
+class TestFilterXAndY(unittest.TestCase):
+    """ Test GPS glitch filtering
+    """
+
+    def setUp(self):
+        self.dataset = Dataset(None)
+        steps = np.repeat(np.linspace(0.5, 1.5, 50), 2)
+        self.x = 500000 + np.cumsum(steps)
+        self.y = 3300000 + np.cumsum(steps)
+
+    def test_no_glitches(self):
+        """Test that a clean track is left alone"""
+        x, y = self.dataset.filter_x_and_y(self.x, self.y)
+        np.testing.assert_array_equal(x, self.x)
+        np.testing.assert_array_equal(y, self.y)
+
+    def test_glitch(self):
+        """Test that a glitch is replaced with the last good position"""
+        x = self.x.copy()
+        x[40:43] += 1e6
+        good_x, good_y = self.dataset.filter_x_and_y(x, self.y)
+        expected = self.x.copy()
+        expected[40:43] = self.x[39]
+        np.testing.assert_array_equal(good_x, expected)
+
+    def test_several_glitches(self):
+        """Test that several glitches found in the same pass are all
+        removed
+        """
+        x = self.x.copy()
+        y = self.y.copy()
+        x[20] += 1e6
+        x[60] -= 2e6
+        y[80] += 3e6
+        good_x, good_y = self.dataset.filter_x_and_y(x, y)
+        self.assertLess(np.abs(good_x - self.x).max(), 10)
+        self.assertLess(np.abs(good_y - self.y).max(), 10)
+
+    def test_max_passes(self):
+        """Test that smaller glitches are only found in later passes"""
+        x = self.x.copy()
+        x[20] += 1e12
+        x[60] += 1e6
+        good_x, _ = self.dataset.filter_x_and_y(x, self.y, max_passes=1)
+        self.assertEqual(good_x[20], good_x[19])
+        self.assertEqual(good_x[60], x[60])
+        good_x, _ = self.dataset.filter_x_and_y(x, self.y)
+        self.assertEqual(good_x[60], good_x[59])
+
+
+class TestFillNansWithLast(unittest.TestCase):
+    """ Test _fill_nans_with_last helper function
+    """
+
+    def test_fill(self):
+        """Test that NaNs are filled with the last value, and leading NaNs
+        with the first value
+        """
+        arr = np.array([nan, nan, 1., nan, 2., 3., nan, nan, nan])
+        np.testing.assert_array_equal(
+            _fill_nans_with_last(arr),
+            np.array([1., 1., 1., 1., 2., 3., 3., 3., 3.]))
+
+    def test_long_run(self):
+        """Test filling a long run of NaNs"""
+        arr = np.empty(100000)
+        arr.fill(nan)
+        arr[0] = 5.
+        np.testing.assert_array_equal(_fill_nans_with_last(arr), 5.)
+
+    def test_all_nans(self):
+        """Test that an array with only NaNs raises a ValueError"""
+        self.assertRaises(ValueError, _fill_nans_with_last, np.array([nan]))
+
+
+if __name__ == '__main__':
+    unittest.main()
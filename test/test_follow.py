@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from sdi import binary
+from sdi.binary import Dataset
+
+
+class TestFollow(unittest.TestCase):
+    """ Test incremental reading of a file that is still being recorded
+    """
+
+    def setUp(self):
+        self.test_dir = os.path.dirname(__file__)
+        self.filename = os.path.join(self.test_dir, 'files', '09112303.bin')
+        self.tmp_dir = tempfile.mkdtemp()
+        self.live_filename = os.path.join(self.tmp_dir, '09112303.bin')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_refresh(self):
+        """ Test that refreshing while the file is written, including in the
+        middle of a record, gives the same data as reading the whole file
+        """
+        with open(self.filename, 'rb') as f:
+            contents = f.read()
+        expected = Dataset(self.filename).as_dict(separate=False)
+
+        d = Dataset(self.live_filename)
+        new_traces = []
+        written = 0
+        for end in [12, len(contents) // 3, len(contents) // 2 + 5,
+                    len(contents)]:
+            with open(self.live_filename, 'ab') as f:
+                f.write(contents[written:end])
+            written = end
+            new_traces.append(d.refresh())
+
+        self.assertEqual(new_traces[0], 0)
+        self.assertEqual(sum(new_traces), len(expected['trace_num']))
+        data = d.as_dict(separate=False)
+        for key in ['trace_num', 'depth_r1', 'interpolated_easting',
+                    'intensity']:
+            np.testing.assert_array_equal(data[key], expected[key])
+
+    def test_refresh_closes_map(self):
+        """ Test that each refresh closes the memory map of the file """
+        maps = []
+
+        def map_file(filepath):
+            maps.append(map_file_orig(filepath))
+            return maps[-1]
+
+        map_file_orig = binary._map_file
+        binary._map_file = map_file
+        try:
+            shutil.copy(self.filename, self.live_filename)
+            d = Dataset(self.live_filename)
+            counts = [d.refresh() for i in range(50)]
+        finally:
+            binary._map_file = map_file_orig
+
+        self.assertEqual(counts[0], 686)
+        self.assertEqual(sum(counts), 686)
+        self.assertEqual(len(maps), 50)
+        for fid in maps:
+            self.assertRaises(ValueError, fid.tell)
+        self.assertEqual(len(d.trace_metadata['trace_num']), 686)
+        self.assertEqual(d.intensity_image.shape[0], 686)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import unittest
+
+import numpy as np
+
+from sdi.binary import Dataset
+
+
+class TestGrouped(unittest.TestCase):
+    """ Test grouping the traces by frequency
+    """
+
+    def setUp(self):
+        self.test_dir = os.path.dirname(__file__)
+        self.filename = os.path.join(self.test_dir, 'files', '09112303.bin')
+
+    def test_grouped_frequencies(self):
+        """ Test that grouped frequency dicts are views that match the
+        frequency dicts of an interleaved dataset
+        """
+        expected = Dataset(self.filename).as_dict()
+        d = Dataset(self.filename)
+        d.parse(grouped=True)
+
+        for freq_dict, expected_dict in zip(
+                d.frequencies, expected['frequencies']):
+            self.assertEqual(sorted(freq_dict), sorted(expected_dict))
+            for key in ['depth_r1', 'interpolated_easting', 'intensity']:
+                np.testing.assert_array_equal(
+                    freq_dict[key], expected_dict[key])
+            self.assertTrue(np.may_share_memory(
+                freq_dict['intensity'], d.intensity_image))
+            self.assertTrue(np.may_share_memory(
+                freq_dict['depth_r1'], d.trace_metadata['depth_r1']))
+
+    def test_interleaved_index(self):
+        """ Test that interleaved_index restores the recorded order """
+        expected = Dataset(self.filename).as_dict(separate=False)
+        data = Dataset(self.filename).as_dict(separate=False, grouped=True)
+        index = data['interleaved_index']
+
+        self.assertTrue(np.all(np.diff(data['transducer']) >= 0))
+        for key in ['transducer', 'trace_num', 'latitude', 'intensity']:
+            np.testing.assert_array_equal(data[key][index], expected[key])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from sdi import index
+from sdi.binary import Dataset
+
+
+class TestIndex(unittest.TestCase):
+    """ Test saving and loading record index sidecar files
+    """
+
+    def setUp(self):
+        self.test_dir = os.path.dirname(__file__)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_dir, '09112303.bin')
+        shutil.copy(
+            os.path.join(self.test_dir, 'files', '09112303.bin'), self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_save_and_load(self):
+        """ Test that a saved index is reused by later opens """
+        expected = Dataset(self.filename).index_records()
+        path = Dataset(self.filename).save_index()
+        self.assertEqual(path, self.filename + '.sdiidx')
+
+        loaded = index.load(self.filename, 'bin')
+        self.assertEqual(sorted(loaded.keys()), sorted(expected.keys()))
+        for key, array in expected.iteritems():
+            np.testing.assert_array_equal(loaded[key], array)
+
+        self.assertIsNone(index.load(self.filename, 'bss'))
+
+        d = Dataset(self.filename)
+        d.parse(decode='vectorized')
+        self.assertIsNotNone(d._record_index)
+        np.testing.assert_array_equal(
+            d.trace_metadata['trace_num'], expected['trace_num'])
+
+    def test_default_parse_uses_index(self):
+        """ Test that the default struct decoder reuses a saved index """
+        expected = Dataset(self.filename)
+        expected.parse()
+        Dataset(self.filename).save_index()
+
+        d = Dataset(self.filename)
+        d.parse()
+        self.assertIsNotNone(d._record_index)
+        for key in ['trace_num', 'depth_r1', 'interpolated_easting']:
+            np.testing.assert_array_equal(
+                d.trace_metadata[key], expected.trace_metadata[key])
+        np.testing.assert_array_equal(
+            d.intensity_image, expected.intensity_image)
+
+    def test_stale_index(self):
+        """ Test that a sidecar is ignored once the data file changes """
+        Dataset(self.filename).save_index()
+        with open(self.filename, 'ab') as f:
+            f.write(b'\0' * 10)
+        self.assertIsNone(index.load(self.filename, 'bin'))
+
+        Dataset(self.filename).save_index()
+        stat = os.stat(self.filename)
+        os.utime(self.filename, (stat.st_atime, stat.st_mtime - 60))
+        self.assertIsNone(index.load(self.filename, 'bin'))
+
+
+if __name__ == '__main__':
+    unittest.main()
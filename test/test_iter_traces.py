@@ -0,0 +1,47 @@
+import os
+import unittest
+
+import numpy as np
+
+from sdi.binary import Dataset
+
+
+class TestIterTraces(unittest.TestCase):
+    """ Test streaming traces out of binary files
+    """
+
+    def setUp(self):
+        self.test_dir = os.path.dirname(__file__)
+        self.filename = os.path.join(self.test_dir, 'files', '09112303.bin')
+        self.dataset = Dataset(self.filename)
+        self.dataset.parse()
+
+    def test_iter_chunks(self):
+        """ Test that chunks add up to the fully parsed file """
+        chunks = list(Dataset(self.filename).iter_chunks(100))
+        self.assertEqual(len(chunks), 7)
+        self.assertTrue(all(len(c['trace_num']) <= 100 for c in chunks))
+
+        for key in ['trace_num', 'depth_r1', 'draft', 'kHz', 'pixel_resolution']:
+            array = np.concatenate([c[key] for c in chunks])
+            np.testing.assert_array_equal(array, self.dataset.trace_metadata[key])
+
+        first = chunks[0]['intensity']
+        np.testing.assert_array_equal(
+            first, self.dataset.intensity_image[:100, :first.shape[1]])
+
+    def test_iter_traces(self):
+        """ Test that traces are yielded one at a time and in order """
+        count = 0
+        for i, trace in enumerate(Dataset(self.filename).iter_traces(chunk_size=64)):
+            self.assertEqual(trace['trace_num'], self.dataset.trace_metadata['trace_num'][i])
+            self.assertEqual(len(trace['intensity']), trace['num_pnts'])
+            np.testing.assert_array_equal(
+                trace['intensity'],
+                self.dataset.intensity_image[i, :trace['num_pnts']])
+            count += 1
+        self.assertEqual(count, len(self.dataset.trace_metadata['trace_num']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import unittest
+
+import numpy as np
+
+from sdi.binary import Dataset
+
+
+class TestLazy(unittest.TestCase):
+    """ Test metadata-only parsing with intensities decoded on access
+    """
+
+    def setUp(self):
+        self.test_dir = os.path.dirname(__file__)
+        self.filename = os.path.join(self.test_dir, 'files', '09112303.bin')
+
+    def test_lazy_intensity_image(self):
+        """ Test that a lazily decoded intensity image matches the eager one
+        """
+        expected = Dataset(self.filename)
+        expected.parse()
+
+        for decode in ['struct', 'vectorized']:
+            d = Dataset(self.filename)
+            d.parse(decode=decode, lazy=True)
+            self.assertIsNone(d._intensity_image)
+            np.testing.assert_array_equal(
+                d.trace_metadata['depth_r1'],
+                expected.trace_metadata['depth_r1'])
+            np.testing.assert_array_equal(
+                d.intensity_image, expected.intensity_image)
+
+    def test_lazy_frequencies(self):
+        """ Test that frequency intensities are decoded one at a time and
+        match the eager ones
+        """
+        expected = Dataset(self.filename).as_dict()
+        data = Dataset(self.filename).as_dict(lazy=True)
+
+        for freq_dict, expected_dict in zip(
+                data['frequencies'], expected['frequencies']):
+            self.assertEqual(sorted(freq_dict.keys()), sorted(expected_dict.keys()))
+            np.testing.assert_array_equal(
+                freq_dict['intensity'], expected_dict['intensity'])
+
+    def test_lazy_derived_fields(self):
+        """ Test that derived trace fields are only computed on access """
+        d = Dataset(self.filename)
+        d.parse()
+        self.assertTrue(d.trace_metadata.is_lazy('interpolated_easting'))
+        self.assertFalse(d.trace_metadata.is_lazy('depth_r1'))
+
+        freq_dict = d.frequencies[0]
+        self.assertTrue(freq_dict.is_lazy('pixel_resolution'))
+        rows = d.trace_metadata['transducer'] == freq_dict['transducer'][0]
+        np.testing.assert_array_equal(
+            freq_dict['pixel_resolution'],
+            d.trace_metadata['pixel_resolution'][rows])
+        self.assertFalse(freq_dict.is_lazy('pixel_resolution'))
+        self.assertFalse(d.trace_metadata.is_lazy('pixel_resolution'))
+        self.assertTrue(d.trace_metadata.is_lazy('interpolated_easting'))
+
+        data = d.as_dict(separate=False)
+        self.assertIn('interpolated_easting', data)
+        self.assertIn('microsecond', data)
+        self.assertNotIn('centisecond', data)
+
+
+if __name__ == '__main__':
+    unittest.main()
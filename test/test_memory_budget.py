@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+
+import numpy as np
+
+from sdi.binary import Dataset
+
+
+class TestMemoryBudget(unittest.TestCase):
+    """ Test parsing within a memory budget
+    """
+
+    def setUp(self):
+        self.test_dir = os.path.dirname(__file__)
+        self.filename = os.path.join(self.test_dir, 'files', '09112303.bin')
+        self.spill_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.spill_dir)
+
+    def test_within_budget(self):
+        """ Test that nothing is spilled when everything fits """
+        expected = Dataset(self.filename)
+        expected.parse()
+
+        d = Dataset(self.filename)
+        d.parse(max_memory=2 ** 30, spill_dir=self.spill_dir)
+        self.assertNotIsInstance(d.intensity_image, np.memmap)
+        self.assertIsNone(d.intensities)
+        self.assertEqual(d.memory_report['spilled_bytes'], 0)
+        self.assertGreaterEqual(
+            d.memory_report['peak_bytes'], d.intensity_image.nbytes)
+        np.testing.assert_array_equal(
+            d.intensity_image, expected.intensity_image)
+
+    def test_spill(self):
+        """ Test that intensity images that don't fit are spilled to disk and
+        match those that aren't
+        """
+        expected = Dataset(self.filename)
+        expected.parse()
+
+        for kwargs in [{}, {'grouped': True}, {'workers': 2}]:
+            d = Dataset(self.filename)
+            with warnings.catch_warnings(record=True) as w:
+                warnings.simplefilter('always')
+                d.parse(max_memory=1, spill_dir=self.spill_dir, **kwargs)
+            self.assertEqual(len(w), 1)
+            self.assertIsInstance(d.intensity_image, np.memmap)
+            self.assertGreaterEqual(
+                d.memory_report['spilled_bytes'], d.intensity_image.nbytes)
+            self.assertEqual(os.listdir(self.spill_dir), [])
+
+            image = d.intensity_image
+            if 'grouped' in kwargs:
+                image = image[d.interleaved_index]
+            np.testing.assert_array_equal(image, expected.intensity_image)
+            for freq_dict, expected_dict in zip(
+                    d.frequencies, expected.frequencies):
+                np.testing.assert_array_equal(
+                    freq_dict['intensity'], expected_dict['intensity'])
+
+    def test_refresh(self):
+        """ Test that a file that is still being recorded can be refreshed
+        within a budget, and that the refreshed records are counted
+        """
+        with open(self.filename, 'rb') as f:
+            contents = f.read()
+        expected = Dataset(self.filename)
+        expected.parse()
+
+        filename = os.path.join(self.spill_dir, '09112303.bin')
+        with open(filename, 'wb') as f:
+            f.write(contents[:len(contents) // 2])
+        d = Dataset(filename)
+        d.parse(max_memory=10 ** 7)
+        d.refresh()
+        in_use = d._memory_in_use()
+        with open(filename, 'ab') as f:
+            f.write(contents[len(contents) // 2:])
+        d.refresh()
+
+        self.assertGreater(d._memory_in_use(), in_use)
+        self.assertGreaterEqual(
+            d._memory_in_use(), d.intensity_image.nbytes)
+        np.testing.assert_array_equal(
+            d.intensity_image, expected.intensity_image)
+
+    def test_ragged(self):
+        """ Test that ragged intensities can't be parsed within a budget """
+        self.assertRaises(
+            ValueError, Dataset(self.filename).parse, ragged=True,
+            max_memory=2 ** 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -23,6 +23,65 @@ class TestRead(unittest.TestCase):
                     self.assertLessEqual(np.nanmax(d.intensity_image), np.float64(1))
                     self.assertGreaterEqual(np.nanmin(d.intensity_image), np.float64(0))
 
+    def test_float32_intensities(self):
+        """ Test that float32 intensities match the float64 intensities """
+        filename = os.path.join(self.test_dir, 'files', '09112303.bin')
+        expected = Dataset(filename)
+        expected.parse()
+        d = Dataset(filename)
+        d.parse(intensity_dtype='float32')
+        self.assertEqual(d.intensity_image.dtype, np.float32)
+        np.testing.assert_array_equal(
+            d.intensity_image, expected.intensity_image.astype(np.float32))
+
+    def test_uint8_intensities(self):
+        """ Test that uint8 intensities follow the Pascal conversion code """
+        filename = os.path.join(self.test_dir, 'files', '09112303.bin')
+        d = Dataset(filename)
+        d.parse(intensity_dtype='uint8')
+        self.assertEqual(d.intensity_image.dtype, np.uint8)
+        transducer = d.trace_metadata['transducer']
+        for row, raw, unipolar in zip(
+                d.intensity_image, d.intensities, transducer == 1):
+            raw = raw.astype(np.float64)
+            if unipolar:
+                expected = np.round(raw / 257.0)
+            else:
+                expected = np.minimum(np.round(np.abs(raw - 32768) / 128), 255)
+            np.testing.assert_array_equal(row[:len(raw)], expected)
+            self.assertTrue(np.all(row[len(raw):] == 0))
+
+    def test_unsupported_intensity_dtype(self):
+        """ Test that an unsupported intensity dtype raises a ValueError """
+        filename = os.path.join(self.test_dir, 'files', '09112303.bin')
+        d = Dataset(filename)
+        self.assertRaises(ValueError, d.parse, intensity_dtype='int32')
+
+    def test_out_buffer(self):
+        """ Test that intensities can be decoded into a given buffer """
+        filename = os.path.join(self.test_dir, 'files', '09112303.bin')
+        expected = Dataset(filename)
+        expected.parse()
+
+        d = Dataset(filename)
+        index = d.index_records()
+        out = np.zeros((len(index['start']), expected.intensity_image.shape[1]))
+        d.parse(out=out)
+        self.assertIs(d.intensity_image, out)
+        np.testing.assert_array_equal(out, expected.intensity_image)
+
+        expected_traces = d.read_traces(5, 10)
+        out = np.zeros_like(expected_traces['intensity'])
+        traces = d.read_traces(5, 10, out=out)
+        self.assertIs(traces['intensity'], out)
+        np.testing.assert_array_equal(out, expected_traces['intensity'])
+
+    def test_out_buffer_mismatch(self):
+        """ Test that a buffer of the wrong shape or dtype is rejected """
+        filename = os.path.join(self.test_dir, 'files', '09112303.bin')
+        d = Dataset(filename)
+        self.assertRaises(ValueError, d.parse, out=np.zeros((3, 3)))
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
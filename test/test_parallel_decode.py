@@ -0,0 +1,52 @@
+import os
+import unittest
+
+import numpy as np
+
+from sdi.binary import Dataset
+
+
+class TestParallelDecode(unittest.TestCase):
+    """ Test that decoding a file in parallel chunks matches the serial path
+    """
+
+    def setUp(self):
+        self.test_dir = os.path.dirname(__file__)
+        self.filenames = [
+            os.path.join(self.test_dir, 'files', name)
+            for name in ['09112303.bin', '12041101.bin']
+        ]
+
+    def assertDatasetsEqual(self, d, expected):
+        self.assertEqual(
+            sorted(d.trace_metadata.keys()),
+            sorted(expected.trace_metadata.keys()))
+        for key, array in expected.trace_metadata.iteritems():
+            self.assertEqual(d.trace_metadata[key].dtype, array.dtype)
+            np.testing.assert_array_equal(d.trace_metadata[key], array)
+        np.testing.assert_array_equal(
+            d.intensity_image, expected.intensity_image)
+        self.assertEqual(len(d.intensities), len(expected.intensities))
+        for row, expected_row in zip(d.intensities, expected.intensities):
+            np.testing.assert_array_equal(row, expected_row)
+
+    def test_threads(self):
+        """ Test that decoding in threads matches the serial decoder """
+        for filename in self.filenames:
+            expected = Dataset(filename)
+            expected.parse()
+            d = Dataset(filename)
+            d.parse(workers=3)
+            self.assertDatasetsEqual(d, expected)
+
+    def test_processes(self):
+        """ Test that decoding in processes matches the serial decoder """
+        expected = Dataset(self.filenames[0])
+        expected.parse()
+        d = Dataset(self.filenames[0])
+        d.parse(workers=2, processes=True)
+        self.assertDatasetsEqual(d, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
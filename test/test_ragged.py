@@ -0,0 +1,96 @@
+import os
+import unittest
+
+import numpy as np
+
+from sdi.binary import Dataset
+from sdi.ragged import RaggedArray
+
+
+class TestRaggedArray(unittest.TestCase):
+    """ Test the ragged intensity storage
+    """
+
+    def setUp(self):
+        self.rows = [
+            np.array([1., 2., 3.]),
+            np.array([4.]),
+            np.array([]),
+            np.array([5., 6.]),
+        ]
+        self.ragged = RaggedArray.from_rows(self.rows)
+
+    def test_rows(self):
+        """ Test that rows can be accessed by position """
+        self.assertEqual(len(self.ragged), 4)
+        np.testing.assert_array_equal(self.ragged.lengths, [3, 1, 0, 2])
+        for row, expected in zip(self.ragged, self.rows):
+            np.testing.assert_array_equal(row, expected)
+        np.testing.assert_array_equal(self.ragged[-1], [5., 6.])
+
+    def test_padded(self):
+        """ Test that the padded image is padded with NaNs """
+        expected = np.array([
+            [1., 2., 3.],
+            [4., np.nan, np.nan],
+            [np.nan, np.nan, np.nan],
+            [5., 6., np.nan],
+        ])
+        np.testing.assert_array_equal(self.ragged.padded(), expected)
+        ragged = RaggedArray.from_padded(expected, [3, 1, 0, 2])
+        np.testing.assert_array_equal(ragged.values, self.ragged.values)
+
+    def test_select_rows(self):
+        """ Test that selecting rows keeps the width of the padded image """
+        image = self.ragged.padded()
+        for key in [slice(1, 3), slice(None, None, 2), np.array([3, 0]),
+                    np.array([True, False, False, True])]:
+            selected = self.ragged[key]
+            self.assertIsInstance(selected, RaggedArray)
+            np.testing.assert_array_equal(selected.padded(), image[key])
+
+
+class TestRaggedIntensities(unittest.TestCase):
+    """ Test parsing files with ragged intensities
+    """
+
+    def setUp(self):
+        self.test_dir = os.path.dirname(__file__)
+
+    def test_ragged_matches_padded(self):
+        """ Test that ragged intensities pad to the default intensities """
+        for filename in ['09112303.bin', '12041101.bin']:
+            path = os.path.join(self.test_dir, 'files', filename)
+            expected = Dataset(path)
+            expected.parse()
+            for decode in ['struct', 'vectorized']:
+                d = Dataset(path)
+                d.parse(decode=decode, ragged=True)
+                self.assertIsInstance(d.intensity_image, RaggedArray)
+                np.testing.assert_array_equal(
+                    d.intensity_image.padded(), expected.intensity_image)
+                for freq_dict, expected_dict in zip(
+                        d.frequencies, expected.frequencies):
+                    np.testing.assert_array_equal(
+                        freq_dict['intensity'].padded(),
+                        expected_dict['intensity'])
+
+    def test_normalize_scale(self):
+        """ Test that ragged samples are normalized like padded ones """
+        path = os.path.join(self.test_dir, 'files', '09112303.bin')
+        raw = RaggedArray.from_rows(
+            [np.arange(n, dtype='<u2') * 4099 for n in [3, 0, 16, 16, 2]])
+        transducer = np.array([1, 2, 1, 2, 1])
+        for intensity_dtype in ['float64', 'float32', 'uint8']:
+            d = Dataset(path)
+            d.parse(intensity_dtype=intensity_dtype)
+            ragged = d._normalize_scale(raw, transducer=transducer)
+            self.assertIsInstance(ragged, RaggedArray)
+            self.assertEqual(ragged.dtype, np.dtype(intensity_dtype))
+            np.testing.assert_array_equal(
+                ragged.padded(),
+                d._normalize_scale(raw.padded(dtype=np.float64), transducer))
+
+
+if __name__ == '__main__':
+    unittest.main()
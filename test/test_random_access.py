@@ -0,0 +1,57 @@
+import os
+import unittest
+from datetime import datetime
+
+import numpy as np
+
+from sdi.binary import Dataset
+
+
+class TestRandomAccess(unittest.TestCase):
+    """ Test reading selected traces out of binary files
+    """
+
+    def setUp(self):
+        self.test_dir = os.path.dirname(__file__)
+        self.filename = os.path.join(self.test_dir, 'files', '12041101.bin')
+        self.dataset = Dataset(self.filename)
+        self.dataset.parse()
+
+    def test_index_records(self):
+        """ Test that the record index has one entry per trace """
+        index = Dataset(self.filename).index_records()
+        np.testing.assert_array_equal(
+            index['trace_num'], self.dataset.trace_metadata['trace_num'])
+        np.testing.assert_array_equal(
+            index['transducer'], self.dataset.trace_metadata['transducer'])
+        self.assertEqual(index['start'][0], 12)
+        self.assertTrue(np.all(np.diff(index['time_tag']) >= 0))
+
+    def test_read_traces(self):
+        """ Test that a range of traces matches the fully parsed file """
+        traces = Dataset(self.filename).read_traces(1000, 1250)
+        self.assertEqual(len(traces['trace_num']), 250)
+        for key in ['trace_num', 'depth_r1', 'kHz', 'draft']:
+            np.testing.assert_array_equal(
+                traces[key], self.dataset.trace_metadata[key][1000:1250])
+        np.testing.assert_array_equal(
+            traces['intensity'],
+            self.dataset.intensity_image[1000:1250, :traces['intensity'].shape[1]])
+
+    def test_read_time_range(self):
+        """ Test that traces are selected by the time they were recorded """
+        metadata = self.dataset.trace_metadata
+        t0 = datetime(2012, 4, 11, 8, 15, 31, 950000)
+        t1 = datetime(2012, 4, 11, 8, 15, 33, 200000)
+        traces = Dataset(self.filename).read_time_range(t0, t1)
+
+        seconds = (metadata['hour'] * 3600. + metadata['minute'] * 60. +
+                   metadata['second'] + metadata['microsecond'] / 1e6)
+        expected = metadata['trace_num'][
+            (seconds >= 29731.949) & (seconds <= 29733.201)]
+        self.assertTrue(len(expected) > 0)
+        np.testing.assert_array_equal(traces['trace_num'], expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
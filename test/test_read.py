@@ -1,3 +1,4 @@
+import mmap
 import os
 import unittest
 
@@ -62,5 +63,15 @@ class TestRead(unittest.TestCase):
         assert len(data['transducer']) == 3995
         assert len(np.unique(data['kHz'])) == 3
 
+    def test_intensities_view_file(self):
+        """ Test that raw intensities are views into the memory mapped file
+        rather than copies
+        """
+        filename = os.path.join(self.test_dir, 'files', '09112303.bin')
+        d = Dataset(filename)
+        d.parse()
+        self.assertIsInstance(d.intensities[0], np.ndarray)
+        self.assertIsInstance(d.intensities[0].base, mmap.mmap)
+
 if __name__ == '__main__':
     unittest.main()
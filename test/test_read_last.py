@@ -0,0 +1,87 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import warnings
+
+import numpy as np
+
+from sdi import writer
+from sdi.binary import Dataset
+
+
+class TestReadLast(unittest.TestCase):
+    """ Test reading bss files backwards from the end
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_dir, '09112303.bss')
+        num_pnts = [10 + i % 3 for i in range(20)]
+        writer.write_bss(self.filename, {
+            'trace_num': np.arange(1, 21),
+            'transducer': 1 + np.arange(20) % 2,
+            'kHz': np.where(np.arange(20) % 2, 50., 200.),
+            'samples': [np.arange(n) for n in num_pnts],
+        })
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_iter_traces_reversed(self):
+        """ Test that the traces are yielded from last to first """
+        expected = list(Dataset(self.filename).iter_traces(file_format='bss'))
+        traces = list(Dataset(self.filename).iter_traces_reversed(chunk_size=3))
+
+        self.assertEqual(len(traces), len(expected))
+        for trace, expected_trace in zip(traces, expected[::-1]):
+            self.assertEqual(trace['trace_num'], expected_trace['trace_num'])
+            np.testing.assert_array_equal(
+                trace['intensity'], expected_trace['intensity'])
+
+    def test_read_last(self):
+        """ Test that read_last returns the last traces in recorded order,
+        ignoring an incomplete trailing record
+        """
+        traces = Dataset(self.filename).read_last(4)
+        np.testing.assert_array_equal(traces['trace_num'], [17, 18, 19, 20])
+
+        with open(self.filename, 'rb+') as f:
+            f.truncate(os.path.getsize(self.filename) - 5)
+        with warnings.catch_warnings(record=True):
+            warnings.simplefilter('always')
+            traces = Dataset(self.filename).read_last(2)
+        np.testing.assert_array_equal(traces['trace_num'], [18, 19])
+
+    def test_read_none(self):
+        """ Test that no traces are read for n <= 0 """
+        for n in [0, -1]:
+            traces = Dataset(self.filename).read_last(n)
+            self.assertEqual(len(traces['trace_num']), 0)
+
+    def test_corrupt_back_link(self):
+        """ Test that a back-link that doesn't lead to a record is an
+        error, rather than a walk into the file header or the middle of a
+        record
+        """
+        starts = Dataset(self.filename).index_records('bss')['start']
+        for prev_record_size in [starts[15] - 100, 30, 2 ** 31]:
+            with open(self.filename, 'rb+') as f:
+                f.seek(starts[15] + 2)
+                f.write(struct.pack('<L', prev_record_size))
+            self.assertEqual(
+                len(Dataset(self.filename).read_last(5)['trace_num']), 5)
+            self.assertRaises(ValueError, Dataset(self.filename).read_last, 6)
+            self.assertRaises(
+                ValueError, list, Dataset(self.filename).iter_traces_reversed())
+
+    def test_bin_file(self):
+        """ Test that bin files can't be read backwards """
+        filename = os.path.join(
+            os.path.dirname(__file__), 'files', '09112303.bin')
+        self.assertRaises(ValueError, Dataset(filename).read_last, 1, 'bin')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from sdi.binary import read, read_many
+from sdi.cache import DatasetCache
+
+
+class TestReadMany(unittest.TestCase):
+    """ Test reading many files in parallel
+    """
+
+    def setUp(self):
+        self.test_dir = os.path.dirname(__file__)
+        self.filenames = [
+            os.path.join(self.test_dir, 'files', name)
+            for name in ['09112303.bin', '12041101.bin']
+        ]
+
+    def test_read_many(self):
+        """ Test that files read in parallel match files read one by one """
+        results = dict(
+            (filepath, (data, error))
+            for filepath, data, error in read_many(self.filenames, workers=2)
+        )
+        self.assertEqual(sorted(results.keys()), sorted(self.filenames))
+
+        for filepath in self.filenames:
+            data, error = results[filepath]
+            self.assertIsNone(error)
+            expected = read(filepath)
+            for freq_dict, expected_dict in zip(
+                    data['frequencies'], expected['frequencies']):
+                for key, value in expected_dict.iteritems():
+                    np.testing.assert_array_equal(freq_dict[key], value)
+
+    def test_errors(self):
+        """ Test that errors are reported per file """
+        missing = os.path.join(self.test_dir, 'files', 'missing.bin')
+        results = dict(
+            (filepath, (data, error))
+            for filepath, data, error in read_many(
+                [missing] + self.filenames[:1], workers=2)
+        )
+        data, error = results[missing]
+        self.assertIsNone(data)
+        self.assertIsInstance(error, IOError)
+        data, error = results[self.filenames[0]]
+        self.assertIsNone(error)
+        self.assertIn('frequencies', data)
+
+    def test_evicted(self):
+        """ Test that an entry evicted from the cache before it is loaded is
+        reported rather than parsed again
+        """
+        cache_dir = tempfile.mkdtemp()
+        try:
+            results = list(read_many(
+                self.filenames, workers=2,
+                cache=DatasetCache(cache_dir, max_size=1)))
+        finally:
+            shutil.rmtree(cache_dir)
+        self.assertEqual(len(results), 2)
+        for filepath, data, error in results:
+            self.assertIsNone(data)
+            self.assertIsInstance(error, LookupError)
+
+
+if __name__ == '__main__':
+    unittest.main()
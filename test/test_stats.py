@@ -0,0 +1,65 @@
+import os
+import unittest
+
+from sdi.binary import Dataset
+from sdi.stats import ParseCancelled, ParseStats
+
+
+class TestStats(unittest.TestCase):
+    """ Test the instrumentation of parsing
+    """
+
+    def setUp(self):
+        self.test_dir = os.path.dirname(__file__)
+        self.filename = os.path.join(self.test_dir, 'files', '09112303.bin')
+
+    def test_stats(self):
+        """ Test that each stage is counted and every byte of the file is
+        read once
+        """
+        for decode in ['struct', 'vectorized']:
+            stats = ParseStats()
+            d = Dataset(self.filename)
+            d.parse(decode=decode, stats=stats)
+            d.trace_metadata['interpolated_easting']
+
+            counters = stats.as_dict()
+            self.assertEqual(
+                set(counters),
+                set(['header', 'records', 'intensity', 'filter', 'frequencies']))
+            self.assertEqual(
+                counters['records']['records'], len(d.trace_metadata['transducer']))
+            self.assertEqual(
+                sum(c['bytes_read'] for c in counters.values()),
+                os.path.getsize(self.filename))
+            self.assertEqual(
+                counters['intensity']['peak_array_bytes'],
+                d.intensity_image.nbytes)
+            self.assertGreater(counters['filter']['filter_passes'], 0)
+            self.assertAlmostEqual(
+                stats.seconds, sum(c['seconds'] for c in counters.values()))
+
+    def test_progress(self):
+        """ Test that progress is reported and that returning False from the
+        callback cancels parsing
+        """
+        calls = []
+
+        def progress(stage, done, total):
+            calls.append((stage, done, total))
+
+        Dataset(self.filename).parse(progress=progress)
+        self.assertIn(('records', os.path.getsize(self.filename),
+                       os.path.getsize(self.filename)), calls)
+        intensity = [call for call in calls if call[0] == 'intensity']
+        self.assertEqual(intensity[-1][1], intensity[-1][2])
+
+        d = Dataset(self.filename)
+        self.assertRaises(
+            ParseCancelled, d.parse,
+            progress=lambda stage, done, total: stage != 'intensity')
+        self.assertFalse(d.parsed)
+
+
+if __name__ == '__main__':
+    unittest.main()
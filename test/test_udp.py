@@ -0,0 +1,176 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+import numpy as np
+
+from sdi.binary import _bss_structs
+from sdi.udp import BssReceiver, PingBuffer, UDP_BUFFER_SIZE, \
+    decode_record, replay
+from sdi.writer import _encode_bss_records, write_bss
+
+
+def bss_records(num_pnts, first_trace_num=1):
+    """Returns the bytes of bss records holding the samples 0, 1, 2, ... of
+    each of the lengths in `num_pnts`, as a list of strings
+    """
+    samples = [np.arange(n) for n in num_pnts]
+    chunk = {
+        'trace_num': np.arange(len(samples)) + first_trace_num,
+        'transducer': np.ones(len(samples)),
+        'kHz': np.repeat(200., len(samples)),
+        'samples': samples,
+    }
+    records, n, last_size = _encode_bss_records(chunk, _bss_structs())
+    header_size = (len(records) - 2 * sum(num_pnts)) // n
+    ends = np.cumsum(header_size + 2 * np.array(num_pnts))
+    return [records[start:end].tostring()
+            for start, end in zip(np.append(0, ends[:-1]), ends)]
+
+
+def datagrams(record, size=UDP_BUFFER_SIZE):
+    """Split a record into datagrams the way the sounder sends it"""
+    return [record[i:i + size] for i in range(0, len(record), size)]
+
+
+class TestUdp(unittest.TestCase):
+    """ Test decoding bss records received over UDP
+    """
+
+    def test_decode_record(self):
+        """ Test that the fields and samples of a record are decoded """
+        record, = bss_records([3], first_trace_num=7)
+        record = record[:-6] + np.array(
+            [0, -32768, 32767], dtype='<i2').tostring()
+        ping = decode_record(record)
+        self.assertEqual(ping['trace_num'], 7)
+        self.assertEqual(ping['kHz'], 200.0)
+        np.testing.assert_array_equal(ping['samples'], [0, -32768, 32767])
+        np.testing.assert_allclose(
+            ping['intensity'], [32768 / 65535., 0, 1])
+        self.assertRaises(ValueError, decode_record, record[:-1])
+
+    def test_reassembly(self):
+        """ Test that records split across several datagrams are
+        reassembled, and that a record that lost a datagram is dropped
+        """
+        records = bss_records([32768, 10, 2000, 5000])
+        self.assertGreater(len(datagrams(records[0])), 40)
+
+        buf = PingBuffer()
+        receiver = BssReceiver(buf)
+        for record in records:
+            for datagram in datagrams(record):
+                receiver.datagram_received(datagram)
+        pings = buf.pop()
+        self.assertEqual([p['trace_num'] for p in pings], [1, 2, 3, 4])
+        for ping, n in zip(pings, [32768, 10, 2000, 5000]):
+            np.testing.assert_array_equal(ping['samples'], np.arange(n))
+        self.assertEqual(buf.malformed, 0)
+
+        lost = datagrams(records[2])
+        del lost[1]
+        for datagram in lost + datagrams(records[3]):
+            receiver.datagram_received(datagram)
+        self.assertEqual([p['trace_num'] for p in buf.pop()], [4])
+        self.assertEqual(buf.malformed, 1)
+
+        receiver.datagram_received('\xff' * 300)
+        receiver.datagram_received(records[1])
+        self.assertEqual([p['trace_num'] for p in buf.pop()], [2])
+        self.assertEqual(buf.malformed, 2)
+
+    def test_ping_buffer(self):
+        """ Test that a full buffer drops pings and counts them """
+        buf = PingBuffer(capacity=2)
+        for i in range(3):
+            buf.push({'trace_num': i})
+        self.assertEqual([p['trace_num'] for p in buf.pop()], [1, 2])
+        self.assertEqual((buf.received, buf.dropped), (3, 1))
+
+        buf = PingBuffer(capacity=2, overflow='drop_newest')
+        for i in range(3):
+            buf.push({'trace_num': i})
+        self.assertEqual([p['trace_num'] for p in buf.pop()], [0, 1])
+
+    def test_high_water(self):
+        """ Test that the consumer is signalled once each time the buffer
+        fills up to the high water mark
+        """
+        signals = []
+        buf = PingBuffer(capacity=10, high_water=0.5,
+                         on_high_water=lambda b: signals.append(len(b)))
+        for i in range(8):
+            buf.push({'trace_num': i})
+        self.assertEqual(signals, [5])
+        self.assertTrue(buf.above_high_water)
+
+        buf.pop(2)
+        buf.push({'trace_num': 8})
+        self.assertEqual(signals, [5])
+        buf.pop()
+        self.assertFalse(buf.above_high_water)
+        for i in range(5):
+            buf.push({'trace_num': i})
+        self.assertEqual(signals, [5, 5])
+
+    def test_wait(self):
+        """ Test that a consumer waiting on the buffer wakes up when a ping
+        is pushed
+        """
+        buf = PingBuffer()
+        self.assertFalse(buf.wait(0.01))
+        timer = threading.Timer(0.05, buf.push, [{'trace_num': 1}])
+        timer.start()
+        try:
+            self.assertTrue(buf.wait(5))
+        finally:
+            timer.join()
+        self.assertEqual(len(buf), 1)
+
+    def test_replay(self):
+        """ Test that the records replayed from a bss file are received """
+        num_pnts = [10, 32768, 12, 3000, 14]
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmp_dir, '09112303.bss')
+            write_bss(filename, {
+                'trace_num': np.arange(1, 6),
+                'transducer': np.ones(5),
+                'samples': [np.arange(n) for n in num_pnts],
+            })
+
+            buf = PingBuffer()
+            stop = threading.Event()
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind(('127.0.0.1', 0))
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 2 ** 20)
+            thread = threading.Thread(
+                target=BssReceiver(buf).serve, args=(sock, stop))
+            thread.start()
+            try:
+                sent = replay(filename, port=sock.getsockname()[1],
+                              interval=0.01)
+                deadline = time.time() + 5
+                while buf.received < sent and time.time() < deadline:
+                    time.sleep(0.01)
+            finally:
+                stop.set()
+                thread.join()
+                sock.close()
+        finally:
+            shutil.rmtree(tmp_dir)
+
+        pings = buf.pop()
+        self.assertEqual([p['trace_num'] for p in pings], [1, 2, 3, 4, 5])
+        for ping, n in zip(pings, num_pnts):
+            np.testing.assert_array_equal(ping['samples'], np.arange(n))
+        self.assertEqual(buf.malformed, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
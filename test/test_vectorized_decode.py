@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from sdi import writer
+from sdi.binary import Dataset, _bss_structs, _fixed_stride_bss_records, \
+    _map_file
+
+
+class TestVectorizedDecode(unittest.TestCase):
+    """ Test that the vectorized record decoder matches the struct decoder
+    """
+
+    def setUp(self):
+        self.test_dir = os.path.dirname(__file__)
+
+    def test_vectorized_matches_struct(self):
+        """ Test that both decode modes produce identical datasets """
+        for root, dirs, files in os.walk(os.path.join(self.test_dir, 'files')):
+            for filename in files:
+                if filename.endswith('.bin'):
+                    path = os.path.join(root, filename)
+                    expected = Dataset(path)
+                    expected.parse()
+                    d = Dataset(path)
+                    d.parse(decode='vectorized')
+
+                    self.assertEqual(
+                        sorted(d.trace_metadata.keys()),
+                        sorted(expected.trace_metadata.keys()))
+                    for key, array in expected.trace_metadata.iteritems():
+                        self.assertEqual(d.trace_metadata[key].dtype, array.dtype)
+                        np.testing.assert_array_equal(d.trace_metadata[key], array)
+                    np.testing.assert_array_equal(
+                        d.intensity_image, expected.intensity_image)
+
+    def test_bss_vectorized_matches_struct(self):
+        """ Test that both decode modes produce identical bss datasets, for a
+        file whose records all have the same size (where the record starts
+        are computed) and for one where they don't (where they are scanned)
+        """
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            for range_changes, fixed_stride in [(0, True), (2, False)]:
+                path = os.path.join(tmp_dir, '09112303.bss')
+                writer.write_bss(path, writer.synthetic_traces(
+                    300, file_format='bss', num_pnts=40,
+                    range_changes=range_changes))
+                data = _map_file(path)
+                starts = _fixed_stride_bss_records(
+                    data, len(data), _bss_structs())
+                self.assertEqual(starts is not None, fixed_stride)
+
+                expected = Dataset(path)
+                expected.parse(file_format='bss')
+                d = Dataset(path)
+                d.parse(file_format='bss', decode='vectorized')
+
+                self.assertEqual(
+                    sorted(d.trace_metadata.keys()),
+                    sorted(expected.trace_metadata.keys()))
+                for key, array in expected.trace_metadata.iteritems():
+                    self.assertEqual(d.trace_metadata[key].dtype, array.dtype)
+                    # assert_array_equal treats NaNs in the same place as equal
+                    np.testing.assert_array_equal(d.trace_metadata[key], array)
+                np.testing.assert_array_equal(
+                    d.intensity_image, expected.intensity_image)
+                self.assertEqual(
+                    np.isnan(d.intensity_image).any(), not fixed_stride)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_unknown_decode_mode(self):
+        """ Test that an unknown decode mode raises a ValueError """
+        filename = os.path.join(self.test_dir, 'files', '09112303.bin')
+        d = Dataset(filename)
+        self.assertRaises(ValueError, d.parse, decode='fortran')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from sdi.binary import Dataset
+from sdi.writer import synthetic_traces, write_bin, write_bss
+
+
+class TestWriter(unittest.TestCase):
+    """ Test writing bin and bss files
+    """
+
+    def setUp(self):
+        self.test_dir = os.path.dirname(__file__)
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_rewrite_bin(self):
+        """ Test that a bin file written from the records of another reads
+        back the same
+        """
+        expected = Dataset(os.path.join(self.test_dir, 'files', '09112303.bin'))
+        expected.parse()
+        traces = dict(expected.raw_trace)
+        traces['samples'] = expected.intensities
+
+        filename = os.path.join(self.tmp_dir, '09112303.bin')
+        write_bin(filename, traces, version=expected.version)
+        d = Dataset(filename)
+        d.parse()
+
+        self.assertEqual(d.version, expected.version)
+        for key, array in expected.trace_metadata.iteritems():
+            np.testing.assert_array_equal(d.trace_metadata[key], array)
+        np.testing.assert_array_equal(d.intensity_image, expected.intensity_image)
+
+    def test_synthetic_bin(self):
+        """ Test that synthetic traces written in blocks read back the same
+        for each bin version
+        """
+        for version in ['3.3', '4.0', '4.2', '4.3']:
+            chunks = list(synthetic_traces(
+                500, version=version, chunk_size=123, num_pnts=50))
+            filename = os.path.join(self.tmp_dir, '09112303.bin')
+            self.assertEqual(write_bin(filename, chunks, version=version), 500)
+
+            d = Dataset(filename)
+            d.parse()
+            for key in ['trace_num', 'transducer', 'depth_r1', 'latitude']:
+                np.testing.assert_allclose(
+                    d.raw_trace[key],
+                    np.concatenate([chunk[key] for chunk in chunks]))
+            self.assertEqual(
+                d.raw_trace['event'],
+                sum([chunk['event'] for chunk in chunks], []))
+            for samples, chunk_samples in zip(
+                    d.intensities, sum([list(c['samples']) for c in chunks], [])):
+                np.testing.assert_array_equal(samples, chunk_samples)
+
+    def test_synthetic_bss(self):
+        """ Test that synthetic bss traces read back the same """
+        chunks = list(synthetic_traces(
+            300, file_format='bss', chunk_size=100, num_pnts=40))
+        filename = os.path.join(self.tmp_dir, '09112303.bss')
+        write_bss(filename, chunks)
+
+        d = Dataset(filename)
+        d.parse(file_format='bss')
+        for key in ['trace_num', 'transducer', 'x', 'time_tag']:
+            np.testing.assert_allclose(
+                d.trace_metadata[key],
+                np.concatenate([chunk[key] for chunk in chunks]),
+                rtol=1e-6)
+        self.assertEqual(d.end_datetime, chunks[-1]['time_tag'][-1])
+        np.testing.assert_array_equal(
+            Dataset(filename).read_last(3)['trace_num'], [298, 299, 300])
+
+
+if __name__ == '__main__':
+    unittest.main()